@@ -1,12 +1,14 @@
-from collections import deque
+from array import array
 
 import numpy as np
 from algorithm.parameters import params
-from representation.tree import Tree
+from representation.tree import SharedTree
+from representation.tree_arena import ArenaTree, TreeArena
 from utilities.representation.python_filter import python_filter
+from utilities.stats import trackers
 
 
-def mapper(genome, tree):
+def mapper(genome, tree, checkpoints=None):
     """
     Wheel for mapping. Calls the correct mapper for a given _input. Checks
     the params dict to ensure the correct type of individual is being created.
@@ -17,6 +19,10 @@ def mapper(genome, tree):
 
     :param genome: Genome of an individual.
     :param tree: Tree of an individual.
+    :param checkpoints: An optional list of checkpoints of the state of the
+    genome mapper. Mapping resumes from the last valid checkpoint in the
+    list, and new checkpoints are appended to it. Only used by
+    algorithm.mapper.map_ind_from_genome.
     :return: All components necessary for a fully mapped individual.
     """
 
@@ -27,16 +33,42 @@ def mapper(genome, tree):
     if genome:
         # We have a genome and need to map an individual from that genome.
 
-        genome = list(genome)
+        genome = array('i', genome)
         # This is a fast way of creating a new unique copy of the genome
         # (prevents cross-contamination of information between individuals).
+        # Genomes are stored as arrays of C ints to save memory.
 
         if params['GENOME_OPERATIONS']:
             # Can generate tree information faster using
             # algorithm.mapper.map_ind_from_genome() if we don't need to
             # store the whole tree.
-            phenotype, genome, tree, nodes, invalid, depth, \
-            used_codons = map_ind_from_genome(genome)
+            cache = trackers.mapping_cache
+            mapping = cache.lookup(genome) if cache else None
+
+            if mapping:
+                # The genome makes the same production choices as a
+                # previously mapped genome, no need to map it again.
+                phenotype, nodes, depth, used_codons, cached = mapping
+                tree, invalid = None, False
+
+                if checkpoints is not None and cached:
+                    # Restore the checkpoints of the cached mapping.
+                    checkpoints[:] = cached
+
+            else:
+                # Record the number of choices for each used codon if the
+                # mapping is to be cached.
+                trace = [] if cache else None
+
+                phenotype, genome, tree, nodes, invalid, depth, \
+                used_codons = map_ind_from_genome(genome, checkpoints, trace)
+
+                if cache and not invalid and used_codons <= len(genome):
+                    # Cache valid mappings which did not need to wrap.
+                    cache.insert(genome, trace,
+                                 (phenotype, nodes, depth, used_codons,
+                                  tuple(checkpoints) if checkpoints else
+                                  None))
 
         else:
             # Build the tree using algorithm.mapper.map_tree_from_genome().
@@ -52,7 +84,8 @@ def mapper(genome, tree):
         genome, output, invalid, depth, \
         nodes = tree.get_tree_info(params['BNF_GRAMMAR'].non_terminals.keys(),
                                    [], [])
-        used_codons, phenotype = len(genome), "".join(output)
+        genome, phenotype = array('i', genome), "".join(output)
+        used_codons = len(genome)
 
     if params['BNF_GRAMMAR'].python_mode and not invalid:
         # Grammar contains python code
@@ -63,16 +96,46 @@ def mapper(genome, tree):
         # Set values for invalid individuals.
         phenotype, nodes, depth, used_codons = None, np.nan, np.nan, np.nan
 
+    if tree is not None and params['HASH_CONS_TREES']:
+        # Share all identical subtrees across the population.
+        tree = SharedTree.from_tree(tree)
+
     return phenotype, genome, tree, nodes, invalid, depth, used_codons
 
 
-def map_ind_from_genome(genome):
+def map_ind_from_genome(genome, checkpoints=None, trace=None):
     """
     A fast genotype to phenotype mapping process. Map input via rules to
     output. Does not require the recursive tree class, but still calculates
     tree information, e.g. number of nodes and maximum depth.
 
+    Mapping runs over the flat integer tables of the compiled grammar
+    (representation.compiled_grammar.CompiledGrammar) using a preallocated
+    stack of symbol ids and depths, rather than over the nested dicts of
+    the grammar class.
+
+    If a list of checkpoints is given, a checkpoint of the state of the
+    mapper is appended to it every params['MAPPING_CHECKPOINT_STEP']
+    codons. Each checkpoint is a tuple of:
+
+        (used codons, output since the previous checkpoint,
+         stack of symbol ids, stack of depths, max depth, nodes,
+         unexpanded non-terminals, trace since the previous checkpoint)
+
+    The state of the mapper after a given number of used codons depends
+    only on those codons, so long as the genome has not yet wrapped.
+    Mapping resumes from the last checkpoint in the given list, so a
+    genome which shares its first n codons with the genome that produced
+    the checkpoints only has to be mapped from the last checkpoint at or
+    before codon n.
+
     :param genome: A genome to be mapped.
+    :param checkpoints: A list of checkpoints from which to resume mapping,
+    and to which new checkpoints are appended. Checkpoints which are
+    beyond the end of the genome are discarded.
+    :param trace: An optional list to which the number of production
+    choices available to each used codon is appended. Used for keying the
+    mapping cache (utilities.representation.mapping_cache).
     :return: Output in the form of a phenotype string ('None' if invalid),
              Genome,
              None (this is reserved for the derivation tree),
@@ -84,22 +147,73 @@ def map_ind_from_genome(genome):
 
     # Create local variables to avoid multiple dictionary lookups
     max_tree_depth, max_wraps = params['MAX_TREE_DEPTH'], params['MAX_WRAPS']
-    bnf_grammar = params['BNF_GRAMMAR']
+    compiled = params['BNF_GRAMMAR'].compiled
+    symbols, is_NT = compiled.symbols, compiled.is_NT
+    no_choices, prod_offset = compiled.no_choices, compiled.prod_offset
+    prod_reversed, prod_arity = compiled.prod_reversed, compiled.prod_arity
+    prod_nodes = compiled.prod_nodes
 
     n_input = len(genome)
 
-    # Depth, max_depth, and nodes start from 1 to account for starting root
-    # Initialise number of wraps at -1 (since
-    used_input, current_depth, max_depth, nodes, wraps = 0, 1, 1, 1, -1
+    if checkpoints is None:
+        # Checkpoints are not recorded.
+        step = None
 
-    # Initialise output as empty deque list (deque is a list-like container
-    # with fast appends and pops on either end).
-    output = deque()
+    else:
+        step = params['MAPPING_CHECKPOINT_STEP']
+
+        while checkpoints and checkpoints[-1][0] > n_input:
+            # Discard checkpoints which are beyond the end of the genome.
+            checkpoints.pop()
+
+    # Initialise number of wraps at -1 (since the first wrap occurs on
+    # reaching the end of the genome the first time)
+    wraps = -1
+
+    if checkpoints:
+        # Resume mapping from the last checkpoint.
+        used_input, _, stack_syms, stack_depths, max_depth, nodes, \
+            unexpanded_NTs, _ = checkpoints[-1]
+
+        # Initialise output with the output of all previous checkpoints.
+        output = [checkpoint[1] for checkpoint in checkpoints]
+
+        if trace is not None:
+            # Initialise trace with the trace of all previous checkpoints.
+            for checkpoint in checkpoints:
+                trace.extend(checkpoint[7])
 
-    # Initialise the list of unexpanded non-terminals with the start rule.
-    unexpanded_symbols = deque([(bnf_grammar.start_rule, 1)])
+        # Copy the stack of unexpanded symbol ids and their depths. The top
+        # of the stack is at index top - 1.
+        top = len(stack_syms)
+        stack_syms, stack_depths = list(stack_syms), list(stack_depths)
 
-    while (wraps < max_wraps) and unexpanded_symbols:
+    else:
+        # Depth, max_depth, and nodes start from 1 to account for starting
+        # root
+        used_input, max_depth, nodes = 0, 1, 1
+
+        # Initialise output as empty list of terminal strings.
+        output = []
+
+        # Initialise the stack of unexpanded symbol ids and their depths
+        # with the start rule. The top of the stack is at index top - 1.
+        # The stack is preallocated and only grows if a derivation needs
+        # more room.
+        stack_syms = [0] * (n_input + 1)
+        stack_depths = [0] * (n_input + 1)
+        stack_syms[0], stack_depths[0], top = compiled.start, 1, 1
+
+        # Keep count of the non-terminals on the stack, so that we never
+        # need to search the stack for them.
+        unexpanded_NTs = 1
+
+    # Index in the output list and trace of the first output and trace
+    # since the last checkpoint.
+    checkpoint_output = len(output)
+    checkpoint_trace = len(trace) if trace is not None else 0
+
+    while (wraps < max_wraps) and top:
         # While there are unexpanded non-terminals, and we are below our
         # wrapping limit, we can continue to map the genome.
 
@@ -109,65 +223,70 @@ def map_ind_from_genome(genome):
 
         if used_input % n_input == 0 and \
                 used_input > 0 and \
-                any([i[0]["type"] == "NT" for i in unexpanded_symbols]):
+                unexpanded_NTs:
             # If we have reached the end of the genome and unexpanded
             # non-terminals remain, then we need to wrap back to the start
             # of the genome again. Can break the while loop.
             wraps += 1
 
-        # Expand a production from the list of unexpanded non-terminals.
-        current_item = unexpanded_symbols.popleft()
-        current_symbol, current_depth = current_item[0], current_item[1]
+        # Expand a symbol from the top of the stack.
+        top -= 1
+        current_symbol, current_depth = stack_syms[top], stack_depths[top]
 
         if max_depth < current_depth:
             # Set the new maximum depth.
             max_depth = current_depth
 
         # Set output if it is a terminal.
-        if current_symbol["type"] != "NT":
-            output.append(current_symbol["symbol"])
+        if not is_NT[current_symbol]:
+            output.append(symbols[current_symbol])
 
         else:
-            # Current item is a new non-terminal. Find associated production
-            # choices.
-            production_choices = bnf_grammar.rules[current_symbol[
-                "symbol"]]["choices"]
-            no_choices = bnf_grammar.rules[current_symbol["symbol"]][
-                "no_choices"]
-
             # Select a production based on the next available codon in the
             # genome.
-            current_production = genome[used_input % n_input] % no_choices
+            production = prod_offset[current_symbol] + \
+                genome[used_input % n_input] % no_choices[current_symbol]
+
+            if trace is not None:
+                # Record the number of choices available to this codon.
+                trace.append(no_choices[current_symbol])
 
             # Use an input
             used_input += 1
 
-            # Initialise children as empty deque list.
-            children = deque()
-            nt_count = 0
-
-            for prod in production_choices[current_production]['choice']:
-                # iterate over all elements of chosen production rule.
-
-                child = [prod, current_depth + 1]
-
-                # Extendleft reverses the order, thus reverse adding.
-                children.appendleft(child)
-                if child[0]["type"] == "NT":
-                    nt_count += 1
-
-            # Add the new children to the list of unexpanded symbols.
-            unexpanded_symbols.extendleft(children)
-
-            if nt_count > 0:
-                nodes += nt_count
-            else:
-                nodes += 1
+            # Push the children of the chosen production onto the stack,
+            # in reverse order so that the leftmost child is expanded next.
+            children = prod_reversed[production]
+            n_children = len(children)
+            stack_syms[top:top + n_children] = children
+            stack_depths[top:top + n_children] = \
+                [current_depth + 1] * n_children
+            top += n_children
+
+            unexpanded_NTs += prod_arity[production] - 1
+            nodes += prod_nodes[production]
+
+            if step and used_input % step == 0 and used_input <= n_input:
+                # Record a checkpoint. Join all output since the previous
+                # checkpoint into a single string.
+                output[checkpoint_output:] = \
+                    ["".join(output[checkpoint_output:])]
+                checkpoint_output = len(output)
+
+                checkpoints.append((used_input, output[-1],
+                                    tuple(stack_syms[:top]),
+                                    tuple(stack_depths[:top]), max_depth,
+                                    nodes, unexpanded_NTs,
+                                    tuple(trace[checkpoint_trace:]) if
+                                    trace is not None else ()))
+
+                if trace is not None:
+                    checkpoint_trace = len(trace)
 
     # Generate phenotype string.
     output = "".join(output)
 
-    if len(unexpanded_symbols) > 0:
+    if top > 0:
         # All non-terminals have not been completely expanded, invalid
         # solution.
         return None, genome, None, nodes, True, max_depth, used_input
@@ -175,6 +294,208 @@ def map_ind_from_genome(genome):
     return output, genome, None, nodes, False, max_depth, used_input
 
 
+def map_population(genomes, lengths):
+    """
+    Maps a whole population of genomes at once. All genomes are stepped
+    through the derivation in lockstep, one symbol per genome per step,
+    with every step performed as a handful of NumPy operations across the
+    entire population. Each genome keeps its own stack of unexpanded
+    symbols in a shared 2-D array. Gives exactly the same results as
+    algorithm.mapper.map_ind_from_genome for each genome.
+
+    :param genomes: A 2-D NumPy array of codons, with one genome per row.
+    Rows are padded to the length of the longest genome.
+    :param lengths: A 1-D array of the length of each genome.
+    :return: A list of phenotype strings (None if invalid),
+             A boolean array of invalid flags,
+             An array of the maximum depth of each derivation,
+             An array of the number of nodes in each derivation, and
+             An array of the number of used codons of each genome.
+    """
+
+    # Create local variables to avoid multiple dictionary lookups
+    max_tree_depth, max_wraps = params['MAX_TREE_DEPTH'], params['MAX_WRAPS']
+    compiled = params['BNF_GRAMMAR'].compiled
+    is_NT, no_choices = compiled.np_is_NT, compiled.np_no_choices
+    prod_offset, prod_length = compiled.np_prod_offset, \
+        compiled.np_prod_length
+    prod_arity, prod_nodes = compiled.np_prod_arity, compiled.np_prod_nodes
+    prod_reversed = compiled.np_prod_reversed
+
+    genomes = np.asarray(genomes)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n_genomes = len(lengths)
+
+    # Depth, max_depth, and nodes start from 1 to account for starting root
+    # Initialise number of wraps at -1.
+    used_input = np.zeros(n_genomes, dtype=np.int64)
+    max_depth = np.ones(n_genomes, dtype=np.int64)
+    nodes = np.ones(n_genomes, dtype=np.int64)
+    wraps = np.full(n_genomes, -1, dtype=np.int64)
+    unexpanded_NTs = np.ones(n_genomes, dtype=np.int64)
+
+    # Initialise the stacks of unexpanded symbol ids and their depths with
+    # the start rule. Stacks grow if a derivation needs more room.
+    capacity = max(int(lengths.max(initial=0)), 1) + 1
+    stack_syms = np.zeros((n_genomes, capacity), dtype=np.int64)
+    stack_depths = np.zeros((n_genomes, capacity), dtype=np.int64)
+    stack_syms[:, 0], stack_depths[:, 0] = compiled.start, 1
+    top = np.ones(n_genomes, dtype=np.int64)
+
+    # Initialise the output arrays of terminal ids for each genome.
+    output = np.zeros((n_genomes, capacity), dtype=np.int64)
+    output_length = np.zeros(n_genomes, dtype=np.int64)
+
+    # Genomes of length zero cannot be mapped.
+    running = lengths > 0
+
+    while True:
+        # Find all genomes which have unexpanded symbols and are below our
+        # wrapping limit.
+        running &= (wraps < max_wraps) & (top > 0)
+
+        if max_tree_depth:
+            # Stop mapping genomes which have breached our maximum tree
+            # depth limit.
+            running &= max_depth <= max_tree_depth
+
+        rows = np.flatnonzero(running)
+
+        if not rows.size:
+            # All genomes are fully mapped.
+            break
+
+        used, length = used_input[rows], lengths[rows]
+
+        # Wrap any genomes which have reached their end with unexpanded
+        # non-terminals remaining.
+        wraps[rows] += (used % length == 0) & (used > 0) & \
+            (unexpanded_NTs[rows] > 0)
+
+        # Pop a symbol from the top of each stack.
+        current_top = top[rows] - 1
+        top[rows] = current_top
+        symbol = stack_syms[rows, current_top]
+        depth = stack_depths[rows, current_top]
+
+        # Set the new maximum depths.
+        max_depth[rows] = np.maximum(max_depth[rows], depth)
+
+        NT_mask = is_NT[symbol]
+
+        if not NT_mask.all():
+            # Add all terminals to the output.
+            T_rows = rows[~NT_mask]
+
+            if output_length[T_rows].max() >= output.shape[1]:
+                # Double the size of the output arrays.
+                output = np.hstack([output, np.zeros_like(output)])
+
+            output[T_rows, output_length[T_rows]] = symbol[~NT_mask]
+            output_length[T_rows] += 1
+
+        if NT_mask.any():
+            # Expand all non-terminals.
+            NT_rows, symbol = rows[NT_mask], symbol[NT_mask]
+            used, length = used[NT_mask], length[NT_mask]
+            current_top, depth = current_top[NT_mask], depth[NT_mask] + 1
+
+            # Select a production for each genome based on the next
+            # available codon.
+            production = prod_offset[symbol] + \
+                genomes[NT_rows, used % length] % no_choices[symbol]
+
+            # Use an input
+            used_input[NT_rows] = used + 1
+
+            n_children = prod_length[production]
+            new_top = current_top + n_children
+
+            while new_top.max() >= stack_syms.shape[1]:
+                # Double the size of the stacks.
+                stack_syms = np.hstack([stack_syms,
+                                        np.zeros_like(stack_syms)])
+                stack_depths = np.hstack([stack_depths,
+                                          np.zeros_like(stack_depths)])
+
+            for i in range(prod_reversed.shape[1]):
+                # Push the i-th (reversed) child of each chosen production
+                # onto its stack.
+                child_mask = n_children > i
+
+                if not child_mask.any():
+                    break
+
+                child_rows = NT_rows[child_mask]
+                stack_syms[child_rows, current_top[child_mask] + i] = \
+                    prod_reversed[production[child_mask], i]
+                stack_depths[child_rows, current_top[child_mask] + i] = \
+                    depth[child_mask]
+
+            top[NT_rows] = new_top
+            unexpanded_NTs[NT_rows] += prod_arity[production] - 1
+            nodes[NT_rows] += prod_nodes[production]
+
+    # All non-terminals have not been completely expanded, invalid solution.
+    invalid = top > 0
+
+    # Generate phenotype strings.
+    symbols = compiled.symbols
+    phenotypes = [None if invalid[i] else
+                  "".join([symbols[s] for s in
+                           output[i, :output_length[i]].tolist()])
+                  for i in range(n_genomes)]
+
+    return phenotypes, invalid, max_depth, nodes, used_input
+
+
+def map_individuals(individuals):
+    """
+    Maps a list of individuals which were initialised without being mapped
+    (i.e. with map_ind=False), using algorithm.mapper.map_population to map
+    all of their genomes at once. Sets all of the mapped attributes of each
+    individual in place. Only suitable when params['GENOME_OPERATIONS'] is
+    set, since no derivation trees are built.
+
+    :param individuals: A list of individuals with genomes but no mapping.
+    :return: Nothing.
+    """
+
+    if not individuals:
+        return
+
+    # Build a padded matrix of all genomes.
+    lengths = np.array([len(ind.genome) for ind in individuals],
+                       dtype=np.int64)
+    genomes = np.zeros((len(individuals), max(lengths.max(), 1)),
+                       dtype=np.int64)
+
+    for i, ind in enumerate(individuals):
+        genomes[i, :lengths[i]] = ind.genome
+
+    phenotypes, invalid, depths, nodes, used_codons = \
+        map_population(genomes, lengths)
+
+    python_mode = params['BNF_GRAMMAR'].python_mode
+
+    for i, ind in enumerate(individuals):
+        ind.tree, ind.invalid = None, bool(invalid[i])
+
+        # Batch mapping does not record mapper checkpoints.
+        ind.checkpoints = None
+
+        if ind.invalid:
+            # Set values for invalid individuals.
+            ind.phenotype, ind.nodes, ind.depth, ind.used_codons = \
+                None, np.nan, np.nan, np.nan
+
+        else:
+            ind.phenotype = python_filter(phenotypes[i]) if python_mode \
+                else phenotypes[i]
+            ind.nodes, ind.depth = int(nodes[i]), int(depths[i])
+            ind.used_codons = int(used_codons[i])
+
+
 def map_tree_from_genome(genome):
     """
     Maps a full tree from a given genome.
@@ -183,12 +504,12 @@ def map_tree_from_genome(genome):
     :return: All components necessary for a fully mapped individual.
     """
 
-    # Initialise an instance of the tree class
-    tree = Tree(str(params['BNF_GRAMMAR'].start_rule["symbol"]), None)
-
     # Map tree from the given genome
-    output, used_codons, nodes, depth, max_depth, invalid = \
-        genome_tree_map(tree, genome, [], 0, 0, 0, 0)
+    arena, output, used_codons, nodes, max_depth, invalid = \
+        genome_tree_map(genome)
+
+    # Create a view of the root of the tree.
+    tree = ArenaTree(arena, 0, None)
 
     # Build phenotype.
     phenotype = "".join(output)
@@ -203,107 +524,90 @@ def map_tree_from_genome(genome):
                used_codons
 
 
-def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
-                    invalid=False):
+def genome_tree_map(genome):
     """
-    Recursive function which builds a tree using production choices from a
-    given genome. Not guaranteed to terminate.
+    Builds a tree using production choices from a given genome. Not
+    guaranteed to terminate.
+
+    The tree is derived depth-first using an explicit stack of arena
+    indexes, rather than by recursion, and is written into a flat
+    representation.tree_arena.TreeArena rather than one
+    representation.tree.Tree object per node.
 
-    :param tree: An instance of the representation.tree.Tree class.
     :param genome: A full genome.
-    :param output: The list of all terminal nodes in a subtree. This is
-    joined to become the phenotype.
-    :param index: The index of the current location on the genome.
-    :param depth: The current depth in the tree.
-    :param max_depth: The maximum overall depth in the tree so far.
-    :param nodes: The total number of nodes in the tree thus far.
-    :param invalid: A boolean flag indicating whether or not the individual
-    is invalid.
-    :return: index, the index of the current location on the genome,
-             nodes, the total number of nodes in the tree thus far,
-             depth, the current depth in the tree,
+    :return: arena, the representation.tree_arena.TreeArena of the tree,
+             output, the list of all terminals in the tree,
+             index, the number of used codons,
+             nodes, the total number of nodes in the tree,
              max_depth, the maximum overall depth in the tree,
              invalid, a boolean flag indicating whether or not the
              individual is invalid.
     """
 
-    if not invalid and index < len(genome) * (params['MAX_WRAPS'] + 1):
-        # If the solution is not invalid thus far, and if we still have
-        # remaining codons in the genome, then we can continue to map the tree.
-
-        if params['MAX_TREE_DEPTH'] and (max_depth > params['MAX_TREE_DEPTH']):
-            # We have breached our maximum tree depth limit.
-            invalid = True
-
-        # Increment and set number of nodes and current depth.
-        nodes += 1
-        depth += 1
-        tree.id, tree.depth = nodes, depth
-
-        # Find all production choices and the number of those production
-        # choices that can be made by the current root non-terminal.
-        productions = params['BNF_GRAMMAR'].rules[tree.root]['choices']
-        no_choices = params['BNF_GRAMMAR'].rules[tree.root]['no_choices']
-
-        # Set the current codon value from the genome.
-        tree.codon = genome[index % len(genome)]
+    # Create local variables to avoid multiple dictionary lookups
+    max_tree_depth = params['MAX_TREE_DEPTH']
+    compiled = params['BNF_GRAMMAR'].compiled
+    symbols, is_NT = compiled.symbols, compiled.is_NT
+    no_choices, prod_offset = compiled.no_choices, compiled.prod_offset
+    prod_arity = compiled.prod_arity
 
-        # Select the index of the correct production from the list.
-        selection = tree.codon % no_choices
+    # Initialise an arena with the start rule as its root.
+    arena = TreeArena(compiled.start)
+    depths = arena.depth
 
-        # Set the chosen production
-        chosen_prod = productions[selection]
+    n_input = len(genome)
+    max_index = n_input * (params['MAX_WRAPS'] + 1)
+    output, index, nodes, max_depth, invalid = [], 0, 0, 0, False
 
-        # Increment the index
-        index += 1
+    # Stack of arena indexes of nodes still to be visited. The top of the
+    # stack is the leftmost node.
+    stack = [0]
 
-        # Initialise an empty list of children.
-        tree.children = []
+    while stack:
+        node = stack.pop()
+        symbol = arena.symbol[node]
 
-        for symbol in chosen_prod['choice']:
-            # Add children to the derivation tree by creating a new instance
-            # of the representation.tree.Tree class for each child.
+        if not is_NT[symbol]:
+            # The node is a terminal.
+            output.append(symbols[symbol])
+            continue
 
-            if symbol["type"] == "T":
-                # Append the child to the parent node. Child is a terminal, do
-                # not recurse.
-                tree.children.append(Tree(symbol["symbol"], tree))
-                output.append(symbol["symbol"])
+        if index >= max_index:
+            # Mapping incomplete, solution is invalid.
+            invalid = True
+            break
 
-            elif symbol["type"] == "NT":
-                # Append the child to the parent node.
-                tree.children.append(Tree(symbol["symbol"], tree))
+        # Increment number of nodes and get the current depth.
+        nodes += 1
+        depth = depths[node]
 
-                # Recurse by calling the function again to map the next
-                # non-terminal from the genome.
-                output, index, nodes, d, max_depth, invalid = \
-                    genome_tree_map(tree.children[-1], genome, output,
-                                    index, depth, max_depth, nodes,
-                                    invalid=invalid)
+        # Select the correct production using the current codon.
+        codon = genome[index % n_input]
+        production = prod_offset[symbol] + codon % no_choices[symbol]
 
-    else:
-        # Mapping incomplete, solution is invalid.
-        return output, index, nodes, depth, max_depth, True
+        # Increment the index
+        index += 1
 
-    # Find all non-terminals in the chosen production choice.
-    NT_kids = [kid for kid in tree.children if kid.root in
-               params['BNF_GRAMMAR'].non_terminals]
+        # Add children to the derivation tree.
+        first = arena.expand(node, codon, production, depth)
 
-    if not NT_kids:
-        # There are no non-terminals in the chosen production choice, the
-        # branch terminates here.
-        depth += 1
-        nodes += 1
+        # Push children in reverse order so that the leftmost child is
+        # visited next.
+        stack.extend(range(len(arena.symbol) - 1, first - 1, -1))
 
-    if not invalid:
-        # The solution is valid thus far.
+        if not prod_arity[production]:
+            # There are no non-terminals in the chosen production choice,
+            # the branch terminates here.
+            nodes += 1
 
-        if depth > max_depth:
-            # Set the new maximum depth.
-            max_depth = depth
+            if depth + 1 > max_depth:
+                # Set the new maximum depth.
+                max_depth = depth + 1
 
-        if params['MAX_TREE_DEPTH'] and (max_depth > params['MAX_TREE_DEPTH']):
-            # If our maximum depth exceeds the limit, the solution is invalid.
-            invalid = True
+            if max_tree_depth and (max_depth > max_tree_depth):
+                # If our maximum depth exceeds the limit, the solution is
+                # invalid.
+                invalid = True
+                break
 
-    return output, index, nodes, depth, max_depth, invalid
+    return arena, output, index, nodes, max_depth, invalid
@@ -291,6 +291,100 @@ params = {
     'MULTIAGENT': False,
     'AGENT_SIZE': 100,
     'INTERACTION_PROBABILITY': 0.5,
+
+    # MAPPING
+    # Map whole generations of genomes at once with
+    # algorithm.mapper.map_population rather than one individual at a time.
+    # Only used with linear operators when no derivation trees are needed.
+    'BATCH_MAPPING': False,
+    # Record a checkpoint of the state of the genome mapper every n-th used
+    # codon. Children of linear mutation and crossover resume mapping from
+    # the last checkpoint before their first changed codon. Requires int
+    # value, or None to disable.
+    'MAPPING_CHECKPOINT_STEP': None,
+    # Cache up to n mappings of genomes, keyed on the production choices
+    # made by their used codons. Genomes which make the same choices as a
+    # cached genome are not mapped again. Requires int value, or None to
+    # disable.
+    'MAPPING_CACHE_SIZE': None,
+    # Store derivation trees as immutable, hash-consed trees
+    # (representation.tree.SharedTree), so that identical subtrees are
+    # shared across the whole population. Only used with subtree
+    # operators.
+    'HASH_CONS_TREES': False,
+    # Save fully analysed grammars to this directory, keyed by the contents
+    # of the grammar file and the parameters which affect the analysis.
+    # Later runs with the same grammar load the analysed grammar instead of
+    # parsing it again. Requires a directory path, or None to disable.
+    'GRAMMAR_CACHE_DIR': None,
+
+    # Target time in seconds taken by a worker of the multicore pool to
+    # evaluate one chunk of phenotypes.
+    'MULTICORE_CHUNK_TIME': 0.05,
+    # Store fitnesses in this SQLite database file, so that they are shared
+    # between runs with the same fitness function, datasets and error
+    # metric. Requires a file path, or None to disable. Cannot be used with
+    # RACING.
+    'FITNESS_CACHE_FILE': None,
+    # Approximate maximum number of bytes used by the fitness cache. Once
+    # exceeded, cached fitnesses are evicted according to CACHE_EVICTION.
+    # Requires int value, or None for an unbounded cache.
+    'CACHE_SIZE': None,
+    # Eviction policy of the fitness cache: "lru" (least recently used),
+    # "lfu" (least frequently used), or "least_fit" (worst fitness).
+    'CACHE_EVICTION': "lru",
+    # Evaluate phenotypes using remote workers (scripts/ponyge_worker.py),
+    # which connect to this "host:port" address. Requires string, or None to
+    # disable.
+    'COORDINATOR': None,
+    # Key with which remote workers must authenticate. Requires string, or
+    # None to generate a random key.
+    'COORDINATOR_AUTHKEY': None,
+    # Interval in seconds between heartbeats sent by remote workers.
+    'WORKER_HEARTBEAT': 5,
+    # Save the time taken by every fitness evaluation to
+    # evaluation_times.tsv.
+    'SAVE_EVALUATION_TIMES': False,
+    # Race phenotypes on growing random subsets of the training data in
+    # supervised learning problems, stopping the evaluation of phenotypes
+    # which cannot beat the RACING_QUANTILE quantile of the fitnesses of
+    # recently evaluated phenotypes.
+    'RACING': False,
+    # Quantile of recent fitnesses against which phenotypes are raced, e.g.
+    # 0.5 for the median, or smaller values for an elite.
+    'RACING_QUANTILE': 0.5,
+    # Number of rows in the first subset of the training data used for
+    # racing. Each subset is twice the size of the previous one.
+    'RACING_SAMPLE_SIZE': 100,
+    # Confidence level of the bound with which phenotypes are stopped, over
+    # all stages of a race.
+    'RACING_CONFIDENCE': 0.99,
+    # Compute training fitness on a stratified random mini-batch of this
+    # many rows of the training data in supervised learning problems.
+    # Requires int value, or None to use the full training data.
+    'MINI_BATCH_SIZE': None,
+    # Draw a new mini-batch every n generations.
+    'MINI_BATCH_ROTATION': 1,
+    # Cache the compiled code of up to n phenotypes, so that phenotypes
+    # evaluated more than once are only parsed and compiled once. Requires
+    # int value, or None to disable.
+    'CODE_CACHE_SIZE': 10000,
+    # Cache the outputs of the subexpressions of phenotypes in supervised
+    # learning problems, using up to n bytes for each of the training and
+    # test data, so that subexpressions shared by many phenotypes are only
+    # computed once. Requires int value, or None to disable.
+    'SEMANTIC_CACHE_SIZE': None,
+    # Run phenotypes in supervised learning problems on a stack machine
+    # which reuses preallocated buffers, rather than evaluating them with
+    # eval. Phenotypes which cannot be compiled for the stack machine are
+    # evaluated with eval.
+    'STACK_VM': False,
+    # Compute the error of phenotypes in supervised learning problems in
+    # blocks of n rows on the stack machine, so that the buffers of each
+    # block fit in cache (e.g. 4096 rows). Requires int value, or None to
+    # disable.
+    'EVALUATION_BLOCK_SIZE': None,
+
     'MACHINE': machine_name
 }
 
@@ -382,8 +476,14 @@ def set_params(command_line_args, create_files=True):
         individuals = load_state(params['LOAD_STATE'])
 
         # Set correct search loop.
-        from algorithm.search_loop import search_loop_from_state
-        params['SEARCH_LOOP'] = search_loop_from_state
+        from algorithm.search_loop import async_search_loop, \
+            async_search_loop_from_state, search_loop_from_state
+
+        if params['SEARCH_LOOP'] is async_search_loop:
+            params['SEARCH_LOOP'] = async_search_loop_from_state
+
+        else:
+            params['SEARCH_LOOP'] = search_loop_from_state
 
         # Set population.
         setattr(trackers, "state_individuals", individuals)
@@ -413,6 +513,12 @@ def set_params(command_line_args, create_files=True):
                 "Only one of these parameters can be used at a time."
             raise Exception(s)
 
+        if params['CODON_SIZE'] > 2 ** 31 - 1:
+            # Genomes are stored as arrays of C ints.
+            s = "algorithm.parameters.set_params\n" \
+                "Error: CODON_SIZE must fit in a 32-bit signed integer."
+            raise Exception(s)
+
         # Initialise run lists and folders before we set imports.r
         initialise_run_params(create_files)
 
@@ -452,15 +558,86 @@ def set_params(command_line_args, create_files=True):
                         "fitness functions."
                     raise Exception(s)
 
-        # Parse grammar file and set grammar class.
-        params['BNF_GRAMMAR'] = grammar.Grammar(
-            path.join("..", "grammars", params['GRAMMAR_FILE']))
+        if params['GRAMMAR_CACHE_DIR']:
+            # Load the analysed grammar from the grammar cache.
+            from utilities.representation.grammar_cache import load_grammar
+            params['BNF_GRAMMAR'] = load_grammar(
+                path.join("..", "grammars", params['GRAMMAR_FILE']))
+
+        else:
+            # Parse grammar file and set grammar class.
+            params['BNF_GRAMMAR'] = grammar.Grammar(
+                path.join("..", "grammars", params['GRAMMAR_FILE']))
 
         # If OPTIMIZE_CONSTANTS, check that the grammar is suitable
         if params['OPTIMIZE_CONSTANTS']:
             if "c[" not in params['BNF_GRAMMAR'].terminals:
                 raise ValueError("Grammar unsuitable for OPTIMIZE_CONSTANTS")
 
+        if params['MAPPING_CACHE_SIZE']:
+            # Initialise the mapping cache.
+            from utilities.representation.mapping_cache import MappingCache
+            trackers.mapping_cache = MappingCache(
+                params['MAPPING_CACHE_SIZE'])
+
+        # Initialise the fitness cache.
+        from utilities.fitness.fitness_cache import FitnessCache
+        trackers.cache = FitnessCache(params['CACHE_SIZE'],
+                                      params['CACHE_EVICTION'])
+
+        if params['CACHE_EVICTION'] == "least_fit" and \
+                hasattr(params['FITNESS_FUNCTION'], 'multi_objective'):
+            s = "algorithm.parameters.set_params\n" \
+                "Error: least_fit cache eviction cannot be used with " \
+                "multiple fitness functions."
+            raise Exception(s)
+
+        if params['MINI_BATCH_SIZE'] and (
+                params['MULTICORE'] or params['COORDINATOR'] or
+                params['FITNESS_CACHE_FILE'] or params['RACING'] or
+                not hasattr(params['FITNESS_FUNCTION'], "set_mini_batch")):
+            # The mini-batch is only rotated in this process, and fitnesses
+            # computed on different mini-batches cannot be shared.
+            s = "algorithm.parameters.set_params\n" \
+                "Error: mini-batches can only be used with supervised " \
+                "learning fitness functions, and cannot be used with " \
+                "multicore evaluation, remote workers, the persistent " \
+                "fitness cache, or racing."
+            raise Exception(s)
+
+        if params['FITNESS_CACHE_FILE'] and params['RACING']:
+            # Individuals stopped early by racing are given estimated
+            # fitnesses, which must not be reused by later runs.
+            s = "algorithm.parameters.set_params\n" \
+                "Error: the persistent fitness cache cannot be used with " \
+                "racing."
+            raise Exception(s)
+
+        if params['FITNESS_CACHE_FILE']:
+            # Open the persistent fitness cache.
+            from utilities.fitness.persistent_cache import PersistentCache, \
+                get_fingerprint
+            trackers.persistent_cache = PersistentCache(
+                params['FITNESS_CACHE_FILE'], get_fingerprint())
+
+        if params['COORDINATOR'] and create_files:
+            if params['MULTICORE'] or params['OPTIMIZE_CONSTANTS'] or \
+                    not getattr(params['FITNESS_FUNCTION'], "phenotype_only",
+                                False):
+                # Remote workers are only sent phenotypes.
+                s = "algorithm.parameters.set_params\n" \
+                    "Error: remote workers cannot be used with multicore " \
+                    "evaluation, constant optimisation, or fitness " \
+                    "functions which need more than the phenotypes of " \
+                    "individuals."
+                raise Exception(s)
+
+            # Start listening for remote workers.
+            from utilities.fitness.remote_evaluation import Coordinator
+            trackers.coordinator = Coordinator(params['COORDINATOR'],
+                                               params['COORDINATOR_AUTHKEY'],
+                                               command_line_args)
+
         # Population loading for seeding runs (if specified)
         if params['TARGET_SEED_FOLDER']:
 
@@ -1,10 +1,15 @@
 from multiprocessing import Pool
 
 from algorithm.parameters import params
-from fitness.evaluation import evaluate_fitness
+from fitness.evaluation import AsyncEvaluation, evaluate_fitness, \
+    rotate_mini_batch
+from operators.crossover import crossover_inds
 from operators.initialisation import initialisation
+from operators.mutation import mutation
+from operators.selection import selection
 from stats.stats import get_stats, stats
 from utilities.algorithm.initialise_run import pool_init
+from utilities.fitness.shared_data import release_shared_data
 from utilities.stats import trackers
 
 
@@ -35,6 +40,9 @@ def search_loop():
     for generation in range(1, (params['GENERATIONS'] + 1)):
         stats['gen'] = generation
 
+        # Draw a new mini-batch of the training data if needed.
+        rotate_mini_batch(individuals)
+
         # New generation
         individuals = params['STEP'](individuals)
 
@@ -42,6 +50,9 @@ def search_loop():
         # Close the workers pool (otherwise they'll live on forever).
         params['POOL'].close()
 
+        # Free datasets placed in shared memory for the workers.
+        release_shared_data()
+
     return individuals
 
 
@@ -65,6 +76,9 @@ def search_loop_from_state():
     for generation in range(stats['gen'] + 1, (params['GENERATIONS'] + 1)):
         stats['gen'] = generation
 
+        # Draw a new mini-batch of the training data if needed.
+        rotate_mini_batch(individuals)
+
         # New generation
         individuals = params['STEP'](individuals)
 
@@ -72,4 +86,180 @@ def search_loop_from_state():
         # Close the workers pool (otherwise they'll live on forever).
         params['POOL'].close()
 
+        # Free datasets placed in shared memory for the workers.
+        release_shared_data()
+
+    return individuals
+
+
+def async_search_loop():
+    """
+    An asynchronous steady-state search process. Rather than waiting for
+    a whole generation to be evaluated, a new child is bred and submitted
+    for evaluation as soon as an evaluation finishes, so that the workers of
+    the multicore pool are kept busy at all times (see async_steady_state).
+    Useful when the time taken per evaluation varies a lot.
+
+    To use, pass "--search_loop async_search_loop". The run is as long as
+    a generational run with the same parameters, i.e. POPULATION_SIZE *
+    GENERATIONS children are evaluated.
+
+    :return: The final population after the evolutionary process has run for
+    the specified number of evaluations.
+    """
+
+    if params['MULTICORE']:
+        # initialize pool once, if multi-core is enabled
+        params['POOL'] = Pool(processes=params['CORES'], initializer=pool_init,
+                              initargs=(params,))  # , maxtasksperchild=1)
+
+    # Initialise population
+    individuals = initialisation(params['POPULATION_SIZE'])
+
+    # Evaluate initial population
+    individuals = evaluate_fitness(individuals)
+
+    # Generate statistics for run so far
+    get_stats(individuals)
+
+    # Evaluate all children asynchronously.
+    individuals = async_steady_state(individuals, params['POPULATION_SIZE'] *
+                                     params['GENERATIONS'])
+
+    if params['MULTICORE']:
+        # Close the workers pool (otherwise they'll live on forever).
+        params['POOL'].close()
+
+        # Free datasets placed in shared memory for the workers.
+        release_shared_data()
+
+    return individuals
+
+
+def async_search_loop_from_state():
+    """
+    Run the asynchronous steady-state search process from a loaded state.
+    Pick up where it left off previously. Evaluations which were running
+    when the state was saved are lost.
+
+    :return: The final population after the evolutionary process has run for
+    the specified number of evaluations.
+    """
+
+    individuals = trackers.state_individuals
+
+    if params['MULTICORE']:
+        # initialize pool once, if multi-core is enabled
+        params['POOL'] = Pool(processes=params['CORES'], initializer=pool_init,
+                              initargs=(params,))  # , maxtasksperchild=1)
+
+    # Evaluate the remaining children asynchronously.
+    individuals = async_steady_state(individuals, params['POPULATION_SIZE'] *
+                                     (params['GENERATIONS'] - stats['gen']))
+
+    if params['MULTICORE']:
+        # Close the workers pool (otherwise they'll live on forever).
+        params['POOL'].close()
+
+        # Free datasets placed in shared memory for the workers.
+        release_shared_data()
+
+    return individuals
+
+
+def async_steady_state(individuals, evaluations):
+    """
+    Breeds and evaluates children one at a time, keeping up to
+    params['CORES'] evaluations running at once if multicore evaluation is
+    used, or enough evaluations to keep every connected remote worker busy
+    if params['COORDINATOR'] is specified. Each time an evaluation
+    finishes, the evaluated child immediately replaces the worst individual
+    in the population (Genitor replacement, as in
+    operators.replacement.steady_state), and a new child is bred from the
+    updated population and submitted for evaluation.
+
+    Since there are no generations, statistics are generated (and the state
+    of the run saved, see params['SAVE_STATE_STEP']) each time another
+    POPULATION_SIZE children have been added to the population, so that
+    stats['gen'] counts completed evaluations in units of POPULATION_SIZE.
+
+    :param individuals: The current population.
+    :param evaluations: The number of children to be evaluated.
+    :return: The final population.
+    """
+
+    if trackers.coordinator:
+        # Keep every remote worker busy. The number of workers may change
+        # during the run.
+        evaluator, workers = AsyncEvaluation(), None
+
+    elif params['MULTICORE']:
+        # Keep every worker busy.
+        evaluator, workers = AsyncEvaluation(params['POOL']), params['CORES']
+
+    else:
+        # Evaluate one child at a time.
+        evaluator, workers = AsyncEvaluation(), 1
+
+    # Children which have been bred but not submitted yet, and evaluated
+    # children which have not been added to the population yet.
+    children, evaluated = [], []
+
+    submitted, inserted = 0, 0
+
+    while inserted < evaluations:
+
+        if trackers.coordinator:
+            workers = trackers.coordinator.capacity
+
+        while submitted < evaluations and evaluator.running < workers and \
+                not evaluated:
+            # Submit children until all workers are busy, or until a child
+            # does not need to wait for the workers (e.g. cache hits).
+
+            while not children:
+                # Select parents from the current population.
+                parents = selection(individuals)
+
+                # Perform crossover on selected parents.
+                cross_pop = crossover_inds(parents[0], parents[1])
+
+                if cross_pop is not None:
+                    # Mutate the new children.
+                    children = mutation(cross_pop)
+
+            evaluated = evaluator.submit(children.pop(0))
+            submitted += 1
+
+        if not evaluated:
+            # Wait for an evaluation to finish.
+            evaluated = evaluator.wait()
+
+        for ind in evaluated:
+            # Replace the worst individual in the population.
+            individuals.sort(reverse=True)
+            individuals[-1] = ind
+
+            inserted += 1
+
+            if inserted % params['POPULATION_SIZE'] == 0:
+                # Generate statistics for run so far
+                stats['gen'] += 1
+                get_stats(individuals)
+
+                # Draw a new mini-batch of the training data if needed.
+                rotate_mini_batch(individuals)
+
+                if trackers.persistent_cache:
+                    # Write the fitnesses of newly evaluated children to the
+                    # persistent fitness cache.
+                    trackers.persistent_cache.commit()
+
+        evaluated = []
+
+    if trackers.persistent_cache:
+        # Write the fitnesses of all newly evaluated children to the
+        # persistent fitness cache.
+        trackers.persistent_cache.commit()
+
     return individuals
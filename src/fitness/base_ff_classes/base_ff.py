@@ -1,7 +1,13 @@
 import numpy as np
+from utilities.fitness.code_cache import compile_phenotype
 
 np.seterr(all="raise")
 
+# Runtime errors which give a valid individual the default fitness rather
+# than stopping the run.
+RUNTIME_ERRORS = (FloatingPointError, ZeroDivisionError, OverflowError,
+                  MemoryError)
+
 
 class base_ff:
     """
@@ -17,6 +23,28 @@ class base_ff:
     # Default fitness objective is to minimise fitness.
     maximise = False
 
+    # Optional hook for evaluating many individuals at once. Fitness
+    # functions which can share work across individuals may define
+    # evaluate_batch(individuals, **kwargs), returning the fitnesses of all
+    # given individuals in order. It is then used by
+    # fitness.evaluation.evaluate_fitness instead of evaluating each
+    # individual separately.
+    evaluate_batch = None
+
+    # The time taken to evaluate each individual by the last call of
+    # evaluate_batch, in seconds. Fitness functions whose evaluate_batch
+    # times each individual set this list, so that the time taken by each
+    # evaluation is recorded rather than the average time taken per
+    # individual of the batch (see fitness.evaluation.get_batch_fitnesses).
+    batch_times = None
+
+    # Whether the fitness function only needs the phenotype of an individual.
+    # If so, only phenotypes are sent to the workers of the multicore pool
+    # rather than whole individuals. Fitness functions which use any other
+    # attributes of individuals (e.g. derivation trees) must set this to
+    # False.
+    phenotype_only = True
+
     def __init__(self):
         pass
 
@@ -34,8 +62,7 @@ class base_ff:
             # class.
             fitness = self.evaluate(ind, **kwargs)
 
-        except (FloatingPointError, ZeroDivisionError, OverflowError,
-                MemoryError):
+        except RUNTIME_ERRORS:
             # FP err can happen through eg overflow (lots of pow/exp calls)
             # ZeroDiv can happen when using unprotected operators
             fitness = base_ff.default_fitness
@@ -65,6 +92,6 @@ class base_ff:
         """
 
         # Evaluate the fitness of the phenotype
-        fitness = eval(ind.phenotype)
+        fitness = eval(compile_phenotype(ind.phenotype))
 
         return fitness
@@ -1,4 +1,5 @@
 from math import isnan
+from time import perf_counter
 
 import numpy as np
 
@@ -30,6 +31,11 @@ class moo_ff:
         for i, ff in enumerate(self.fitness_functions):
             self.fitness_functions[i] = ff()
 
+        # Only phenotypes are needed if all fitness functions only need
+        # phenotypes.
+        self.phenotype_only = all([getattr(ff, "phenotype_only", False) for
+                                   ff in self.fitness_functions])
+
         # Set up list of default fitness values (as per individual fitness
         # functions).
         self.default_fitness = []
@@ -58,6 +64,68 @@ class moo_ff:
 
         return fitness
 
+    def evaluate_batch(self, individuals, **kwargs):
+        """
+        Evaluates many individuals at once on all fitness functions. Fitness
+        functions which define an evaluate_batch method evaluate all
+        individuals together, others evaluate them one at a time.
+
+        The total time taken to evaluate each individual on all fitness
+        functions is saved to self.batch_times (see
+        fitness.base_ff_classes.base_ff), as long as every fitness function
+        with an evaluate_batch method saves its own batch_times.
+
+        :param individuals: A list of individuals to be evaluated.
+        :param kwargs: Optional extra arguments.
+        :return: A list of the fitnesses of the individuals.
+        """
+
+        # The fitnesses of all individuals on each objective, and the time
+        # taken to evaluate each individual on all objectives.
+        objectives, times = [], [0.0] * len(individuals)
+
+        for ff in self.fitness_functions:
+            if ff.evaluate_batch is not None:
+                ff.batch_times = None
+                objectives.append(ff.evaluate_batch(individuals, **kwargs))
+                ff_times = ff.batch_times
+
+            else:
+                fitnesses, ff_times = [], []
+
+                for ind in individuals:
+                    start = perf_counter()
+                    fitnesses.append(ff(ind, **kwargs))
+                    ff_times.append(perf_counter() - start)
+
+                objectives.append(fitnesses)
+
+            if times is None or ff_times is None or \
+                    len(ff_times) != len(individuals):
+                # The time taken by each evaluation is not known.
+                times = None
+
+            else:
+                times = [time + ff_time for time, ff_time in
+                         zip(times, ff_times)]
+
+        self.batch_times = times
+
+        fitnesses = []
+
+        for fitness in zip(*objectives):
+            fitness = [i.item() if isinstance(i, np.generic) else i for i in
+                       fitness]
+
+            if any([isnan(i) for i in fitness]):
+                # Check if any objective fitness value is NaN, if so set
+                # default fitness.
+                fitness = self.default_fitness
+
+            fitnesses.append(fitness)
+
+        return fitnesses
+
     @staticmethod
     def value(fitness_vector, objective_index):
         """
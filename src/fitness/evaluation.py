@@ -1,16 +1,21 @@
+from math import ceil
+from queue import Queue
+from time import perf_counter
+
 import numpy as np
 
 from algorithm.parameters import params
 from stats.stats import stats
-from utilities.stats.trackers import cache, runtime_error_cache
+from utilities.stats import trackers
 
 
-def evaluate_fitness(individuals):
+def evaluate_fitness(individuals, use_cache=True):
     """
     Evaluate an entire population of individuals. Invalid individuals are given
     a default bad fitness. If params['CACHE'] is specified then individuals
-    have their fitness stored in a dictionary called utilities.trackers.cache.
-    Dictionary keys are the string of the phenotype.
+    have their fitness stored in a fitness cache called utilities.trackers.cache
+    (see utilities.fitness.fitness_cache). Cache keys are digests of the
+    string of the phenotype.
     There are currently three options for use with the cache:
         1. If params['LOOKUP_FITNESS'] is specified (default case if
            params['CACHE'] is specified), individuals which have already been
@@ -23,7 +28,34 @@ def evaluate_fitness(individuals):
            individuals which have not been encountered yet by the search
            process.
 
+    If params['CACHE'] is specified and the fitness function only depends
+    on the phenotypes of individuals (i.e. its phenotype_only attribute is
+    True), individuals are grouped by phenotype before being evaluated,
+    so that each distinct phenotype in the population is evaluated only
+    once. The result is then copied to all individuals with the same
+    phenotype, which are treated as if they had been evaluated after the
+    first such individual. Otherwise, each individual is evaluated.
+
+    If the fitness function defines an evaluate_batch method (see
+    fitness.base_ff_classes.base_ff), all distinct phenotypes which need to be
+    evaluated are evaluated together in a single call, unless multicore
+    evaluation is used.
+
+    If multicore evaluation is used and the fitness function only needs the
+    phenotypes of individuals, only the phenotypes are sent to the pool of
+    workers, in chunks (see evaluate_chunks).
+
+    If params['COORDINATOR'] is specified, phenotypes are evaluated by remote
+    workers instead (see evaluate_remote).
+
+    The time taken by each evaluation is recorded (see record_time). When
+    individuals are evaluated by a pool of workers, the time spent waiting
+    for a worker is recorded separately.
+
     :param individuals: A population of individuals to be evaluated.
+    :param use_cache: Whether the cache options above are applied. If False,
+    all valid individuals are evaluated, e.g. when individuals which have
+    been evaluated before are re-scored on new data (see rescore).
     :return: A population of fully evaluated individuals.
     """
 
@@ -32,68 +64,247 @@ def evaluate_fitness(individuals):
     if params['MULTICORE']:
         pool = params['POOL']
 
+    # Check whether individuals are to be evaluated in a single batch.
+    use_batch = getattr(params['FITNESS_FUNCTION'], "evaluate_batch",
+                        None) is not None and not params['MULTICORE']
+
+    # Check whether only the phenotypes of individuals are to be sent to the
+    # pool of workers. Constant optimisation stores the optimised constants
+    # in each individual, so whole individuals must be sent.
+    use_chunks = params['MULTICORE'] and \
+        getattr(params['FITNESS_FUNCTION'], "phenotype_only", False) and \
+        not params['OPTIMIZE_CONSTANTS']
+
+    # Check whether individuals with the same phenotype are to be evaluated
+    # only once.
+    merge_duplicates = get_merge_duplicates()
+
+    # Individuals to be evaluated, the individual to be evaluated for each
+    # distinct phenotype, and duplicates of these individuals.
+    batch, pending, duplicates = [], {}, []
+
     for name, ind in enumerate(individuals):
         ind.name = name
 
-        # Iterate over all individuals in the population.
-        if ind.invalid:
-            # Invalid individuals cannot be evaluated and are given a bad
-            # default fitness.
-            ind.fitness = params['FITNESS_FUNCTION'].default_fitness
-            stats['invalids'] += 1
+        # Check whether the individual needs to be evaluated.
+        ind, action = check_individual(ind, pending, merge_duplicates,
+                                       use_cache)
 
-        else:
-            eval_ind = True
-
-            # Valid individuals can be evaluated.
-            if params['CACHE'] and ind.phenotype in cache:
-                # The individual has been encountered before in
-                # the utilities.trackers.cache.
-
-                if params['LOOKUP_FITNESS']:
-                    # Set the fitness as the previous fitness from the
-                    # cache.
-                    ind.fitness = cache[ind.phenotype]
-                    eval_ind = False
-
-                elif params['LOOKUP_BAD_FITNESS']:
-                    # Give the individual a bad default fitness.
-                    ind.fitness = params['FITNESS_FUNCTION'].default_fitness
-                    eval_ind = False
-
-                elif params['MUTATE_DUPLICATES']:
-                    # Mutate the individual to produce a new phenotype
-                    # which has not been encountered yet.
-                    while (not ind.phenotype) or ind.phenotype in cache:
-                        ind = params['MUTATION'](ind)
-                        stats['regens'] += 1
-
-                    # Need to overwrite the current individual in the pop.
-                    individuals[name] = ind
-                    ind.name = name
-
-            if eval_ind:
-                results = eval_or_append(ind, results, pool)
+        # Need to overwrite the current individual in the pop, in case it
+        # has been mutated.
+        individuals[name] = ind
+        ind.name = name
+
+        if action == "evaluate":
+            # Add the individual to the list of individuals to be
+            # evaluated.
+            batch.append(ind)
+            pending[ind.phenotype] = ind
+
+        elif action == "duplicate":
+            # The individual is a duplicate of an individual which has not
+            # been evaluated yet.
+            duplicates.append(ind)
+
+    # Time at which individuals start being evaluated, from which the time
+    # spent waiting in the pool of workers is measured.
+    start = perf_counter()
+
+    if batch and trackers.coordinator:
+        # Evaluate all individuals using the remote workers.
+        evaluate_remote(batch)
+
+    elif batch and use_chunks:
+        # Evaluate all individuals using the pool of workers.
+        evaluate_chunks(batch, pool)
+
+    elif batch and use_batch:
+        # Evaluate all individuals at once.
+        evaluate_batch(batch)
+
+    else:
+        for ind in batch:
+            # Evaluate each individual, or add it to the pool of jobs.
+            results = eval_or_append(ind, results, pool)
 
     if params['MULTICORE']:
         for result in results:
             # Execute all jobs in the pool.
-            ind = result.get()
+            ind, eval_time = result.get()
+
+            # Record the time taken by the evaluation, and the time spent
+            # waiting for it.
+            record_time(ind.phenotype, eval_time,
+                        perf_counter() - start - eval_time)
 
             # Set the fitness of the evaluated individual by placing the
             # evaluated individual back into the population.
             individuals[ind.name] = ind
+            pending[ind.phenotype] = ind
 
             # Add the evaluated individual to the cache.
-            cache[ind.phenotype] = ind.fitness
+            trackers.cache[ind.phenotype] = ind.fitness
 
             # Check if individual had a runtime error.
             if ind.runtime_error:
-                runtime_error_cache.append(ind.phenotype)
+                trackers.runtime_errors += 1
+
+            if trackers.persistent_cache and valid_fitness(ind.fitness):
+                # Add the evaluated individual to the persistent fitness
+                # cache.
+                trackers.persistent_cache.insert(ind.phenotype, ind.fitness)
+
+    for ind in duplicates:
+        # Treat duplicates as if they had been evaluated after the first
+        # individual with the same phenotype.
+        copy_fitness(ind, pending[ind.phenotype])
+
+    if trackers.persistent_cache:
+        # Write the fitnesses of all newly evaluated individuals to the
+        # persistent fitness cache.
+        trackers.persistent_cache.commit()
 
     return individuals
 
 
+def get_merge_duplicates():
+    """
+    Checks whether individuals with the same phenotype as an individual
+    which is being evaluated are to wait for its fitness rather than be
+    evaluated again. This requires the fitness cache, and a fitness function
+    which only depends on the phenotypes of individuals (so that individuals
+    with the same phenotype always have the same fitness). Duplicates are
+    not merged if they are to be mutated, i.e. if params['MUTATE_DUPLICATES']
+    is the cache option in use.
+
+    :return: True if duplicates are to be merged.
+    """
+
+    mutate_duplicates = params['MUTATE_DUPLICATES'] and \
+        not (params['LOOKUP_FITNESS'] or params['LOOKUP_BAD_FITNESS'])
+
+    return bool(params['CACHE']) and not mutate_duplicates and \
+        getattr(params['FITNESS_FUNCTION'], "phenotype_only", False)
+
+
+def check_individual(ind, pending, merge_duplicates, use_cache=True):
+    """
+    Checks whether an individual needs to be evaluated. Invalid individuals
+    are given a default bad fitness, and the cache options described in
+    evaluate_fitness are applied to valid individuals.
+
+    :param ind: An individual.
+    :param pending: A dict of the individuals which are to be evaluated (or
+    are being evaluated), keyed by phenotype.
+    :param merge_duplicates: Whether individuals with the same phenotype as
+    a pending individual are to wait for its fitness (see
+    get_merge_duplicates).
+    :param use_cache: Whether the cache options described in
+    evaluate_fitness are applied.
+    :return: The individual (a new individual if it has been mutated), and
+    "evaluate" if it is to be evaluated, "duplicate" if it has the same
+    phenotype as a pending individual, or "done" if it has been given a
+    fitness.
+    """
+
+    if ind.invalid:
+        # Invalid individuals cannot be evaluated and are given a bad
+        # default fitness.
+        ind.fitness = params['FITNESS_FUNCTION'].default_fitness
+        stats['invalids'] += 1
+        return ind, "done"
+
+    elif ind.phenotype in pending and merge_duplicates:
+        # The individual is a duplicate of an individual which has not
+        # been evaluated yet.
+        return ind, "duplicate"
+
+    if params['CACHE'] and use_cache and params['LOOKUP_FITNESS']:
+        # Look up the fitness of the individual in the cache. Fitnesses are
+        # only looked up when they would be used, so that cache hits are
+        # counted correctly.
+        fitness = trackers.cache.lookup(ind.phenotype)
+
+    # Valid individuals can be evaluated.
+    if params['CACHE'] and use_cache and (ind.phenotype in trackers.cache or
+                                          ind.phenotype in pending):
+        # The individual has been encountered before in
+        # the utilities.trackers.cache, or earlier in this
+        # population.
+
+        if params['LOOKUP_FITNESS']:
+            # Set the fitness as the previous fitness from the
+            # cache. If the fitness has been evicted from the cache,
+            # the individual is evaluated again.
+            if fitness is not None:
+                ind.fitness = fitness
+                return ind, "done"
+
+        elif params['LOOKUP_BAD_FITNESS']:
+            # Give the individual a bad default fitness.
+            ind.fitness = params['FITNESS_FUNCTION'].default_fitness
+            return ind, "done"
+
+        elif params['MUTATE_DUPLICATES']:
+            # Mutate the individual to produce a new phenotype
+            # which has not been encountered yet.
+            while (not ind.phenotype) or \
+                    ind.phenotype in trackers.cache or \
+                    ind.phenotype in pending:
+                ind = params['MUTATION'](ind)
+                stats['regens'] += 1
+
+    if trackers.persistent_cache:
+        # Look up the fitness in the persistent fitness cache, which
+        # holds fitnesses found by previous runs.
+        fitness = trackers.persistent_cache.lookup(ind.phenotype)
+
+        if fitness is not None:
+            ind.fitness = fitness
+
+            if params['CACHE']:
+                # The phenotype has now been encountered in this run.
+                trackers.cache[ind.phenotype] = fitness
+
+            return ind, "done"
+
+    return ind, "evaluate"
+
+
+def copy_fitness(ind, first):
+    """
+    Sets the fitness of a duplicate individual, as if it had been evaluated
+    after the first individual with the same phenotype.
+
+    :param ind: A duplicate individual.
+    :param first: The evaluated individual with the same phenotype.
+    :return: Nothing.
+    """
+
+    if params['CACHE'] and params['LOOKUP_FITNESS']:
+        # Look up the fitness of the individual in the cache.
+        fitness = trackers.cache.lookup(ind.phenotype)
+
+    if params['CACHE'] and ind.phenotype in trackers.cache and \
+            params['LOOKUP_FITNESS'] and fitness is not None:
+        # Set the fitness as the previous fitness from the cache.
+        ind.fitness = fitness
+
+    elif params['CACHE'] and ind.phenotype in trackers.cache and \
+            params['LOOKUP_BAD_FITNESS']:
+        # Give the individual a bad default fitness.
+        ind.fitness = params['FITNESS_FUNCTION'].default_fitness
+
+    else:
+        # The fitness was not cached, so the individual would have
+        # been evaluated again with the same result.
+        ind.fitness = first.fitness
+        ind.runtime_error = first.runtime_error
+
+        if ind.runtime_error:
+            trackers.runtime_errors += 1
+
+
 def eval_or_append(ind, results, pool):
     """
     Evaluates an individual if sequential evaluation is being used. If
@@ -110,25 +321,546 @@ def eval_or_append(ind, results, pool):
 
     if params['MULTICORE']:
         # Add the individual to the pool of jobs.
-        results.append(pool.apply_async(ind.evaluate, ()))
+        results.append(pool.apply_async(evaluate_individual, (ind,)))
         return results
 
     else:
         # Evaluate the individual.
+        start = perf_counter()
         ind.evaluate()
+        record_time(ind.phenotype, perf_counter() - start)
 
-        # Check if individual had a runtime error.
-        if ind.runtime_error:
-            runtime_error_cache.append(ind.phenotype)
+        # Record the result of the evaluation.
+        record_evaluation(ind)
+
+
+def evaluate_individual(ind):
+    """
+    Evaluates an individual. This function is run by the workers of the
+    multicore pool.
+
+    :param ind: An individual to be evaluated.
+    :return: The evaluated individual, and the time taken to evaluate it.
+    """
+
+    start = perf_counter()
+
+    ind.evaluate()
+
+    return ind, perf_counter() - start
+
+
+def evaluate_batch(individuals):
+    """
+    Evaluates a list of individuals at once, using the evaluate_batch method
+    of the fitness function.
+
+    :param individuals: A list of valid individuals to be evaluated.
+    :return: Nothing.
+    """
+
+    fitnesses, times, averaged = get_batch_fitnesses(individuals)
+
+    for ind, fitness, eval_time in zip(individuals, fitnesses, times):
+        # Set the fitness of each individual.
+        ind.fitness = fitness
+
+        # Record the result of the evaluation.
+        record_time(ind.phenotype, eval_time, averaged=averaged)
+        record_evaluation(ind)
+
+
+def get_batch_fitnesses(individuals):
+    """
+    Returns the fitnesses of a list of individuals, as computed by the
+    evaluate_batch method of the fitness function, and the time taken by
+    each evaluation. The time taken by each evaluation is only known if the
+    fitness function saves it to its batch_times attribute (see
+    fitness.base_ff_classes.base_ff). Otherwise, only the time taken by the
+    whole batch is known, and each evaluation is given the average time.
+
+    :param individuals: A list of valid individuals to be evaluated.
+    :return: A list of the fitnesses of the individuals, a list of the times
+    taken by their evaluations, and whether these times are averages.
+    """
+
+    fitness_function = params['FITNESS_FUNCTION']
+    fitness_function.batch_times = None
+
+    start = perf_counter()
+
+    fitnesses = fitness_function.evaluate_batch(individuals)
+
+    elapsed = perf_counter() - start
+
+    if isinstance(fitnesses, np.ndarray):
+        # Use plain Python numbers, as returned by the fitness function when
+        # evaluating individuals one at a time.
+        fitnesses = fitnesses.tolist()
+
+    times = fitness_function.batch_times
+
+    if times is not None and len(times) == len(individuals):
+        return fitnesses, times, False
+
+    # The time taken by a batch of one individual is exact.
+    return fitnesses, [elapsed / len(individuals)] * len(individuals), \
+        len(individuals) > 1
+
+
+def evaluate_chunks(individuals, pool):
+    """
+    Evaluates a list of individuals using a pool of workers. Rather than
+    pickling whole individuals (genomes and derivation trees included),
+    only (index, phenotype) tuples are sent to the workers, in chunks.
+    Workers return (index, fitness, runtime error, time taken, averaged)
+    tuples (see evaluate_chunk).
+
+    The size of each chunk is chosen from the measured time taken per
+    evaluation, so that each chunk takes roughly
+    params['MULTICORE_CHUNK_TIME'] seconds to evaluate.
+
+    :param individuals: A list of valid individuals to be evaluated.
+    :param pool: A pool of workers for multicore evaluation.
+    :return: Nothing.
+    """
+
+    jobs = [(i, ind.phenotype) for i, ind in enumerate(individuals)]
+
+    chunk_size = get_chunk_size(len(jobs))
+
+    chunks = [jobs[i:i + chunk_size] for i in
+              range(0, len(jobs), chunk_size)]
+
+    total_time, start = 0, perf_counter()
+
+    # Chunks are returned in order, so that evaluations are recorded in the
+    # same order as with sequential evaluation.
+    for results, chunk_time in pool.imap(evaluate_chunk, chunks):
+        total_time += chunk_time
+
+        # All evaluations in a chunk spent the same time waiting for a
+        # worker (or for earlier chunks to be returned).
+        wait_time = perf_counter() - start - chunk_time
+
+        for i, fitness, runtime_error, eval_time, averaged in results:
+            # Set the fitness of each individual.
+            ind = individuals[i]
+            ind.fitness, ind.runtime_error = fitness, runtime_error
+
+            # Record the result of the evaluation.
+            record_time(ind.phenotype, eval_time, wait_time, averaged)
+            record_evaluation(ind)
+
+    # Update the average time taken per evaluation.
+    eval_time = total_time / len(jobs)
+
+    if trackers.evaluation_time is None:
+        trackers.evaluation_time = eval_time
+
+    else:
+        trackers.evaluation_time = (trackers.evaluation_time + eval_time) / 2
+
+
+def evaluate_remote(individuals):
+    """
+    Evaluates a list of individuals using the remote workers connected to
+    utilities.trackers.coordinator (see
+    utilities.fitness.remote_evaluation.Coordinator). Only the phenotypes
+    of the individuals are sent to the workers.
+
+    :param individuals: A list of valid individuals to be evaluated.
+    :return: Nothing.
+    """
+
+    results = trackers.coordinator.evaluate([ind.phenotype for ind in
+                                             individuals])
+
+    for ind, result in zip(individuals, results):
+        fitness, runtime_error, eval_time, wait_time, averaged = result
+
+        # Set the fitness of each individual.
+        ind.fitness, ind.runtime_error = fitness, runtime_error
+
+        # Record the result of the evaluation.
+        record_time(ind.phenotype, eval_time, wait_time, averaged)
+        record_evaluation(ind)
+
+
+def get_chunk_size(no_jobs):
+    """
+    Returns the number of evaluations to be sent to a worker at once. Chunks
+    should be large enough that the cost of communicating with the workers
+    is small compared to the cost of evaluation, but there should be enough
+    chunks that all workers are kept busy.
+
+    :param no_jobs: The number of individuals to be evaluated.
+    :return: The number of individuals in each chunk.
+    """
+
+    # Give each worker at least a few chunks, so that work is balanced
+    # between workers if some evaluations take longer than others.
+    max_size = max(1, ceil(no_jobs / (params['CORES'] * 4)))
+
+    if trackers.evaluation_time is None:
+        # The time taken per evaluation has not been measured yet.
+        return max_size
+
+    # The number of evaluations which take the target time per chunk.
+    size = int(params['MULTICORE_CHUNK_TIME'] /
+               max(trackers.evaluation_time, 1e-9))
+
+    return min(max(size, 1), max_size)
+
+
+def evaluate_chunk(chunk):
+    """
+    Evaluates a chunk of phenotypes. This function is run by the workers of
+    the multicore pool.
+
+    :param chunk: A list of (index, phenotype) tuples.
+    :return: A list of (index, fitness, runtime error, time taken, averaged)
+    tuples, where averaged is whether the time taken is the average time
+    taken per evaluation of a batch (see get_batch_fitnesses), and the time
+    taken to evaluate the chunk.
+    """
+
+    start = perf_counter()
+
+    individuals = [PhenotypeIndividual(phenotype) for _, phenotype in chunk]
+
+    if getattr(params['FITNESS_FUNCTION'], "evaluate_batch", None) is not \
+            None:
+        # Evaluate all individuals in the chunk at once.
+        fitnesses, times, averaged = get_batch_fitnesses(individuals)
+
+    else:
+        fitnesses, times, averaged = [], [], False
+
+        for ind in individuals:
+            # Evaluate each individual, timing each evaluation.
+            eval_start = perf_counter()
+            fitnesses.append(params['FITNESS_FUNCTION'](ind))
+            times.append(perf_counter() - eval_start)
+
+    results = [(i, fitness, ind.runtime_error, eval_time, averaged) for
+               (i, _), ind, fitness, eval_time in
+               zip(chunk, individuals, fitnesses, times)]
+
+    return results, perf_counter() - start
+
+
+class PhenotypeIndividual:
+    """
+    A minimal stand-in for an individual, holding only its phenotype. Used to
+    evaluate phenotypes sent to the workers of the multicore pool with
+    fitness functions which only need the phenotypes of individuals.
+    """
+
+    def __init__(self, phenotype):
+        """
+        :param phenotype: The phenotype of an individual.
+        """
+
+        self.phenotype = phenotype
+        self.invalid = False
+        self.runtime_error = False
+
+
+class AsyncEvaluation:
+    """
+    Evaluates individuals one at a time without waiting for other
+    evaluations to finish, so that the workers of the multicore pool can be
+    kept busy when the time taken per evaluation varies. Used by
+    algorithm.search_loop.async_search_loop.
+
+    Individuals are checked as in evaluate_fitness before being submitted
+    to the pool of workers. If duplicates are merged (see
+    get_merge_duplicates), individuals with the same phenotype as an
+    individual which is being evaluated wait for that evaluation to finish.
+    If params['COORDINATOR'] is specified, individuals are submitted to the
+    remote workers instead (see utilities.fitness.remote_evaluation.
+    Coordinator.submit). If neither multicore nor remote evaluation is used,
+    individuals are evaluated as soon as they are submitted.
+    """
+
+    def __init__(self, pool=None):
+        """
+        :param pool: A pool of workers for multicore evaluation, or None for
+        sequential evaluation.
+        """
+
+        self.pool = pool
+
+        # Check whether only the phenotypes of individuals are to be sent to
+        # the pool of workers (see evaluate_fitness).
+        self.use_chunks = getattr(params['FITNESS_FUNCTION'],
+                                  "phenotype_only", False) and \
+            not params['OPTIMIZE_CONSTANTS']
+
+        # Check whether individuals with the same phenotype are to be
+        # evaluated only once.
+        self.merge_duplicates = get_merge_duplicates()
+
+        # Dict of the evaluations which have not finished yet, keyed by job
+        # number. Each evaluation is an (individual, result, duplicates,
+        # time submitted) tuple, where duplicates is a list of individuals
+        # waiting for the evaluation.
+        self.jobs, self.next_job = {}, 0
+
+        # Dict of the job number of the latest evaluation of each phenotype
+        # which has not finished yet, keyed by phenotype.
+        self.pending = {}
+
+        # Queue of the job numbers of finished evaluations. Filled by the
+        # result handler thread of the pool of workers.
+        self.finished = Queue()
+
+    @property
+    def running(self):
+        """
+        :return: The number of evaluations which have not finished yet.
+        """
+
+        return len(self.jobs)
+
+    def submit(self, ind):
+        """
+        Submits an individual to be evaluated.
+
+        :param ind: An individual to be evaluated.
+        :return: A list of individuals which have been fully evaluated, i.e.
+        the individual if it was evaluated without the pool of workers.
+        """
+
+        # Check whether the individual needs to be evaluated.
+        ind, action = check_individual(ind, self.pending,
+                                       self.merge_duplicates)
+
+        if action == "duplicate":
+            # Wait for the evaluation of the same phenotype to finish.
+            self.jobs[self.pending[ind.phenotype]][2].append(ind)
+            return []
+
+        elif action == "done":
+            return [ind]
+
+        elif self.pool is None and not trackers.coordinator:
+            # Evaluate the individual.
+            start = perf_counter()
+            ind.evaluate()
+            record_time(ind.phenotype, perf_counter() - start)
+
+            # Record the result of the evaluation.
+            record_evaluation(ind)
+
+            return [ind]
+
+        job, self.next_job = self.next_job, self.next_job + 1
+
+        if trackers.coordinator:
+            # Submit the phenotype to the remote workers.
+            result = trackers.coordinator.submit(
+                ind.phenotype, lambda: self.finished.put(job))
+
+        else:
+            if self.use_chunks:
+                # Only send the phenotype to the pool of workers.
+                func, args = evaluate_chunk, ([(0, ind.phenotype)],)
+
+            else:
+                func, args = evaluate_individual, (ind,)
+
+            result = self.pool.apply_async(
+                func, args,
+                callback=lambda _: self.finished.put(job),
+                error_callback=lambda _: self.finished.put(job))
+
+        self.jobs[job] = (ind, result, [], perf_counter())
+        self.pending[ind.phenotype] = job
+
+        return []
+
+    def wait(self):
+        """
+        Waits for an evaluation to finish. Must only be called while there
+        are evaluations running.
+
+        :return: A list of individuals which have been fully evaluated, i.e.
+        the evaluated individual and its duplicates.
+        """
+
+        job = self.finished.get()
+        ind, result, duplicates, submitted = self.jobs.pop(job)
+        phenotype = ind.phenotype
+
+        if self.pending.get(phenotype) == job:
+            del self.pending[phenotype]
+
+        # Errors raised by the fitness function are raised again here.
+        result = result.get()
+
+        if trackers.coordinator:
+            # Set the fitness of the individual.
+            ind.fitness, ind.runtime_error, eval_time, wait_time, _ = result
+
+        elif self.use_chunks:
+            # Set the fitness of the individual.
+            [(_, ind.fitness, ind.runtime_error, eval_time, _)], _ = result
+            wait_time = perf_counter() - submitted - eval_time
+
+        else:
+            # The evaluated individual is returned by the pool of workers.
+            ind, eval_time = result
+            wait_time = perf_counter() - submitted - eval_time
+
+        # Record the result of the evaluation.
+        record_time(phenotype, eval_time, wait_time)
+        record_evaluation(ind)
+
+        for dup in duplicates:
+            # Treat duplicates as if they had been evaluated after the
+            # individual with the same phenotype.
+            copy_fitness(dup, ind)
+
+        return [ind] + duplicates
+
+
+def rotate_mini_batch(individuals):
+    """
+    Draws a new mini-batch of the training data every
+    params['MINI_BATCH_ROTATION'] generations when params['MINI_BATCH_SIZE']
+    is specified (see fitness.supervised_learning.supervised_learning.
+    set_mini_batch). The elites of the population and the best individual
+    found so far are then re-scored on the new mini-batch, so that they can
+    be compared with new individuals. Other individuals keep their
+    fitnesses on the previous mini-batch until they are replaced.
+
+    :param individuals: The current population.
+    :return: Nothing.
+    """
+
+    if not params['MINI_BATCH_SIZE']:
+        return
+
+    number = stats['gen'] // params['MINI_BATCH_ROTATION']
+
+    if number != params['FITNESS_FUNCTION'].mini_batch:
+        # Rotate the mini-batch.
+        params['FITNESS_FUNCTION'].set_mini_batch(number)
+        rescore(individuals, params['ELITE_SIZE'])
+
+
+def rescore(individuals, elites=None):
+    """
+    Evaluates individuals of a population and the best individual found so
+    far again, once the data on which fitness is computed have changed.
+    Cached fitnesses are discarded, as they were computed on the old data.
+    Individuals are evaluated together by evaluate_fitness, and invalid
+    individuals keep their default fitness.
+
+    :param individuals: A population of individuals. Re-scored individuals
+    are replaced in the population.
+    :param elites: The number of the best individuals of the population to
+    be re-scored, or None to re-score the whole population.
+    :return: Nothing.
+    """
+
+    trackers.cache.clear()
+
+    # The indexes of the individuals of the population to be re-scored.
+    indexes = list(range(len(individuals)))
+
+    if elites is not None:
+        # Only re-score the elites, which are compared with new individuals
+        # (see operators.replacement.generational).
+        indexes = sorted(indexes, key=lambda i: individuals[i],
+                         reverse=True)[:elites]
+
+    indexes = [i for i in indexes if not individuals[i].invalid]
+    rescored = [individuals[i] for i in indexes]
+
+    # The position of the best individual found so far in the list of
+    # re-scored individuals, if it is to be re-scored.
+    best = None
+
+    if trackers.best_ever is not None and not trackers.best_ever.invalid:
+        positions = [i for i, ind in enumerate(rescored) if
+                     ind is trackers.best_ever]
+
+        if not positions:
+            # The best individual is not in the re-scored population.
+            rescored.append(trackers.best_ever)
+            positions = [len(rescored) - 1]
+
+        best = positions[0]
+
+    rescored = evaluate_fitness(rescored, use_cache=False)
+
+    for i, ind in zip(indexes, rescored):
+        # Individuals evaluated by a pool of workers are copies.
+        individuals[i] = ind
+
+    if best is not None:
+        trackers.best_ever = rescored[best]
+
+
+def record_time(phenotype, eval_time, wait_time=0.0, averaged=False):
+    """
+    Records the time taken by an evaluation in
+    utilities.trackers.evaluation_times, from which statistics are
+    generated (see stats.stats.get_evaluation_stats).
+
+    :param phenotype: The phenotype of the evaluated individual.
+    :param eval_time: The time taken to evaluate the phenotype, in seconds.
+    :param wait_time: The time spent waiting for a worker to evaluate the
+    phenotype, in seconds.
+    :param averaged: Whether eval_time is the average time taken per
+    evaluation of a batch, rather than the time taken by this evaluation.
+    :return: Nothing.
+    """
+
+    trackers.evaluation_times.append((phenotype, eval_time, wait_time,
+                                      averaged))
+
+
+def record_evaluation(ind):
+    """
+    Records the runtime error of an evaluated individual, and adds its
+    fitness to the cache and to the persistent fitness cache if the fitness is
+    valid.
+
+    :param ind: An evaluated individual.
+    :return: Nothing.
+    """
+
+    # Check if individual had a runtime error.
+    if ind.runtime_error:
+        trackers.runtime_errors += 1
+
+    if (params['CACHE'] or trackers.persistent_cache) and \
+            valid_fitness(ind.fitness):
+        # The phenotype string of the individual does not appear
+        # in the cache, it must be evaluated and added to the
+        # cache.
 
         if params['CACHE']:
-            # The phenotype string of the individual does not appear
-            # in the cache, it must be evaluated and added to the
-            # cache.
-
-            if (isinstance(ind.fitness, list) and not
-            any([np.isnan(i) for i in ind.fitness])) or \
-                    (not isinstance(ind.fitness, list) and not
-                    np.isnan(ind.fitness)):
-                # All fitnesses are valid.
-                cache[ind.phenotype] = ind.fitness
+            trackers.cache[ind.phenotype] = ind.fitness
+
+        if trackers.persistent_cache:
+            trackers.persistent_cache.insert(ind.phenotype, ind.fitness)
+
+
+def valid_fitness(fitness):
+    """
+    Checks whether a fitness is valid, i.e. whether it (or every fitness of
+    a multi-objective fitness) is not NaN.
+
+    :param fitness: The fitness of an evaluated individual.
+    :return: True if the fitness is valid.
+    """
+
+    if isinstance(fitness, list):
+        return not any([np.isnan(i) for i in fitness])
+
+    return not np.isnan(fitness)
@@ -7,6 +7,9 @@ class minimise_nodes(base_ff):
     derivation tree.
     """
 
+    # The number of nodes is needed, not just the phenotype.
+    phenotype_only = False
+
     def __init__(self):
         # Initialise base fitness function class.
         super().__init__()
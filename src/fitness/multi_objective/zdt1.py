@@ -1,4 +1,7 @@
 from math import sqrt
+from time import perf_counter
+
+import numpy as np
 
 from fitness.base_ff_classes.base_ff import base_ff
 from utilities.fitness.math_functions import binary_phen_to_float
@@ -33,3 +36,62 @@ class zdt1(base_ff):
         h = 1 - sqrt(real_chromosome[0] / g)
 
         return g * h
+
+    def evaluate_batch(self, individuals, **kwargs):
+        """
+        Evaluates many individuals at once. The chromosomes of all
+        individuals are stacked into a single array, giving exactly the same
+        fitnesses as evaluate.
+
+        The time taken by each evaluation is saved to self.batch_times (see
+        fitness.base_ff_classes.base_ff). Each individual is timed for the
+        decoding of its chromosome plus an equal share of the rest of the
+        batch.
+
+        :param individuals: A list of individuals to be evaluated.
+        :param kwargs: Optional extra arguments.
+        :return: An array of the fitnesses of the individuals.
+        """
+
+        batch_start = perf_counter()
+
+        min_value = [0] * 30
+        max_value = [1] * 30
+
+        chromosomes, times = [], []
+
+        for ind in individuals:
+            start = perf_counter()
+            chromosomes.append(binary_phen_to_float(ind.phenotype, 30,
+                                                    min_value, max_value))
+            times.append(perf_counter() - start)
+
+        if len(set([len(chromosome) for chromosome in chromosomes])) > 1:
+            # Chromosomes of different lengths cannot be stacked.
+            fitnesses = []
+
+            for i, ind in enumerate(individuals):
+                start = perf_counter()
+                fitnesses.append(self(ind, **kwargs))
+                times[i] = perf_counter() - start
+
+            self.batch_times = times
+
+            return np.array(fitnesses)
+
+        real_chromosomes = np.array(chromosomes)
+
+        summation = 0
+        for i in range(1, real_chromosomes.shape[1]):
+            summation += real_chromosomes[:, i]
+
+        g = 1 + 9 * summation / (real_chromosomes.shape[1] - 1.0)
+        h = 1 - np.sqrt(real_chromosomes[:, 0] / g)
+
+        # Share the time not spent decoding chromosomes between individuals.
+        share = (perf_counter() - batch_start - sum(times)) / \
+            len(individuals)
+
+        self.batch_times = [time + share for time in times]
+
+        return g * h
@@ -1,3 +1,7 @@
+from time import perf_counter
+
+import numpy as np
+
 from algorithm.parameters import params
 from fitness.base_ff_classes.base_ff import base_ff
 
@@ -15,6 +19,10 @@ class string_match(base_ff):
         # Set target string.
         self.target = params['TARGET']
 
+        # ASCII values of the target string, for batch evaluation.
+        self.target_ords = np.array([ord(t_p) for t_p in self.target],
+                                    dtype=float)
+
     def evaluate(self, ind, **kwargs):
         guess = ind.phenotype
         fitness = max(len(self.target), len(guess))
@@ -27,3 +35,53 @@ class string_match(base_ff):
                 # Imperfect match, find ASCII distance to match.
                 fitness -= 1 / (1 + (abs(ord(t_p) - ord(g_p))))
         return fitness
+
+    def evaluate_batch(self, individuals, **kwargs):
+        """
+        Evaluates many individuals at once. The ASCII values of all guesses
+        are stacked into a single array and compared with the target in one
+        pass per character position, giving exactly the same fitnesses as
+        evaluate.
+
+        The time taken by each evaluation is saved to self.batch_times (see
+        fitness.base_ff_classes.base_ff). Each individual is timed for the
+        conversion of its guess plus an equal share of the rest of the batch.
+
+        :param individuals: A list of individuals to be evaluated.
+        :param kwargs: Optional extra arguments.
+        :return: An array of the fitnesses of the individuals.
+        """
+
+        batch_start = perf_counter()
+
+        n_target = len(self.target)
+
+        # The lengths of all guesses, and the ASCII values of as many
+        # characters of each guess as there are in the target.
+        lengths = np.array([len(ind.phenotype) for ind in individuals])
+        guesses = np.zeros((len(individuals), n_target))
+        times = [0.0] * len(individuals)
+
+        for i, ind in enumerate(individuals):
+            start = perf_counter()
+            guess = ind.phenotype[:n_target]
+            guesses[i, :len(guess)] = [ord(g_p) for g_p in guess]
+            times[i] = perf_counter() - start
+
+        # The match of each character, 1 for a perfect match.
+        matches = 1 / (1 + np.abs(guesses - self.target_ords))
+
+        fitness = np.maximum(lengths, n_target).astype(float)
+
+        for i in range(n_target):
+            # Subtract the match of each character in turn, as long as the
+            # shorter of the two strings.
+            fitness -= np.where(lengths > i, matches[:, i], 0)
+
+        # Share the time not spent converting guesses between individuals.
+        share = (perf_counter() - batch_start - sum(times)) / \
+            len(individuals)
+
+        self.batch_times = [time + share for time in times]
+
+        return fitness
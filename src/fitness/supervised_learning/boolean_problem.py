@@ -59,6 +59,9 @@ class boolean_problem(supervised_learning):
         # In Boolean problems we don't want a separate test set
         assert not params['DATASET_TEST']
 
+        # Prepare the training data as supervised_learning would.
+        self.prepare_data()
+
 
 # Some target functions. Each just accepts a single instance, eg
 # nparity([False, False, True]) -> True
@@ -36,6 +36,10 @@ class deep_learning(base_ff):
     # in the base fitness function class.
     maximise = False
 
+    # Individuals are re-mapped from their derivation trees, so whole
+    # individuals are needed, not just their phenotypes.
+    phenotype_only = False
+
     def __init__(self):
         """
         All fitness functions which inherit from the bass fitness function
@@ -1,13 +1,28 @@
+from collections import deque
+from math import ceil, log2, sqrt
+from statistics import NormalDist
+from time import perf_counter
+
 import numpy as np
 
 np.seterr(all="raise")
 
 from algorithm.parameters import params
+from utilities.fitness.code_cache import compile_phenotype
 from utilities.fitness.get_data import get_data
 from utilities.fitness.math_functions import *
 from utilities.fitness.optimize_constants import optimize_constants
+from utilities.fitness.semantic_cache import clear_semantic_cache, \
+    semantic_eval
+from utilities.fitness.shared_data import attach_array, share_arrays
+from utilities.fitness.stack_vm import compile_program, run_program, \
+    run_program_error
 
-from fitness.base_ff_classes.base_ff import base_ff
+from fitness.base_ff_classes.base_ff import RUNTIME_ERRORS, base_ff
+
+shape_mismatch_txt = """Shape mismatch between y and yhat. Please check
+that your grammar uses the `x[:, 0]` style, not `x[0]`. Please see change
+at https://github.com/PonyGE/PonyGE2/issues/130."""
 
 
 class supervised_learning(base_ff):
@@ -26,6 +41,10 @@ class supervised_learning(base_ff):
     should not be instantiated.
     """
 
+    # The number of stacked predictions for which the error metric is
+    # computed at once by evaluate_batch.
+    batch_size = 64
+
     def __init__(self):
         # Initialise base fitness function class.
         super().__init__()
@@ -41,6 +60,83 @@ class supervised_learning(base_ff):
         if params['DATASET_TEST']:
             self.training_test = True
 
+        self.prepare_data()
+
+    def prepare_data(self):
+        """
+        Prepares the datasets for racing, mini-batches and multicore
+        evaluation. Must be called once the datasets have been loaded,
+        including by subclasses which load their datasets themselves.
+
+        :return: Nothing.
+        """
+
+        if params['RACING']:
+            # Racing evaluates phenotypes on growing subsets of the training
+            # data (see race). The training data are shuffled once, so that
+            # each subset is a random sample of rows and a slice (rather
+            # than a copy) of the shuffled data. A separate generator is
+            # used so that the random numbers of the search are unchanged.
+            order = np.random.default_rng(params['RANDOM_SEED']).permutation(
+                len(self.training_exp))
+            self.racing_in = self.training_in[order]
+            self.racing_exp = self.training_exp[order]
+
+            # The fitnesses of the most recent evaluations on the full
+            # training data, against which new phenotypes are raced.
+            self.racing_fitnesses = deque(maxlen=params['POPULATION_SIZE'])
+
+        # The number of the mini-batch of the training data on which
+        # training fitness is computed, and its inputs and expected outputs
+        # (see set_mini_batch). None to use the full training data.
+        self.mini_batch, self.batch_in, self.batch_exp = None, None, None
+
+        if params['MINI_BATCH_SIZE']:
+            # Compute training fitness on the first mini-batch.
+            self.set_mini_batch(0)
+
+        # Descriptors of datasets placed in shared memory, keyed by
+        # attribute name.
+        self.shared_data = {}
+
+        if params['MULTICORE']:
+            # Place datasets in shared memory, so that the workers of the
+            # multicore pool view them rather than each holding a copy.
+            self.shared_data = share_arrays(self, ["training_in",
+                                                   "training_exp", "test_in",
+                                                   "test_exp", "racing_in",
+                                                   "racing_exp"])
+
+    def __getstate__(self):
+        """
+        Datasets in shared memory are not pickled (e.g. when the fitness
+        function is sent to workers of the multicore pool started by
+        spawning new processes). Only their descriptors are pickled.
+
+        :return: A picklable state for the fitness function.
+        """
+
+        state = self.__dict__.copy()
+
+        for attr in getattr(self, "shared_data", {}):
+            state[attr] = None
+
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore the fitness function from a pickled state, attaching to
+        datasets in shared memory without copying them.
+
+        :param state: A pickled state for the fitness function.
+        :return: Nothing.
+        """
+
+        self.__dict__.update(state)
+
+        for attr, descriptor in state.get("shared_data", {}).items():
+            setattr(self, attr, attach_array(descriptor))
+
     def evaluate(self, ind, **kwargs):
         """
         Note that math functions used in the solutions are imported from either
@@ -55,22 +151,7 @@ class supervised_learning(base_ff):
 
         dist = kwargs.get('dist', 'training')
 
-        if dist == "training":
-            # Set training datasets.
-            x = self.training_in
-            y = self.training_exp
-
-        elif dist == "test":
-            # Set test datasets.
-            x = self.test_in
-            y = self.test_exp
-
-        else:
-            raise ValueError("Unknown dist: " + dist)
-
-        shape_mismatch_txt = """Shape mismatch between y and yhat. Please check
-that your grammar uses the `x[:, 0]` style, not `x[0]`. Please see change
-at https://github.com/PonyGE/PonyGE2/issues/130."""
+        x, y = self.get_dist(dist)
 
         if params['OPTIMIZE_CONSTANTS']:
             # if we are training, then optimize the constants by
@@ -87,7 +168,7 @@ at https://github.com/PonyGE/PonyGE2/issues/130."""
                 phen = ind.phenotype_consec_consts
                 c = ind.opt_consts
                 # phen will refer to x (ie test_in), and possibly to c
-                yhat = eval(phen)
+                yhat = eval(compile_phenotype(phen))
                 assert np.isrealobj(yhat)
                 # check whether yhat is a constant or an array (see below).
                 if np.ndim(yhat) != 0: 
@@ -98,9 +179,20 @@ at https://github.com/PonyGE/PonyGE2/issues/130."""
                 # true values first, the estimate second
                 return params['ERROR_METRIC'](y, yhat)
 
+        elif params['RACING'] and dist == "training":
+            # Race the phenotype on subsets of the training data.
+            return self.race(ind)
+
         else:
+            if params['EVALUATION_BLOCK_SIZE']:
+                # Compute the error block by block if possible.
+                error = self.evaluate_blocks(ind.phenotype, x, y)
+
+                if error is not None:
+                    return error
+
             # phenotype won't refer to C
-            yhat = eval(ind.phenotype)
+            yhat = self.predict(ind.phenotype, x, dist)
             assert np.isrealobj(yhat)
             # Phenotypes that don't refer to x are constants, ie will
             # return a single value (not an array). That will work
@@ -116,3 +208,346 @@ at https://github.com/PonyGE/PonyGE2/issues/130."""
             # let's always call the error function with the true
             # values first, the estimate second
             return params['ERROR_METRIC'](y, yhat)
+
+    def evaluate_batch(self, individuals, **kwargs):
+        """
+        Evaluates many individuals at once. The predictions of all
+        individuals are stacked into a single array, and the error metric
+        is computed for all of them in a single pass if it has a batch
+        version (see utilities.fitness.error_metric). Otherwise, or when
+        constants are optimised, phenotypes are raced, or errors are computed
+        block by block, individuals are evaluated one at a time.
+
+        The time taken by each evaluation is saved to self.batch_times (see
+        fitness.base_ff_classes.base_ff). When errors are computed in a
+        single pass, each individual is timed for its prediction plus an
+        equal share of the pass.
+
+        :param individuals: A list of individuals to be evaluated.
+        :param kwargs: An optional parameter for problems with training/test
+        data. Specifies the distribution (i.e. training or test) upon which
+        evaluation is to be performed.
+        :return: A list of the fitnesses of the individuals.
+        """
+
+        if params['OPTIMIZE_CONSTANTS'] or params['RACING'] or \
+                params['EVALUATION_BLOCK_SIZE'] or \
+                not hasattr(params['ERROR_METRIC'], "batch"):
+            # Evaluate individuals one at a time.
+            fitnesses, self.batch_times = [], []
+
+            for ind in individuals:
+                start = perf_counter()
+                fitnesses.append(self(ind, **kwargs))
+                self.batch_times.append(perf_counter() - start)
+
+            return fitnesses
+
+        dist = kwargs.get('dist', 'training')
+
+        x, y = self.get_dist(dist)
+
+        fitnesses = [self.default_fitness] * len(individuals)
+        times = [0.0] * len(individuals)
+
+        # The predictions of all individuals without runtime errors, and
+        # the indexes of these individuals.
+        yhats, indexes = [], []
+
+        for i, ind in enumerate(individuals):
+            start = perf_counter()
+
+            try:
+                # phenotype won't refer to C
+                yhat = self.predict(ind.phenotype, x, dist)
+
+            except RUNTIME_ERRORS:
+                # These individuals are valid (i.e. not invalids), but they
+                # have produced a runtime error.
+                ind.runtime_error = True
+                continue
+
+            finally:
+                times[i] = perf_counter() - start
+
+            assert np.isrealobj(yhat)
+
+            # As in evaluate, only check the shape of array predictions.
+            if np.ndim(yhat) != 0:
+                if y.shape != yhat.shape:
+                    raise ValueError(shape_mismatch_txt)
+
+            yhats.append(np.broadcast_to(yhat, y.shape))
+            indexes.append(i)
+
+        errors = []
+
+        for start in range(0, len(yhats), self.batch_size):
+            # Compute the error of a block of predictions at once. Blocks
+            # are kept small so that stacked predictions stay in cache.
+            block = yhats[start:start + self.batch_size]
+            block_start = perf_counter()
+
+            try:
+                errors.extend(params['ERROR_METRIC'].batch(
+                    y, np.stack(block)).tolist())
+
+            except RUNTIME_ERRORS:
+                # Some predictions produced a runtime error, compute the
+                # error of each prediction separately.
+                for i, yhat in zip(indexes[start:], block):
+                    try:
+                        errors.append(params['ERROR_METRIC'](y, yhat))
+
+                    except RUNTIME_ERRORS:
+                        individuals[i].runtime_error = True
+                        errors.append(self.default_fitness)
+
+            # Share the time taken by the block between its individuals.
+            share = (perf_counter() - block_start) / len(block)
+
+            for i in indexes[start:start + self.batch_size]:
+                times[i] += share
+
+        for i, error in zip(indexes, errors):
+            fitnesses[i] = error
+
+        self.batch_times = times
+
+        return fitnesses
+
+    def predict(self, phenotype, x, dist):
+        """
+        Evaluates a phenotype which does not refer to constants on the inputs
+        of a dataset. Phenotypes are run on the stack machine if
+        params['STACK_VM'] is specified and they can be compiled for it (see
+        utilities.fitness.stack_vm), or evaluated using the semantic cache if
+        params['SEMANTIC_CACHE_SIZE'] is specified (see
+        utilities.fitness.semantic_cache). Otherwise, or if neither option
+        applies, phenotypes are evaluated with eval.
+
+        :param phenotype: The phenotype of an individual.
+        :param x: The inputs of the dataset.
+        :param dist: The distribution of the data, i.e. "training" or "test".
+        :return: The output of the phenotype.
+        """
+
+        if params['STACK_VM'] and x.dtype == np.float64:
+            compiled = compile_program(phenotype, globals())
+
+            if compiled is not None:
+                # Run the phenotype on the stack machine.
+                return run_program(compiled, x)
+
+        if params['SEMANTIC_CACHE_SIZE']:
+            # Reuse the outputs of subexpressions evaluated before.
+            return semantic_eval(phenotype, globals(), x, dist)
+
+        return eval(compile_phenotype(phenotype))
+
+    def evaluate_blocks(self, phenotype, x, y):
+        """
+        Computes the error of a phenotype on a dataset in blocks of
+        params['EVALUATION_BLOCK_SIZE'] rows, running the phenotype on the
+        stack machine (see utilities.fitness.stack_vm.run_program_error).
+        Only error metrics which are computed from the errors of each row
+        (i.e. which have errors and from_errors attributes, see
+        utilities.fitness.error_metric) can be computed block by block.
+
+        :param phenotype: The phenotype of an individual.
+        :param x: The inputs of the dataset.
+        :param y: The expected outputs of the dataset.
+        :return: The error of the phenotype, or None if the phenotype cannot
+        be run on the stack machine or the error metric cannot be computed
+        block by block.
+        """
+
+        if not hasattr(params['ERROR_METRIC'], "errors") or \
+                x.dtype != np.float64:
+            return None
+
+        compiled = compile_program(phenotype, globals())
+
+        if compiled is None:
+            return None
+
+        return run_program_error(compiled, x, y, params['ERROR_METRIC'],
+                                 params['EVALUATION_BLOCK_SIZE'])
+
+    def race(self, ind):
+        """
+        Evaluates a phenotype on a growing sequence of random subsets of the
+        training data, stopping early once the phenotype is known to be
+        worse than most of the population. The first subset holds
+        params['RACING_SAMPLE_SIZE'] rows, and each subset is twice the size
+        of the previous one, until the full training data are used. Only the
+        rows not yet seen are evaluated at each stage.
+
+        After each stage, a lower confidence bound on the error of the
+        phenotype over the full training data is computed from the errors of
+        the rows seen so far. If this bound is worse than the
+        params['RACING_QUANTILE'] quantile of the fitnesses of the last
+        params['POPULATION_SIZE'] phenotypes evaluated on the full training
+        data (e.g. the median with 0.5), evaluation stops, and the fitness of
+        the phenotype is estimated from the rows seen so far. Phenotypes
+        which are not stopped are evaluated on the full training data. Every
+        phenotype is evaluated in full until params['POPULATION_SIZE']
+        phenotypes have been evaluated.
+
+        The bound is checked once per stage, so the confidence level is
+        split between the stages (a Bonferroni correction): the chance of
+        stopping a phenotype whose error is better than the threshold is at
+        most 1 - params['RACING_CONFIDENCE'] over all stages.
+
+        Only error metrics which are computed from the mean of the errors
+        of each row can be raced (i.e. which have errors and from_errors
+        attributes, see utilities.fitness.error_metric). Each worker of the
+        multicore pool races phenotypes against the phenotypes it has
+        evaluated itself.
+
+        :param ind: An individual to be evaluated.
+        :return: The fitness of the evaluated individual.
+        """
+
+        metric = params['ERROR_METRIC']
+
+        if not hasattr(metric, "errors"):
+            s = "fitness.supervised_learning.supervised_learning." \
+                "supervised_learning.race\n" \
+                "Error: Racing is not supported by the error metric %s. " \
+                "Use mae, mse, rmse or Hamming_error." % metric.__name__
+            raise Exception(s)
+
+        n = len(self.racing_exp)
+
+        if len(self.racing_fitnesses) < self.racing_fitnesses.maxlen:
+            # Not enough phenotypes have been evaluated to race against,
+            # evaluate on the full training data.
+            threshold, end, z = None, n, None
+
+        else:
+            threshold = np.quantile(self.racing_fitnesses,
+                                    params['RACING_QUANTILE'])
+            end = min(params['RACING_SAMPLE_SIZE'], n)
+
+            # The number of stages after which the bound is checked, i.e.
+            # the stages which end before the full training data.
+            stages = max(ceil(log2(n / end)), 1)
+
+            # One-sided z-score of the confidence bound, with the chance of
+            # wrongly stopping the phenotype split between the stages.
+            z = NormalDist().inv_cdf(
+                1 - (1 - params['RACING_CONFIDENCE']) / stages)
+
+        # The sum and sum of squares of the errors of the rows seen so far.
+        total, total_sq, start = 0.0, 0.0, 0
+
+        # The phenotype is compiled once rather than at every stage.
+        # phenotype won't refer to C
+        code = compile_phenotype(ind.phenotype)
+
+        while start < n:
+            # Evaluate the phenotype on the next rows of the shuffled data.
+            x, y = self.racing_in[start:end], self.racing_exp[start:end]
+            yhat = eval(code)
+            assert np.isrealobj(yhat)
+
+            # As in evaluate, only check the shape of array predictions.
+            if np.ndim(yhat) != 0:
+                if y.shape != yhat.shape:
+                    raise ValueError(shape_mismatch_txt)
+
+            errors = metric.errors(y, yhat)
+            total += np.sum(errors)
+            total_sq += np.sum(np.square(errors))
+            start, end = end, min(end * 2, n)
+
+            if start < n:
+                # Lower confidence bound on the mean error of all rows. Rows
+                # are sampled without replacement, hence the finite
+                # population correction.
+                mean = total / start
+                std = sqrt(max(total_sq / start - mean ** 2, 0))
+                bound = mean - z * std / sqrt(start) * sqrt(1 - start / n)
+
+                if metric.from_errors(max(bound, 0), n) > threshold:
+                    # The phenotype cannot beat the threshold.
+                    break
+
+        fitness = metric.from_errors(total / start, n)
+
+        if start == n:
+            # Only fitnesses computed on the full training data are raced
+            # against, so that estimates do not bias the threshold.
+            self.racing_fitnesses.append(fitness)
+
+        return fitness
+
+    def set_mini_batch(self, number):
+        """
+        Sets the rows of the training data on which training fitness is
+        computed to a mini-batch of params['MINI_BATCH_SIZE'] rows, or to the
+        full training data.
+
+        Each mini-batch is a random sample of rows, stratified by expected
+        output: rows are sorted by expected output and split into equal
+        strata, and one row is drawn from each stratum. Mini-batches
+        therefore hold every class of classification problems in proportion,
+        and span the range of outputs of regression problems. Mini-batches
+        are drawn from a separate generator seeded by params['RANDOM_SEED']
+        and the number of the mini-batch, so that the random numbers of the
+        search are unchanged.
+
+        :param number: The number of the mini-batch, or None to use the full
+        training data.
+        :return: Nothing.
+        """
+
+        self.mini_batch = number
+        n = len(self.training_exp)
+
+        # Outputs cached on the previous training data are no longer valid.
+        clear_semantic_cache("training")
+
+        if number is None or params['MINI_BATCH_SIZE'] >= n:
+            # Use the full training data.
+            self.batch_in, self.batch_exp = None, None
+            return
+
+        rng = np.random.default_rng([params['RANDOM_SEED'] or 0, number])
+
+        # Draw one row from each stratum of rows sorted by expected output.
+        order = np.argsort(self.training_exp, kind="stable")
+        edges = np.linspace(0, n, params['MINI_BATCH_SIZE'] + 1).astype(int)
+        picks = edges[:-1] + (rng.random(params['MINI_BATCH_SIZE']) *
+                              np.diff(edges)).astype(int)
+
+        # Keep rows in their original order.
+        rows = np.sort(order[picks])
+        self.batch_in = self.training_in[rows]
+        self.batch_exp = self.training_exp[rows]
+
+    def get_dist(self, dist):
+        """
+        Returns the inputs and expected outputs of a given distribution of
+        the data. Training data are restricted to the current mini-batch if
+        one is set (see set_mini_batch).
+
+        :param dist: The distribution, i.e. "training" or "test".
+        :return: The inputs and expected outputs.
+        """
+
+        if dist == "training" and self.batch_exp is not None:
+            # Set the current mini-batch of the training datasets.
+            return self.batch_in, self.batch_exp
+
+        elif dist == "training":
+            # Set training datasets.
+            return self.training_in, self.training_exp
+
+        elif dist == "test":
+            # Set test datasets.
+            return self.test_in, self.test_exp
+
+        else:
+            raise ValueError("Unknown dist: " + dist)
@@ -1,9 +1,11 @@
 from random import choice, randint, random, sample
 
+from algorithm.mapper import map_individuals
 from algorithm.parameters import params
 from representation import individual
 from representation.latent_tree import latent_tree_crossover, \
     latent_tree_repair
+from representation.tree import SharedTree
 from utilities.representation.check_methods import check_ind
 
 
@@ -19,6 +21,11 @@ def crossover(parents):
     :return: A population of fully crossed over individuals.
     """
 
+    if params['BATCH_MAPPING'] and params['GENOME_OPERATIONS'] and \
+            params['CROSSOVER'].representation == "linear":
+        # Cross over all genomes first and then map them all at once.
+        return batch_crossover(parents)
+
     # Initialise an empty population.
     cross_pop = []
 
@@ -42,12 +49,55 @@ def crossover(parents):
     return cross_pop
 
 
-def crossover_inds(parent_0, parent_1):
+def batch_crossover(parents):
+    """
+    Perform linear crossover on a population of individuals, mapping all
+    children together with algorithm.mapper.map_individuals rather than one
+    at a time. Pairs of children which violate specified limits are
+    discarded and replaced by a new batch of crossovers until the crossover
+    population is full.
+
+    :param parents: A population of parent individuals on which crossover is
+    to be performed.
+    :return: A population of fully crossed over individuals.
+    """
+
+    # Initialise an empty population.
+    cross_pop = []
+
+    while len(cross_pop) < params['GENERATION_SIZE']:
+
+        # Find the number of pairs of children still required.
+        n_pairs = -(-(params['GENERATION_SIZE'] - len(cross_pop)) // 2)
+
+        # Perform crossover on randomly chosen pairs of parents, without
+        # mapping the children.
+        pairs = [crossover_inds(*sample(parents, 2), map_ind=False) for _ in
+                 range(n_pairs)]
+
+        # Map all children at once.
+        map_individuals([ind for inds in pairs for ind in inds])
+
+        for inds in pairs:
+            # Check each individual is ok (i.e. does not violate specified
+            # limits).
+            if not any([check_ind(ind, "crossover") for ind in inds]):
+                # Extend the new population.
+                cross_pop.extend(inds)
+
+    return cross_pop
+
+
+def crossover_inds(parent_0, parent_1, map_ind=True):
     """
     Perform crossover on two selected individuals.
     
     :param parent_0: Parent 0 selected for crossover.
     :param parent_1: Parent 1 selected for crossover.
+    :param map_ind: A boolean flag that indicates whether or not the
+    children are to be mapped. Unmapped children are returned without
+    being checked, and can be mapped together with
+    algorithm.mapper.map_individuals.
     :return: Two crossed-over individuals.
     """
 
@@ -63,6 +113,10 @@ def crossover_inds(parent_0, parent_1):
             "selected for crossover."
         raise Exception(s)
 
+    if not map_ind:
+        # Perform crossover on ind_0 and ind_1 without mapping the children.
+        return params['CROSSOVER'](ind_0, ind_1, map_ind=False)
+
     # Perform crossover on ind_0 and ind_1.
     inds = params['CROSSOVER'](ind_0, ind_1)
 
@@ -78,7 +132,7 @@ def crossover_inds(parent_0, parent_1):
         return inds
 
 
-def variable_onepoint(p_0, p_1):
+def variable_onepoint(p_0, p_1, map_ind=True):
     """
     Given two individuals, create two children using one-point crossover and
     return them. A different point is selected on each genome for crossover
@@ -89,6 +143,8 @@ def variable_onepoint(p_0, p_1):
     
     :param p_0: Parent 0
     :param p_1: Parent 1
+    :param map_ind: A boolean flag that indicates whether or not the
+    children are to be mapped.
     :return: A list of crossed-over individuals.
     """
 
@@ -108,14 +164,18 @@ def variable_onepoint(p_0, p_1):
     else:
         c_0, c_1 = genome_0[:], genome_1[:]
 
-    # Put the new chromosomes into new individuals.
-    ind_0 = individual.Individual(c_0, None)
-    ind_1 = individual.Individual(c_1, None)
+    # Put the new chromosomes into new individuals. Each child matches
+    # one parent up to the first crossover point, so mapping can resume
+    # from that parent's mapper checkpoints.
+    ind_0 = individual.Individual(c_0, None, map_ind,
+                                  p_0.get_checkpoints(pt_0))
+    ind_1 = individual.Individual(c_1, None, map_ind,
+                                  p_1.get_checkpoints(pt_1))
 
     return [ind_0, ind_1]
 
 
-def fixed_onepoint(p_0, p_1):
+def fixed_onepoint(p_0, p_1, map_ind=True):
     """
     Given two individuals, create two children using one-point crossover and
     return them. The same point is selected on both genomes for crossover
@@ -125,6 +185,8 @@ def fixed_onepoint(p_0, p_1):
 
     :param p_0: Parent 0
     :param p_1: Parent 1
+    :param map_ind: A boolean flag that indicates whether or not the
+    children are to be mapped.
     :return: A list of crossed-over individuals.
     """
 
@@ -144,14 +206,18 @@ def fixed_onepoint(p_0, p_1):
     else:
         c_0, c_1 = genome_0[:], genome_1[:]
 
-    # Put the new chromosomes into new individuals.
-    ind_0 = individual.Individual(c_0, None)
-    ind_1 = individual.Individual(c_1, None)
+    # Put the new chromosomes into new individuals. Each child matches
+    # one parent up to the first crossover point, so mapping can resume
+    # from that parent's mapper checkpoints.
+    ind_0 = individual.Individual(c_0, None, map_ind,
+                                  p_0.get_checkpoints(pt))
+    ind_1 = individual.Individual(c_1, None, map_ind,
+                                  p_1.get_checkpoints(pt))
 
     return [ind_0, ind_1]
 
 
-def fixed_twopoint(p_0, p_1):
+def fixed_twopoint(p_0, p_1, map_ind=True):
     """
     Given two individuals, create two children using two-point crossover and
     return them. The same points are selected on both genomes for crossover
@@ -161,6 +227,8 @@ def fixed_twopoint(p_0, p_1):
 
     :param p_0: Parent 0
     :param p_1: Parent 1
+    :param map_ind: A boolean flag that indicates whether or not the
+    children are to be mapped.
     :return: A list of crossed-over individuals.
     """
 
@@ -180,14 +248,18 @@ def fixed_twopoint(p_0, p_1):
     else:
         c_0, c_1 = genome_0[:], genome_1[:]
 
-    # Put the new chromosomes into new individuals.
-    ind_0 = individual.Individual(c_0, None)
-    ind_1 = individual.Individual(c_1, None)
+    # Put the new chromosomes into new individuals. Each child matches
+    # one parent up to the first crossover point, so mapping can resume
+    # from that parent's mapper checkpoints.
+    ind_0 = individual.Individual(c_0, None, map_ind,
+                                  p_0.get_checkpoints(pt_0))
+    ind_1 = individual.Individual(c_1, None, map_ind,
+                                  p_1.get_checkpoints(pt_0))
 
     return [ind_0, ind_1]
 
 
-def variable_twopoint(p_0, p_1):
+def variable_twopoint(p_0, p_1, map_ind=True):
     """
     Given two individuals, create two children using two-point crossover and
     return them. Different points are selected on both genomes for crossover
@@ -197,6 +269,8 @@ def variable_twopoint(p_0, p_1):
 
     :param p_0: Parent 0
     :param p_1: Parent 1
+    :param map_ind: A boolean flag that indicates whether or not the
+    children are to be mapped.
     :return: A list of crossed-over individuals.
     """
 
@@ -218,9 +292,13 @@ def variable_twopoint(p_0, p_1):
     else:
         c_0, c_1 = genome_0[:], genome_1[:]
 
-    # Put the new chromosomes into new individuals.
-    ind_0 = individual.Individual(c_0, None)
-    ind_1 = individual.Individual(c_1, None)
+    # Put the new chromosomes into new individuals. Each child matches
+    # one parent up to the first crossover point, so mapping can resume
+    # from that parent's mapper checkpoints.
+    ind_0 = individual.Individual(c_0, None, map_ind,
+                                  p_0.get_checkpoints(pt_0))
+    ind_1 = individual.Individual(c_1, None, map_ind,
+                                  p_1.get_checkpoints(pt_2))
 
     return [ind_0, ind_1]
 
@@ -256,8 +334,8 @@ def subtree(p_0, p_1):
         crossover_choice = choice(shared_nodes)
 
         # Find all nodes in both trees that match the chosen crossover node.
-        nodes_0 = tree0.get_target_nodes([], target=[crossover_choice])
-        nodes_1 = tree1.get_target_nodes([], target=[crossover_choice])
+        nodes_0 = tree0.get_label_index()[crossover_choice]
+        nodes_1 = tree1.get_label_index()[crossover_choice]
 
         # Randomly pick a node.
         t0, t1 = choice(nodes_0), choice(nodes_1)
@@ -285,6 +363,9 @@ def subtree(p_0, p_1):
             t0.parent = p1
             t1.parent = None
 
+            # Clear the cached hashes and indexes of the changed tree.
+            p1.invalidate()
+
         elif not p1:
             # Only t1 is the entire of tree1.
             tree1 = t0
@@ -299,6 +380,9 @@ def subtree(p_0, p_1):
             t1.parent = p0
             t0.parent = None
 
+            # Clear the cached hashes and indexes of the changed tree.
+            p0.invalidate()
+
         else:
             # The crossover node for both trees is not the entire tree.
 
@@ -316,8 +400,44 @@ def subtree(p_0, p_1):
             t1.parent = p0
             t0.parent = p1
 
+            # Clear the cached hashes and indexes of both changed trees.
+            p0.invalidate()
+            p1.invalidate()
+
         return tree0, tree1
 
+    def do_shared_crossover(tree0, tree1, shared_nodes):
+        """
+        Given two instances of the representation.tree.SharedTree class and
+        a list of intersecting non-terminal nodes across both trees,
+        performs subtree crossover on these trees. Nodes are chosen in the
+        same way as in do_crossover, but only the paths to the chosen nodes
+        are traversed and copied.
+
+        :param tree0: The derivation tree of individual 0.
+        :param tree1: The derivation tree of individual 1.
+        :param shared_nodes: The sorted list of all non-terminal nodes that are
+        in both derivation trees.
+        :return: The new derivation trees after subtree crossover has been
+        performed.
+        """
+
+        # Randomly choose a non-terminal from the set of permissible
+        # intersecting non-terminals.
+        crossover_choice = choice(shared_nodes)
+
+        # Randomly pick a node from all nodes in both trees that match the
+        # chosen crossover node.
+        path_0 = tree0.find_node(choice(range(tree0.count_nodes(
+            crossover_choice))), crossover_choice)
+        path_1 = tree1.find_node(choice(range(tree1.count_nodes(
+            crossover_choice))), crossover_choice)
+
+        t0, t1 = tree0.get_node(path_0), tree1.get_node(path_1)
+
+        # Swap over the subtrees.
+        return tree0.replace(path_0, t1), tree1.replace(path_1, t0)
+
     def intersect(l0, l1):
         """
         Returns the intersection of two sets of labels of nodes of
@@ -364,17 +484,32 @@ def subtree(p_0, p_1):
             # Save tail of each genome.
             tail_1 = p_1.genome[p_1.used_codons:]
 
-        # Get the set of labels of non terminals for each tree.
-        labels1 = p_0.tree.get_node_labels(set())
-        labels2 = p_1.tree.get_node_labels(set())
+        if params['HASH_CONS_TREES']:
+            # Ensure both trees are shared trees.
+            p_0.tree = SharedTree.from_tree(p_0.tree)
+            p_1.tree = SharedTree.from_tree(p_1.tree)
+
+            # Get the set of labels of non terminals for each tree.
+            labels1 = p_0.tree.get_node_labels(set())
+            labels2 = p_1.tree.get_node_labels(set())
+
+            # Shared trees are crossed over by copying only the changed paths.
+            cross_trees = do_shared_crossover
+
+        else:
+            # Get the labels of non terminals from the index of each tree.
+            labels1 = set(p_0.tree.get_label_index())
+            labels2 = set(p_1.tree.get_label_index())
+
+            cross_trees = do_crossover
 
         # Find overlapping non-terminals across both trees.
         shared_nodes = intersect(labels1, labels2)
 
         if len(shared_nodes) != 0:
             # There are overlapping NTs, cross over parts of trees.
-            ret_tree0, ret_tree1 = do_crossover(p_0.tree, p_1.tree,
-                                                shared_nodes)
+            ret_tree0, ret_tree1 = cross_trees(p_0.tree, p_1.tree,
+                                               shared_nodes)
 
         else:
             # There are no overlapping NTs, cross over entire trees.
@@ -1,10 +1,13 @@
+from array import array
 from math import floor
 from os import getcwd, listdir, path
-from random import randint, shuffle
+from random import randint, randrange, sample, shuffle
 
+from algorithm.mapper import map_individuals
 from algorithm.parameters import params
 from representation import individual
-from representation.derivation import generate_tree, pi_grow
+from representation.derivation import generate_tree, pi_grow, \
+    unrank_derivation
 from representation.individual import Individual
 from representation.latent_tree import latent_tree_random_ind
 from representation.tree import Tree
@@ -42,8 +45,8 @@ def sample_genome():
     
     :return: A randomly generated genome.
     """
-    genome = [randint(0, params['CODON_SIZE']) for _ in
-              range(params['INIT_GENOME_LENGTH'])]
+    genome = array('i', [randint(0, params['CODON_SIZE']) for _ in
+                         range(params['INIT_GENOME_LENGTH'])])
     return genome
 
 
@@ -55,6 +58,14 @@ def uniform_genome(size):
     :return: A full population composed of randomly generated individuals.
     """
 
+    if params['BATCH_MAPPING'] and params['GENOME_OPERATIONS']:
+        # Sample all genomes first and then map them all at once.
+        individuals = [individual.Individual(sample_genome(), None, False)
+                       for _ in range(size)]
+        map_individuals(individuals)
+
+        return individuals
+
     return [individual.Individual(sample_genome(), None) for _ in range(size)]
 
 
@@ -309,6 +320,66 @@ def PI_grow(size):
         return population
 
 
+def uniform_depth(size):
+    """
+    Create a population of size of distinct individuals, ramped over tree
+    depths. For each depth, derivation trees of exactly that depth are
+    sampled uniformly at random from all such trees, using the exact tree
+    counts of the grammar.
+
+    :param size: The size of the required population.
+    :return: A full population of individuals.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+    start = grammar.start_rule["symbol"]
+
+    # Calculate the range of depths to ramp individuals from.
+    depths = range((grammar.min_ramp or grammar.min_path) + 1,
+                   params['MAX_INIT_TREE_DEPTH'] + 1)
+
+    if not depths:
+        # If we have no depths to ramp from, then params['MAX_INIT_DEPTH'] is
+        # set too low for the specified grammar.
+        s = "operators.initialisation.uniform_depth\n" \
+            "Error: Maximum initialisation depth too low for specified " \
+            "grammar."
+        raise Exception(s)
+
+    # Find the number of trees of each depth.
+    ramps = [(grammar.count_trees_by_depth(start, depth), {'depth': depth})
+             for depth in depths]
+
+    return sample_distinct_inds(size, ramps)
+
+
+def uniform_size(size):
+    """
+    Create a population of size of distinct individuals, ramped over tree
+    sizes (numbers of non-terminal nodes, i.e. used codons) up to
+    params['INIT_GENOME_LENGTH']. For each size, derivation trees of
+    exactly that size are sampled uniformly at random from all such trees
+    within params['MAX_INIT_TREE_DEPTH'], using the exact tree counts of
+    the grammar.
+
+    :param size: The size of the required population.
+    :return: A full population of individuals.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+    start = grammar.start_rule["symbol"]
+
+    # Find the number of trees of each size, within the maximum
+    # initialisation depth.
+    ramps = [(grammar.count_trees_by_size(start, tree_size,
+                                          params['MAX_INIT_TREE_DEPTH']),
+              {'size': tree_size,
+               'max_depth': params['MAX_INIT_TREE_DEPTH']})
+             for tree_size in range(1, params['INIT_GENOME_LENGTH'] + 1)]
+
+    return sample_distinct_inds(size, ramps)
+
+
 def generate_ind_tree(max_depth, method):
     """
     Generate an individual using a given subtree initialisation method.
@@ -341,8 +412,8 @@ def generate_ind_tree(max_depth, method):
     ind.depth, ind.used_codons, ind.invalid = depth, used_cod, invalid
 
     # Generate random tail for genome.
-    ind.genome = genome + [randint(0, params['CODON_SIZE']) for
-                           _ in range(int(ind.used_codons / 2))]
+    ind.genome = array('i', genome + [randint(0, params['CODON_SIZE']) for
+                                      _ in range(int(ind.used_codons / 2))])
 
     return ind
 
@@ -378,12 +449,121 @@ def generate_PI_ind_tree(max_depth):
     ind.depth, ind.used_codons, ind.invalid = depth, used_cod, invalid
 
     # Generate random tail for genome.
-    ind.genome = genome + [randint(0, params['CODON_SIZE']) for
-                           _ in range(int(ind.used_codons / 2))]
+    ind.genome = array('i', genome + [randint(0, params['CODON_SIZE']) for
+                                      _ in range(int(ind.used_codons / 2))])
 
     return ind
 
 
+def sample_distinct_inds(size, ramps):
+    """
+    Create a population of size of distinct individuals, ramped over
+    derivation trees of given depths or sizes. The population is shared
+    equally between all depths or sizes from which any trees can be
+    derived. Distinct trees are sampled uniformly at random by drawing
+    distinct ranks, so no individuals are ever generated and discarded as
+    duplicates. If there are too few trees of a given depth or size, the
+    remainder of its share is passed on to the next.
+
+    :param size: The size of the required population.
+    :param ramps: A list of (number of trees, dict of the depth or size of
+    the trees) to ramp individuals from, as accepted by
+    representation.derivation.unrank_derivation.
+    :return: A full population of individuals.
+    """
+
+    # Only ramp over depths or sizes from which trees can be derived.
+    ramps = [ramp for ramp in ramps if ramp[0]]
+
+    if not ramps:
+        s = "operators.initialisation.sample_distinct_inds\n" \
+            "Error: No trees can be derived within the initialisation " \
+            "limits for specified grammar."
+        raise Exception(s)
+
+    if size < len(ramps):
+        # The population size is too small to fully cover all ramps. Only
+        # ramp to the number of ramps we can reach.
+        ramps = ramps[:size]
+
+    # Calculate how many individuals are to be generated from each ramp.
+    # The remainder is generated from randomly chosen ramps.
+    times = int(floor(size / len(ramps)))
+    shares = [times] * len(ramps)
+
+    for i in sample(range(len(ramps)), size - times * len(ramps)):
+        shares[i] += 1
+
+    population, missing = [], 0
+
+    for (count, bounds), share in zip(ramps, shares):
+        # Generate as many distinct trees as possible from each ramp.
+        share += missing
+        missing = max(share - count, 0)
+        share -= missing
+
+        if count <= 2 * share:
+            # Draw distinct ranks directly.
+            ranks = sample(range(count), share)
+
+        else:
+            # Draw random ranks, few of which will be repeated.
+            ranks, seen = [], set()
+
+            while len(ranks) < share:
+                rank = randrange(count)
+
+                if rank not in seen:
+                    seen.add(rank)
+                    ranks.append(rank)
+
+        population.extend([generate_unranked_ind(rank, bounds) for rank in
+                           ranks])
+
+    if missing:
+        # The population will be completed with duplicate trees.
+        print("Warning: Grammar cannot generate enough distinct trees "
+              "within the initialisation limits. Generating %d duplicate "
+              "individuals." % missing)
+
+        for _ in range(missing):
+            count, bounds = ramps[randrange(len(ramps))]
+            population.append(generate_unranked_ind(randrange(count),
+                                                    bounds))
+
+    return population
+
+
+def generate_unranked_ind(rank, bounds):
+    """
+    Generate an individual from the derivation tree of a given rank.
+
+    :param rank: The rank of the tree among all trees of the given depth or
+    size.
+    :param bounds: A dict of the depth, or of the size and maximum depth,
+    of the tree.
+    :return: A fully built individual.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+
+    genome = []
+
+    for NT, index in unrank_derivation(grammar.start_rule["symbol"], rank,
+                                       **bounds):
+        # Make a codon for each production choice, as in
+        # representation.derivation.generate_codon.
+        no_choices = grammar.rules[NT]['no_choices']
+        genome.append(randrange(0, grammar.codon_size - no_choices + 1,
+                                no_choices) + index)
+
+    # Generate random tail for genome.
+    genome = array('i', genome + [randint(0, params['CODON_SIZE']) for
+                                  _ in range(int(len(genome) / 2))])
+
+    return individual.Individual(genome, None)
+
+
 def load_population(target):
     """
     Given a target folder, read all files in the folder and load/parse
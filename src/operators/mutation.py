@@ -1,9 +1,11 @@
 from random import choice, randint, random
 
+from algorithm.mapper import map_individuals
 from algorithm.parameters import params
 from representation import individual
 from representation.derivation import generate_tree
 from representation.latent_tree import latent_tree_mutate, latent_tree_repair
+from representation.tree import SharedTree, Tree
 from utilities.representation.check_methods import check_ind
 
 
@@ -16,6 +18,11 @@ def mutation(pop):
     :return: A fully mutated population.
     """
 
+    if params['BATCH_MAPPING'] and params['GENOME_OPERATIONS'] and \
+            params['MUTATION'].representation == "linear":
+        # Mutate all genomes first and then map them all at once.
+        return batch_mutation(pop)
+
     # Initialise empty pop for mutated individuals.
     new_pop = []
 
@@ -53,7 +60,55 @@ def mutation(pop):
     return new_pop
 
 
-def int_flip_per_codon(ind):
+def batch_mutation(pop):
+    """
+    Perform linear mutation on a population of individuals, mapping all
+    mutated genomes together with algorithm.mapper.map_individuals rather
+    than one at a time. Individuals which violate specified limits are
+    mutated again (and re-mapped together) until all pass.
+
+    :param pop: A population of individuals to be mutated.
+    :return: A fully mutated population.
+    """
+
+    # Initialise pop for mutated individuals.
+    new_pop = [None] * len(pop)
+
+    # Indexes of all individuals which still need to be mutated.
+    pending = list(range(len(pop)))
+
+    while pending:
+        # Mutate all pending individuals, and the individuals whose genomes
+        # have been changed by mutation and need to be mapped.
+        mutated, unmapped = [], []
+
+        for i in pending:
+            # If individual has no genome, default to subtree mutation, as
+            # in mutation. Subtree mutation maps the individual itself.
+            if not pop[i].genome and params['NO_MUTATION_INVALIDS']:
+                mutated.append(subtree(pop[i]))
+
+            else:
+                # Perform mutation without mapping the individual.
+                ind = params['MUTATION'](pop[i], map_ind=False)
+                mutated.append(ind)
+
+                if ind is not pop[i]:
+                    unmapped.append(ind)
+
+        # Map all genomes which have been changed by mutation.
+        map_individuals(unmapped)
+
+        for ind, i in zip(mutated, pending):
+            new_pop[i] = ind
+
+        # Check inds do not violate specified limits.
+        pending = [i for i in pending if check_ind(new_pop[i], "mutation")]
+
+    return new_pop
+
+
+def int_flip_per_codon(ind, map_ind=True):
     """
     Mutate the genome of an individual by randomly choosing a new int with
     probability p_mut. Works per-codon. Mutation is performed over the
@@ -61,6 +116,9 @@ def int_flip_per_codon(ind):
     within_used=False switches this off.
 
     :param ind: An individual to be mutated.
+    :param map_ind: A boolean flag that indicates whether or not the
+    mutated individual is to be mapped. Unmapped individuals can be mapped
+    together with algorithm.mapper.map_individuals.
     :return: A mutated individual.
     """
 
@@ -78,19 +136,27 @@ def int_flip_per_codon(ind):
         # Default is 1 divided by genome length.
         p_mut = 1.0 / eff_length
 
+    # Keep track of the first mutated codon.
+    first_change = len(ind.genome)
+
     # Mutation probability works per-codon over the portion of the
     # genome as defined by the within_used flag.
     for i in range(eff_length):
         if random() < p_mut:
             ind.genome[i] = randint(0, params['CODON_SIZE'])
+            first_change = min(first_change, i)
+
+    # Only mapper checkpoints before the first mutated codon remain valid.
+    ind.checkpoints = ind.get_checkpoints(first_change)
 
     # Re-build a new individual with the newly mutated genetic information.
-    new_ind = individual.Individual(ind.genome, None)
+    new_ind = individual.Individual(ind.genome, None, map_ind,
+                                    ind.checkpoints)
 
     return new_ind
 
 
-def int_flip_per_ind(ind):
+def int_flip_per_ind(ind, map_ind=True):
     """
     Mutate the genome of an individual by randomly choosing a new int with
     probability p_mut. Works per-individual. Mutation is performed over the
@@ -98,6 +164,9 @@ def int_flip_per_ind(ind):
     provided to limit mutation to only the effective length of the genome.
 
     :param ind: An individual to be mutated.
+    :param map_ind: A boolean flag that indicates whether or not the
+    mutated individual is to be mapped. Unmapped individuals can be mapped
+    together with algorithm.mapper.map_individuals.
     :return: A mutated individual.
     """
 
@@ -108,12 +177,20 @@ def int_flip_per_ind(ind):
         # Linear mutation cannot be performed on this individual.
         return ind
 
+    # Keep track of the first mutated codon.
+    first_change = len(ind.genome)
+
     for _ in range(params['MUTATION_EVENTS']):
         idx = randint(0, eff_length - 1)
         ind.genome[idx] = randint(0, params['CODON_SIZE'])
+        first_change = min(first_change, idx)
+
+    # Only mapper checkpoints before the first mutated codon remain valid.
+    ind.checkpoints = ind.get_checkpoints(first_change)
 
     # Re-build a new individual with the newly mutated genetic information.
-    new_ind = individual.Individual(ind.genome, None)
+    new_ind = individual.Individual(ind.genome, None, map_ind,
+                                    ind.checkpoints)
 
     return new_ind
 
@@ -159,6 +236,38 @@ def subtree(ind):
 
         return ind_tree
 
+    def shared_subtree_mutate(ind_tree):
+        """
+        Picks one node of an instance of the representation.tree.SharedTree
+        class at random in the same way as subtree_mutate, and replaces it
+        with a new randomly generated subtree. Only the path to the chosen
+        node is traversed and copied.
+
+        :param ind_tree: The full shared tree of an individual.
+        :return: The full mutated tree.
+        """
+
+        # Pick a node.
+        path = ind_tree.find_node(choice(range(ind_tree.count_nodes())))
+        node = ind_tree.get_node(path)
+
+        # Set the depth limits for the new subtree. As in the
+        # representation.tree.Tree class, unexpanded nodes have depth 1.
+        if params['MAX_TREE_DEPTH']:
+            # Set the limit to the tree depth.
+            max_depth = params['MAX_TREE_DEPTH'] - \
+                        (len(path) + 1 if node.children else 1)
+
+        else:
+            # There is no limit to tree depth.
+            max_depth = None
+
+        # Mutate a new subtree.
+        new_tree = Tree(node.root, None)
+        generate_tree(new_tree, [], [], "random", 0, 0, 0, max_depth)
+
+        return ind_tree.replace(path, SharedTree.from_tree(new_tree))
+
     if ind.invalid:
         # The individual is invalid.
         tail = []
@@ -167,9 +276,17 @@ def subtree(ind):
         # Save the tail of the genome.
         tail = ind.genome[ind.used_codons:]
 
+    if params['HASH_CONS_TREES']:
+        # Ensure the tree is a shared tree.
+        ind.tree = SharedTree.from_tree(ind.tree)
+
     # Allows for multiple mutation events should that be desired.
     for i in range(params['MUTATION_EVENTS']):
-        ind.tree = subtree_mutate(ind.tree)
+        if params['HASH_CONS_TREES']:
+            ind.tree = shared_subtree_mutate(ind.tree)
+
+        else:
+            ind.tree = subtree_mutate(ind.tree)
 
     # Re-build a new individual with the newly mutated genetic information.
     ind = individual.Individual(None, ind.tree)
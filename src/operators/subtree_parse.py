@@ -607,6 +607,9 @@ def create_snippet(parent, children, choice, key):
         # Set the parent of the child to the new node
         child.parent = new_tree
 
+    # Clear the cached hashes and indexes of the new tree.
+    new_tree.invalidate()
+
     # Add new snippet to snippets dictionary
     trackers.snippets[key] = new_tree
 
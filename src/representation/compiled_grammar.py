@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class CompiledGrammar(object):
+    """
+    A table-driven form of a parsed BNF grammar for fast genome mapping.
+
+    Every symbol in the grammar is given an integer id. Non-terminals take
+    the ids 0 to n_NTs - 1 and terminals take the ids that follow. All
+    production choices are stored back to back in flat integer tables, so
+    that mapping a codon is a handful of list look-ups rather than several
+    nested dictionary look-ups.
+
+    Productions of non-terminal "nt" are numbered from prod_offset[nt] to
+    prod_offset[nt] + no_choices[nt] - 1. The symbols of production "p" are
+    prod_symbols[prod_start[p]:prod_start[p + 1]].
+    """
+
+    def __init__(self, grammar):
+        """
+        Initialises an instance of the compiled grammar class from a fully
+        parsed instance of the representation.grammar.Grammar class.
+
+        :param grammar: An instance of the representation.grammar.Grammar
+        class.
+        """
+
+        # Give each non-terminal an integer id, in order of appearance in
+        # the grammar file. The start rule is always the first rule found,
+        # and so always has id 0.
+        nt_names = list(grammar.rules)
+        self.n_NTs = len(nt_names)
+
+        # Dict mapping symbol strings to integer ids. Non-terminals and
+        # terminals are kept separate since a terminal string may look
+        # like a non-terminal.
+        self.NT_ids = {nt: i for i, nt in enumerate(nt_names)}
+        self.T_ids = {}
+
+        # List of symbol strings indexed by symbol id, and a list of flags
+        # indicating whether or not each symbol is a non-terminal.
+        self.symbols = list(nt_names)
+        self.is_NT = [1] * self.n_NTs
+
+        # Per non-terminal tables.
+        self.no_choices = []
+        self.prod_offset = []
+
+        # Per production tables. prod_start has one extra entry at the end
+        # so that the symbols of production p always end at
+        # prod_start[p + 1].
+        self.prod_start = []
+        self.prod_arity = []
+        self.prod_nodes = []
+        self.prod_symbols = []
+
+        # The symbols of each production in reverse order. Used for pushing
+        # children onto a mapping stack in a single slice assignment.
+        self.prod_reversed = []
+
+        for nt in nt_names:
+            choices = grammar.rules[nt]['choices']
+
+            self.prod_offset.append(len(self.prod_start))
+            self.no_choices.append(len(choices))
+
+            for choice in choices:
+                self.prod_start.append(len(self.prod_symbols))
+
+                ids = [self.symbol_id(sym) for sym in choice['choice']]
+                arity = sum(1 for sym in choice['choice'] if
+                            sym["type"] == "NT")
+
+                self.prod_symbols.extend(ids)
+                self.prod_reversed.append(ids[::-1])
+                self.prod_arity.append(arity)
+
+                # A production with no non-terminal children terminates the
+                # branch, which adds a single node.
+                self.prod_nodes.append(arity if arity else 1)
+
+        self.prod_start.append(len(self.prod_symbols))
+
+        # Set the id of the start rule.
+        self.start = self.NT_ids[grammar.start_rule["symbol"]]
+
+        # NumPy copies of the tables, for mapping whole populations of
+        # genomes at once. The reversed production symbols are padded with
+        # -1 to the length of the longest production.
+        self.np_is_NT = np.array(self.is_NT, dtype=bool)
+        self.np_no_choices = np.array(self.no_choices, dtype=np.int64)
+        self.np_prod_offset = np.array(self.prod_offset, dtype=np.int64)
+        self.np_prod_arity = np.array(self.prod_arity, dtype=np.int64)
+        self.np_prod_nodes = np.array(self.prod_nodes, dtype=np.int64)
+        self.np_prod_length = np.array([len(p) for p in self.prod_reversed],
+                                       dtype=np.int64)
+        self.np_prod_reversed = np.full((len(self.prod_reversed),
+                                         max(self.np_prod_length)), -1,
+                                        dtype=np.int64)
+        for i, prod in enumerate(self.prod_reversed):
+            self.np_prod_reversed[i, :len(prod)] = prod
+
+    def symbol_id(self, sym):
+        """
+        Return the integer id of a symbol from a production choice,
+        assigning a new id if the symbol is a terminal which has not been
+        seen before.
+
+        :param sym: A symbol dict from a production choice.
+        :return: The integer id of the symbol.
+        """
+
+        if sym["type"] == "NT":
+            return self.NT_ids[sym["symbol"]]
+
+        if sym["symbol"] not in self.T_ids:
+            # Add a new terminal symbol.
+            self.T_ids[sym["symbol"]] = len(self.symbols)
+            self.symbols.append(sym["symbol"])
+            self.is_NT.append(0)
+
+        return self.T_ids[sym["symbol"]]
+
+    def production(self, nt, codon):
+        """
+        Return the index of the production choice selected by a codon for
+        a given non-terminal.
+
+        :param nt: The integer id of a non-terminal.
+        :param codon: A codon value.
+        :return: The index of the chosen production in the production
+        tables.
+        """
+
+        return self.prod_offset[nt] + codon % self.no_choices[nt]
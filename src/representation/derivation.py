@@ -1,7 +1,10 @@
+from bisect import bisect_right
+from itertools import accumulate
 from random import choice, randint, randrange
 
 from algorithm.parameters import params
 from representation.tree import Tree
+from representation.tree_arena import ArenaTree, TreeArena
 from utilities.representation.check_methods import get_nodes_and_depth, \
     ret_true
 
@@ -9,7 +12,12 @@ from utilities.representation.check_methods import get_nodes_and_depth, \
 def generate_tree(tree, genome, output, method, nodes, depth, max_depth,
                   depth_limit):
     """
-    Recursive function to derive a tree using a given method.
+    Derive a tree using a given method.
+
+    The tree is derived depth-first using an explicit stack of arena
+    indexes, rather than by recursion, and is written into a flat
+    representation.tree_arena.TreeArena. The children of the given tree
+    are then views of the arena.
     
     :param tree: An instance of the Tree class.
     :param genome: The list of all codons in a tree.
@@ -18,73 +26,108 @@ def generate_tree(tree, genome, output, method, nodes, depth, max_depth,
     :param method: A string of the desired tree derivation method,
     e.g. "full" or "random".
     :param nodes: The total number of nodes in the tree.
-    :param depth: The depth of the current node.
+    :param depth: The depth of the parent of the tree.
     :param max_depth: The maximum depth of any node in the tree.
     :param depth_limit: The maximum depth the tree can expand to.
     :return: genome, output, nodes, depth, max_depth.
     """
 
-    # Increment nodes and depth, set depth of current node.
-    nodes += 1
-    depth += 1
-    tree.depth = depth
+    # Create local variables to avoid multiple dictionary lookups
+    rules = params['BNF_GRAMMAR'].rules
+    compiled = params['BNF_GRAMMAR'].compiled
+    symbols, is_NT = compiled.symbols, compiled.is_NT
+    prod_offset, prod_arity = compiled.prod_offset, compiled.prod_arity
 
-    # Find the productions possible from the current root.
-    productions = params['BNF_GRAMMAR'].rules[tree.root]
+    # Initialise an arena with the current root as its root, at the depth
+    # of the current root.
+    arena = TreeArena(compiled.NT_ids[tree.root])
+    arena.depth[0] = depth + 1
+    depths = arena.depth
 
-    if depth_limit:
-        # Set remaining depth.
-        remaining_depth = depth_limit - depth
+    # The depth of the current node, or of its children if it terminates.
+    tree_depth = depth + 1
 
-    else:
-        remaining_depth = depth_limit
+    # Stack of arena indexes of nodes still to be visited. The top of the
+    # stack is the leftmost node.
+    stack = [0]
 
-    # Find which productions can be used based on the derivation method.
-    available = legal_productions(method, remaining_depth, tree.root,
-                                  productions['choices'])
+    while stack:
+        node = stack.pop()
+        symbol = arena.symbol[node]
 
-    # Randomly pick a production choice and make a codon with it.
-    chosen_prod = choice(available)
-    codon = generate_codon(chosen_prod, productions)
-    
-    # Set the codon for the current node and append codon to the genome.
-    tree.codon = codon
-    genome.append(codon)
+        if not is_NT[symbol]:
+            # The symbol is a terminal. Append the terminal to the output
+            # list.
+            output.append(symbols[symbol])
+            continue
 
-    # Initialise empty list of children for current node.
-    tree.children = []
+        # Increment nodes, get depth of current node.
+        nodes += 1
+        depth = depths[node]
 
-    for symbol in chosen_prod['choice']:
-        # Iterate over all symbols in the chosen production.
-        if symbol["type"] == "T":
-            # The symbol is a terminal. Append new node to children.
-            tree.children.append(Tree(symbol["symbol"], tree))
+        # Find the productions possible from the current root.
+        productions = rules[symbols[symbol]]
 
-            # Append the terminal to the output list.
-            output.append(symbol["symbol"])
+        if depth_limit:
+            # Set remaining depth.
+            remaining_depth = depth_limit - depth
 
-        elif symbol["type"] == "NT":
-            # The symbol is a non-terminal. Append new node to children.
-            tree.children.append(Tree(symbol["symbol"], tree))
+        else:
+            remaining_depth = depth_limit
 
-            # recurse on the new node.
-            genome, output, nodes, d, max_depth = \
-                generate_tree(tree.children[-1], genome, output, method,
-                              nodes, depth, max_depth, depth_limit)
+        # Find which productions can be used based on the derivation method.
+        available = legal_productions(method, remaining_depth,
+                                      symbols[symbol], productions['choices'])
 
-    NT_kids = [kid for kid in tree.children if kid.root in
-               params['BNF_GRAMMAR'].non_terminals]
+        # Randomly pick a production choice and make a codon with it.
+        chosen_prod = choice(available)
+        codon = generate_codon(chosen_prod, productions)
+        production = prod_offset[symbol] + \
+            productions['choices'].index(chosen_prod)
 
-    if not NT_kids:
-        # Then the branch terminates here
-        depth += 1
-        nodes += 1
+        # Append codon to the genome.
+        genome.append(codon)
+
+        # Add children to the derivation tree.
+        first = arena.expand(node, codon, production, depth)
+
+        # Push children in reverse order so that the leftmost child is
+        # visited next.
+        stack.extend(range(len(arena.symbol) - 1, first - 1, -1))
+
+        if not prod_arity[production]:
+            # Then the branch terminates here
+            nodes += 1
+
+            if not node:
+                # The current node terminates.
+                tree_depth += 1
+
+            if depth + 1 > max_depth:
+                # Set new maximum depth
+                max_depth = depth + 1
+
+        elif depth > max_depth:
+            # Set new maximum depth
+            max_depth = depth
+
+    # Set the codon and depth of the current node.
+    tree.codon, tree.depth = arena.codon[0], depths[0]
+
+    if isinstance(tree, ArenaTree):
+        # Point the current node at the new arena.
+        tree.arena, tree.index, tree.children = arena, 0, None
 
-    if depth > max_depth:
-        # Set new maximum depth
-        max_depth = depth
+    else:
+        # Set the children of the current node as views of the arena.
+        tree.children = [ArenaTree(arena, child, tree, tree.depth + 1 if
+                                   arena.n_children[child] else 1)
+                         for child in range(1, 1 + arena.n_children[0])]
+
+    # Clear the cached hashes and indexes of the changed tree.
+    tree.invalidate()
 
-    return genome, output, nodes, depth, max_depth
+    return genome, output, nodes, tree_depth, max_depth
 
 
 def generate_codon(chosen_prod, productions):
@@ -274,6 +317,9 @@ def pi_random_derivation(tree, max_depth):
                 # Insert new child into the correct position in the queue.
                 queue.insert(chosen + i, [child, recur_child])
 
+    # Clear the cached hashes and indexes of the changed tree.
+    tree.invalidate()
+
     # genome, output, invalid, depth, and nodes can all be generated by
     # recursing through the tree once.
     _, output, invalid, depth, \
@@ -377,6 +423,9 @@ def pi_grow(tree, max_depth):
                 # Insert new child into the correct position in the queue.
                 queue.insert(chosen + i, [child, recur_child])
 
+    # Clear the cached hashes and indexes of the changed tree.
+    tree.invalidate()
+
     # genome, output, invalid, depth, and nodes can all be generated by
     # recursing through the tree once.
     _, output, invalid, depth, \
@@ -384,3 +433,214 @@ def pi_grow(tree, max_depth):
                                [], [])
 
     return genome, output, nodes, depth
+
+
+def unrank_derivation(NT, rank, depth=None, size=None, max_depth=None):
+    """
+    Returns the derivation tree of a given rank among all distinct trees of
+    exactly a given depth, or of exactly a given size and at most a given
+    depth, which can be derived from a non-terminal, as counted by
+    representation.grammar.Grammar.count_trees_by_depth and
+    count_trees_by_size. Every rank gives a different tree, so drawing
+    distinct ranks uniformly at random samples distinct trees uniformly at
+    random.
+
+    :param NT: The non-terminal at the root of the tree.
+    :param rank: The rank of the tree, from 0 to the number of trees - 1.
+    :param depth: The exact depth of the tree.
+    :param size: The exact size of the tree, if no depth is given.
+    :param max_depth: The maximum depth of a tree of a given size, or None
+    for any depth.
+    :return: The list of (non-terminal, production choice index) of every
+    non-terminal node of the tree, in depth-first order.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+
+    if depth is not None:
+        # Make sure that the table of counts reaches the required depth.
+        grammar.count_trees_by_depth(NT, depth)
+
+        # Stack of nodes still to be derived. Each node is given as its
+        # non-terminal, its depth, whether its depth is exact or at most
+        # the given depth, and its rank among all such trees.
+        stack = [(NT, depth, True, rank)]
+
+    else:
+        # Make sure that the tables of counts reach the required size.
+        grammar.count_trees_by_size(NT, size, max_depth)
+
+        # Stack of nodes still to be derived. Each node is given as its
+        # non-terminal, its size, its maximum depth and its rank among all
+        # such trees.
+        stack = [(NT, size, max_depth, rank)]
+
+    choices, by_depth = [], depth is not None
+
+    while stack:
+        NT, bound, limit, rank = stack.pop()
+
+        key = (NT, bound, limit, by_depth)
+
+        if key not in grammar.choice_counts:
+            # Find the cumulative numbers of trees derived from each
+            # production choice of the current node.
+            grammar.choice_counts[key] = list(accumulate(
+                [count_choice_trees(NTs, bound, limit, by_depth) for NTs in
+                 grammar.choice_NTs[NT]]))
+
+        # Find the production choice whose block of ranks contains the rank
+        # of the current node.
+        counts = grammar.choice_counts[key]
+        i = bisect_right(counts, rank)
+
+        if i:
+            # Skip over all trees derived from the previous choices.
+            rank -= counts[i - 1]
+
+        choices.append((NT, i))
+
+        # Find the bounds and ranks of the children of the current node.
+        children = derivation_children(grammar.choice_NTs[NT][i], bound,
+                                       limit, rank, by_depth)
+
+        # Derive the children of the current node from the leftmost child.
+        stack.extend(reversed(children))
+
+    return choices
+
+
+def count_choice_trees(NTs, bound, limit, by_depth):
+    """
+    Returns the number of trees which can be derived from a production
+    choice.
+
+    :param NTs: The non-terminal children of the production choice.
+    :param bound: The depth or size of the trees.
+    :param limit: For a depth, whether the depth of the trees is exact or
+    an upper bound. For a size, the maximum depth of the trees.
+    :param by_depth: Whether trees are counted by depth or by size.
+    :return: The number of trees.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+
+    if not by_depth:
+        # The children have at most one less depth, and share one node
+        # fewer than the tree.
+        child_depth = limit - 1 if limit is not None else None
+
+        return grammar.size_splits[child_depth][NTs][bound - 1]
+
+    elif not NTs:
+        # The choice derives a single tree of depth 2.
+        return int(bound == 2 if limit else bound >= 2)
+
+    # The children can derive any trees of at most one less depth.
+    count, shallower = 1, 1
+
+    for child in NTs:
+        count *= grammar.depth_counts[child][bound - 1]
+        shallower *= grammar.depth_counts[child][bound - 2]
+
+    if limit:
+        # Only count trees of exactly the given depth.
+        count -= shallower
+
+    return count
+
+
+def derivation_children(NTs, bound, limit, rank, by_depth):
+    """
+    Given the non-terminal children of a production choice and the rank of
+    a tree among all trees which can be derived from that choice, returns
+    the bounds and ranks of the children of the tree.
+
+    :param NTs: The non-terminal children of the production choice.
+    :param bound: The depth or size of the tree.
+    :param limit: For a depth, whether the depth of the tree is exact or
+    an upper bound. For a size, the maximum depth of the tree.
+    :param rank: The rank of the tree among all trees derived from the
+    production choice.
+    :param by_depth: Whether trees are counted by depth or by size.
+    :return: The list of (non-terminal, bound, limit, rank) of each child.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+
+    if by_depth:
+        depth_counts = grammar.depth_counts
+
+        if limit:
+            # The tree has an exact depth if any child has exactly one less
+            # depth. Trees are split into blocks by the first such child,
+            # all children before it have at most two less depth.
+            blocks = [[(child, bound - 2, False) if j < k else
+                       (child, bound - 1, j == k) for j, child in
+                       enumerate(NTs)] for k in range(len(NTs))]
+
+        else:
+            # All children have at most one less depth than the tree.
+            blocks = [[(child, bound - 1, False) for child in NTs]]
+
+        for block in blocks:
+            # Find the numbers of trees of each child.
+            counts = []
+
+            for child, child_depth, child_exact in block:
+                if child_exact:
+                    counts.append(depth_counts[child][child_depth] -
+                                  depth_counts[child][child_depth - 1])
+
+                else:
+                    counts.append(depth_counts[child][child_depth])
+
+            count = 1
+
+            for child_count in counts:
+                count *= child_count
+
+            if rank < count:
+                # The rank is in this block. Split the rank between the
+                # children, the last child varying fastest.
+                children = []
+
+                for (child, child_depth, child_exact), child_count in \
+                        reversed(list(zip(block, counts))):
+                    children.append((child, child_depth, child_exact,
+                                     rank % child_count))
+                    rank //= child_count
+
+                return children[::-1]
+
+            rank -= count
+
+        # The choice has no non-terminal children.
+        return []
+
+    else:
+        # The children have at most one less depth, and share one node
+        # fewer than the tree.
+        child_depth = limit - 1 if limit is not None else None
+        splits, nodes = grammar.size_splits[child_depth], bound - 1
+
+        children = []
+
+        for k, child in enumerate(NTs):
+            counts = grammar.size_counts[child_depth][child]
+            rest = splits[NTs[k + 1:]]
+
+            for j in range(1, nodes + 1):
+                # The k-th child has j nodes, the following children have
+                # the rest.
+                count = counts[j] * rest[nodes - j]
+
+                if rank < count:
+                    children.append((child, j, child_depth,
+                                     rank // rest[nodes - j]))
+                    rank, nodes = rank % rest[nodes - j], nodes - j
+                    break
+
+                rank -= count
+
+        return children
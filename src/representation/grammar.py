@@ -3,6 +3,7 @@ from re import DOTALL, MULTILINE, finditer, match
 from sys import maxsize
 
 from algorithm.parameters import params
+from representation.compiled_grammar import CompiledGrammar
 
 
 class Grammar(object):
@@ -64,6 +65,10 @@ class Grammar(object):
         # Enables faster tree operations.
         self.set_grammar_properties()
 
+        # Initialise the tables of the numbers of trees which can be derived
+        # from each non-terminal.
+        self.set_derivation_counts()
+
         # Calculate the total number of derivation tree permutations and
         # combinations that can be created by a grammar at a range of depths.
         self.check_permutations()
@@ -85,6 +90,9 @@ class Grammar(object):
             # subtrees.
             self.find_concatenation_NTs()
 
+        # Build flat integer tables of the grammar for fast genome mapping.
+        self.compiled = CompiledGrammar(self)
+
     def read_bnf_file(self, file_name):
         """
         Read a grammar file in BNF format. Parses the grammar and saves a
@@ -475,91 +483,163 @@ class Grammar(object):
             return self.permutations[depth]
 
         else:
-            # Calculate permutations at the requested depth.
-            # Initialise empty data arrays.
-            pos, depth_per_symbol_trees, productions = 0, {}, []
-
-            for NT in self.non_terminals:
-                # Iterate over all non-terminals to fill out list of
-                # productions which contain non-terminal choices.
-                a = self.non_terminals[NT]
-
-                for rule in self.rules[a['id']]['choices']:
-                    if rule['NT_kids']:
-                        productions.append(rule)
-
-            # Get list of all production choices from the start symbol.
-            start_symbols = self.rules[self.start_rule["symbol"]]['choices']
-
-            for choice in productions:
-                # Generate a list of the symbols of each production choice
-                key = str([sym['symbol'] for sym in choice['choice']])
-
-                # Initialise permutations dictionary with the list
-                depth_per_symbol_trees[key] = {}
-
-            for i in range(2, depth + 1):
-                # Find all the possible permutations from depth of min_path up
-                # to a specified depth
-
-                for choice in productions:
-                    # Iterate over all production choices
-                    sym_pos = 1
-
-                    for j in choice['choice']:
-                        # Iterate over all symbols in a production choice.
-                        symbol_arity_pos = 0
-
-                        if j["type"] == "NT":
-                            # We are only interested in non-terminal symbols
-                            for child in self.rules[j["symbol"]]['choices']:
-                                # Iterate over all production choices for
-                                # each NT symbol in the original choice.
-
-                                if len(child['choice']) == 1 and \
-                                        child['choice'][0]["type"] == "T":
-                                    # If the child choice leads directly to
-                                    # a single terminal, increment the
-                                    # permutation count.
-                                    symbol_arity_pos += 1
-
-                                else:
-                                    # The child choice does not lead
-                                    # directly to a single terminal.
-                                    # Generate a key for the permutations
-                                    # dictionary and increment the
-                                    # permutations count there.
-                                    key = [sym['symbol'] for sym in
-                                           child['choice']]
-                                    if (i - 1) in depth_per_symbol_trees[
-                                        str(key)].keys():
-                                        symbol_arity_pos += \
-                                            depth_per_symbol_trees[str(key)][
-                                                i - 1]
-
-                            # Multiply original count by new count.
-                            sym_pos *= symbol_arity_pos
-
-                    # Generate new key for the current production choice and
-                    # set the new value in the permutations dictionary.
-                    key = [sym['symbol'] for sym in choice['choice']]
-                    depth_per_symbol_trees[str(key)][i] = sym_pos
-
-            # Calculate permutations for the start symbol.
-            for sy in start_symbols:
-                key = [sym['symbol'] for sym in sy['choice']]
-                if str(key) in depth_per_symbol_trees:
-                    pos += depth_per_symbol_trees[str(key)][depth] if depth in \
-                                                                      depth_per_symbol_trees[
-                                                                          str(
-                                                                              key)] else 0
-                else:
-                    pos += 1
+            # Permutations are counted in steps to the terminals, which is
+            # one less than the depth of the tree.
+            self.count_trees_by_depth(self.start_rule["symbol"], depth + 1)
 
             # Set the overall permutations dictionary for the current depth.
-            self.permutations[depth] = pos
+            self.permutations[depth] = self.depth_counts[
+                self.start_rule["symbol"]][depth + 1]
+
+            return self.permutations[depth]
+
+    def set_derivation_counts(self):
+        """
+        Initialise the tables of the numbers of distinct derivation trees
+        which can be derived from each non-terminal, by depth and by size.
+        The tables are filled in by dynamic programming as larger trees are
+        needed (see count_trees_by_depth and count_trees_by_size).
+
+        The depth of a tree counts its terminals, so the smallest tree (a
+        non-terminal with a single terminal production) has a depth of 2.
+        The size of a tree is its number of non-terminal nodes, i.e. the
+        number of codons used to derive it.
+
+        :return: Nothing.
+        """
+
+        # The non-terminal children of each production choice of each
+        # non-terminal.
+        self.choice_NTs = {NT: [tuple([sym['symbol'] for sym in
+                                       choice['choice'] if
+                                       sym['type'] == "NT"]) for
+                                choice in self.rules[NT]['choices']]
+                           for NT in self.non_terminals}
+
+        # The number of trees of at most a given depth which can be derived
+        # from each non-terminal. No tree has a depth of less than 2.
+        self.depth_counts = {NT: [0, 0] for NT in self.non_terminals}
+
+        # The number of trees of exactly a given size which can be derived
+        # from each non-terminal, by maximum depth (None for any depth),
+        # non-terminal and size.
+        self.size_counts = {}
+
+        # The number of ways in which a sequence of non-terminals can derive
+        # trees of exactly a given size in total, by maximum depth of each
+        # tree, sequence and size. Production choices share the counts of
+        # their sequences of non-terminal children and of all suffixes of
+        # these sequences.
+        self.size_splits = {}
+
+        # The cumulative numbers of trees which can be derived from the
+        # production choices of each non-terminal, by (non-terminal, depth
+        # or size, exact depth or maximum depth, whether counted by depth),
+        # as found by representation.derivation.unrank_derivation.
+        self.choice_counts = {}
+
+    def count_trees_by_depth(self, NT, depth):
+        """
+        Returns the number of distinct derivation trees of exactly a given
+        depth which can be derived from a non-terminal. The table of counts
+        of all non-terminals is extended up to the given depth if needed.
+
+        :param NT: A non-terminal symbol.
+        :param depth: The depth of the trees.
+        :return: The number of trees.
+        """
+
+        while len(self.depth_counts[NT]) <= depth:
+            # Extend the table by one depth for all non-terminals.
+            d = len(self.depth_counts[NT])
+
+            counts = {}
+
+            for rule in self.non_terminals:
+                counts[rule] = 0
+
+                for NTs in self.choice_NTs[rule]:
+                    # The children of each choice can derive any trees of
+                    # at most one less depth.
+                    choice_count = 1
+
+                    for child in NTs:
+                        choice_count *= self.depth_counts[child][d - 1]
+
+                    counts[rule] += choice_count
+
+            for rule in self.non_terminals:
+                self.depth_counts[rule].append(counts[rule])
+
+        return self.depth_counts[NT][depth] - self.depth_counts[NT][depth - 1]
+
+    def count_trees_by_size(self, NT, size, max_depth=None):
+        """
+        Returns the number of distinct derivation trees of exactly a given
+        size and of at most a given depth which can be derived from a
+        non-terminal. The tables of counts of all non-terminals are
+        extended up to the given size if needed.
+
+        :param NT: A non-terminal symbol.
+        :param size: The size of the trees.
+        :param max_depth: The maximum depth of the trees, or None for trees
+        of any depth.
+        :return: The number of trees.
+        """
+
+        if max_depth is not None and max_depth < 2:
+            # No trees are this shallow.
+            return 0
+
+        # The children of each node have at most one less depth.
+        child_depth = max_depth - 1 if max_depth is not None else None
+
+        if max_depth not in self.size_counts:
+            # Initialise the tables for the maximum depth. No tree has a
+            # size of 0, and only the empty sequence has no nodes.
+            self.size_counts[max_depth] = {rule: [0] for rule in
+                                           self.non_terminals}
+
+            self.size_splits[child_depth] = {
+                NTs[i:]: [0] if i < len(NTs) else [1] for rule in
+                self.non_terminals for NTs in self.choice_NTs[rule] for i in
+                range(len(NTs) + 1)}
+
+        counts = self.size_counts[max_depth]
+        splits = self.size_splits[child_depth]
+
+        while len(counts[NT]) <= size:
+            # Extend the tables by one size for all non-terminals. Each node
+            # leaves one node fewer for its children.
+            nodes = len(counts[NT]) - 1
+
+            if len(splits[()]) <= nodes:
+                # Extend the counts of all sequences of children to the
+                # remaining number of nodes, shortest sequences first. The
+                # first child of each sequence has j nodes.
+                for NTs in sorted(splits, key=len):
+                    if not NTs or (child_depth is not None and
+                                   child_depth < 2):
+                        # The sequence is empty, or its non-terminals
+                        # cannot derive any trees.
+                        splits[NTs].append(0)
+                        continue
+
+                    # Make sure that the counts of the first child reach
+                    # the remaining number of nodes.
+                    self.count_trees_by_size(NTs[0], nodes, child_depth)
+                    first = self.size_counts[child_depth][NTs[0]]
+                    rest = splits[NTs[1:]]
+
+                    splits[NTs].append(sum([first[j] * rest[nodes - j] for
+                                            j in range(1, nodes + 1) if
+                                            first[j]]))
+
+            for rule in self.non_terminals:
+                counts[rule].append(sum([splits[NTs][nodes] for NTs in
+                                         self.choice_NTs[rule]]))
 
-            return pos
+        return counts[NT][size]
 
     def get_min_ramp_depth(self):
         """
@@ -1,3 +1,5 @@
+from copy import copy
+
 import numpy as np
 
 from algorithm.mapper import mapper
@@ -7,9 +9,19 @@ from algorithm.parameters import params
 class Individual(object):
     """
     A GE individual.
+
+    Individuals use __slots__ rather than a per-instance dict, and genomes
+    are stored as arrays of C ints (array('i')) rather than lists of Python
+    ints, so that large populations stay small in memory.
     """
 
-    def __init__(self, genome, ind_tree, map_ind=True):
+    __slots__ = ('phenotype', 'genome', 'tree', 'nodes', 'invalid', 'depth',
+                 'used_codons', 'fitness', 'runtime_error', 'name',
+                 'checkpoints', 'training_fitness', 'test_fitness',
+                 'phenotype_original', 'phenotype_consec_consts',
+                 'opt_consts')
+
+    def __init__(self, genome, ind_tree, map_ind=True, checkpoints=None):
         """
         Initialise an instance of the individual class (i.e. create a new
         individual).
@@ -19,13 +31,26 @@ class Individual(object):
         of the representation.tree.Tree class.
         :param map_ind: A boolean flag that indicates whether or not an
         individual needs to be mapped.
+        :param checkpoints: An optional list of genome mapper checkpoints
+        from a parent individual which are valid for the given genome (see
+        get_checkpoints). Mapping resumes from the last of these.
         """
 
+        # Checkpoints of the genome mapper are only recorded if specified.
+        self.checkpoints = None
+
         if map_ind:
             # The individual needs to be mapped from the given input
             # parameters.
+
+            if params['MAPPING_CHECKPOINT_STEP'] and \
+                    params['GENOME_OPERATIONS'] and genome:
+                # Record mapper checkpoints, resuming from any given.
+                self.checkpoints = list(checkpoints or [])
+
             self.phenotype, self.genome, self.tree, self.nodes, self.invalid, \
-            self.depth, self.used_codons = mapper(genome, ind_tree)
+            self.depth, self.used_codons = mapper(genome, ind_tree,
+                                                  self.checkpoints)
 
         else:
             # The individual does not need to be mapped.
@@ -89,6 +114,22 @@ class Individual(object):
         return ("Individual: " +
                 str(self.phenotype) + "; " + str(self.fitness))
 
+    def get_checkpoints(self, index):
+        """
+        Return the genome mapper checkpoints of the individual which remain
+        valid for a genome which only differs from the genome of this
+        individual at or after the given codon index.
+
+        :param index: The index of the first codon which has been changed.
+        :return: A list of valid checkpoints, or None if the individual
+        has no checkpoints.
+        """
+
+        if not self.checkpoints:
+            return None
+
+        return [c for c in self.checkpoints if c[0] <= index]
+
     def deep_copy(self):
         """
         Copy an individual and return a unique version of that individual.
@@ -104,7 +145,7 @@ class Individual(object):
             new_tree = None
 
         # Create a copy of self by initialising a new individual.
-        new_ind = Individual(self.genome.copy(), new_tree, map_ind=False)
+        new_ind = Individual(copy(self.genome), new_tree, map_ind=False)
 
         # Set new individual parameters (no need to map genome to new
         # individual).
@@ -113,6 +154,9 @@ class Individual(object):
         new_ind.used_codons = self.used_codons
         new_ind.runtime_error = self.runtime_error
 
+        # Checkpoints are immutable, so can be shared between copies.
+        new_ind.checkpoints = self.checkpoints
+
         return new_ind
 
     def evaluate(self):
@@ -1,3 +1,5 @@
+from weakref import WeakValueDictionary
+
 from algorithm.parameters import params
 
 
@@ -19,6 +21,11 @@ class Tree:
         self.children = []
         self.snippet = None
 
+        # Cached structural hash of the subtree and index of its
+        # non-terminal nodes. Both are cleared by invalidate.
+        self._hash = None
+        self._index = None
+
     def __str__(self):
         """
         Builds a string of the current tree.
@@ -62,6 +69,9 @@ class Tree:
 
         tree_copy.snippet = self.snippet
 
+        # The copy has the same structure.
+        tree_copy._hash = self._hash
+
         for child in self.children:
             # Recurse through all children.
             new_child = child.__copy__()
@@ -83,19 +93,22 @@ class Tree:
         :return: True if self == other.
         """
 
-        # Get attributes of self and other.
-        a_self, a_other = vars(self), vars(other)
-
-        # Don't look at the children as they are class instances themselves.
-        taboo = ["parent", "children", "snippet", "id"]
-        self_no_kids = {k: v for k, v in a_self.items() if k not in taboo}
-        other_no_kids = {k: v for k, v in a_other.items() if k not in taboo}
+        # Get attributes of self and other. Don't look at the parent,
+        # children or snippet as they are class instances themselves. Only
+        # the attributes of the node itself are compared, so that trees
+        # can be compared with views of a representation.tree_arena.TreeArena.
+        self_no_kids = (self.root, self.codon, self.depth)
+        other_no_kids = (other.root, other.codon, other.depth)
 
         # Compare attributes
         if self_no_kids != other_no_kids:
             # Attributes are not the same.
             return False
 
+        elif self.structural_hash() != other.structural_hash():
+            # The structures of the trees are not the same.
+            return False
+
         else:
             # Attributes are the same
             child_list = [self.children, other.children]
@@ -115,6 +128,105 @@ class Tree:
 
         return same
 
+    def get_cached_hash(self):
+        """
+        Return the structural hash of the tree if it is known without
+        traversing the tree.
+
+        :return: The structural hash of the tree, or None.
+        """
+
+        return self._hash
+
+    def structural_hash(self):
+        """
+        Returns a structural (Merkle) hash of the tree, i.e. a hash of the
+        root and codon of the current node and the structural hashes of its
+        children. Trees with the same structure and codons have the same
+        structural hash, regardless of the depths of their nodes.
+
+        Hashes are cached on every node, so only nodes which have been
+        changed since the last call (see invalidate) are hashed again. Any
+        code which changes the children or codon of a node must therefore
+        call invalidate, as __eq__ relies on the cached hashes.
+
+        The hash is only used to compare trees. Duplicate individuals are
+        detected by phenotype when they are evaluated (see
+        fitness.evaluation.check_individual).
+
+        :return: The structural hash of the tree.
+        """
+
+        # Hash all nodes without a cached hash bottom-up, using an explicit
+        # stack rather than recursion.
+        stack = [self]
+
+        while stack:
+            node = stack[-1]
+
+            if node.get_cached_hash() is not None:
+                # The node has already been hashed.
+                stack.pop()
+                continue
+
+            unhashed = [child for child in node.children if
+                        child.get_cached_hash() is None]
+
+            if unhashed:
+                # Hash all children first.
+                stack.extend(unhashed)
+
+            else:
+                stack.pop()
+                node._hash = hash((node.root, node.codon, tuple(
+                    [child.get_cached_hash() for child in node.children])))
+
+        return self.get_cached_hash()
+
+    def invalidate(self):
+        """
+        Clear the cached structural hash and node index of the current node
+        and all of its ancestors. Must be called whenever the children or
+        codon of a node are changed.
+
+        :return: Nothing.
+        """
+
+        node = self
+
+        while node is not None:
+            node._hash, node._index = None, None
+            node = node.parent
+
+    def get_label_index(self):
+        """
+        Returns an index of all non-terminal nodes in the tree, by label.
+        Each label maps to the list of matching nodes in the same order as
+        given by get_target_nodes. The index is cached until the tree is
+        changed (see invalidate).
+
+        :return: A dict of lists of nodes, keyed by non-terminal label.
+        """
+
+        if self._index is None:
+            non_terminals = params['BNF_GRAMMAR'].non_terminals
+
+            index, stack = {}, [self]
+
+            while stack:
+                # Traverse all non-terminal nodes in depth-first order.
+                node = stack.pop()
+
+                if node.root in non_terminals:
+                    index.setdefault(node.root, []).append(node)
+
+                stack.extend([child for child in reversed(node.children) if
+                              child.root in non_terminals])
+
+            self._index = index
+
+        return self._index
+
     def get_target_nodes(self, array, target=None):
         """
         Returns the all NT nodes which match the target NT list in a
@@ -251,3 +363,324 @@ class Tree:
                       child.root)
             else:
                 child.print_tree()
+
+
+class SharedTree(object):
+    """
+    An immutable, hash-consed derivation tree node. Used in place of the
+    representation.tree.Tree class if params['HASH_CONS_TREES'] is set.
+
+    All structurally identical subtrees are a single shared instance, so
+    identical subtrees across a whole population are only stored once.
+    Since nodes are never changed, trees are copied by reference, and are
+    changed by copying only the path from the root to the changed node
+    (see replace).
+
+    Nodes have no parent or depth, since a shared node may appear at many
+    places in many trees. Instead, nodes in a tree are addressed by paths,
+    i.e. tuples of child indexes from the root.
+
+    Each node caches the information about its subtree which is needed to
+    map an individual from a tree: the phenotype fragment, the maximum
+    depth, the number of nodes, whether or not it is fully expanded, and the
+    number of times each non-terminal occurs in it.
+    """
+
+    __slots__ = ('root', 'codon', 'children', 'phenotype', 'depth', 'nodes',
+                 'invalid', 'NT_counts', '_hash', '__weakref__')
+
+    # Table of all current nodes. Nodes are removed from the table once
+    # they are no longer used by any tree.
+    table = WeakValueDictionary()
+
+    def __new__(cls, root, codon=None, children=()):
+        """
+        Return the shared node with the given root, codon and children,
+        creating it if it does not exist.
+
+        :param root: A symbol from the params['BNF_GRAMMAR'].
+        :param codon: The codon used to expand the node, if any.
+        :param children: A tuple of shared child nodes.
+        :return: The shared node.
+        """
+
+        key = (root, codon, children)
+
+        node = cls.table.get(key)
+
+        if node is not None:
+            # The node already exists.
+            return node
+
+        node = super(SharedTree, cls).__new__(cls)
+        node.root, node.codon, node.children = root, codon, children
+        node._hash = hash(key)
+
+        compiled = params['BNF_GRAMMAR'].compiled
+        NT_id = compiled.NT_ids.get(root)
+
+        if not children:
+            # The node is a leaf. Its depth and number of nodes are those
+            # given by representation.tree.Tree.get_tree_info for a tree
+            # with a single node. Unexpanded non-terminals are invalid.
+            node.phenotype, node.depth, node.nodes = root, 2, 2
+            node.invalid = NT_id is not None
+            NT_counts = [0] * compiled.n_NTs
+
+        else:
+            node.phenotype = "".join([child.phenotype for child in children])
+            node.nodes, node.depth, node.invalid = 1, 1, False
+            NT_counts, NT_children = [0] * compiled.n_NTs, False
+
+            for child in children:
+                node.invalid = node.invalid or child.invalid
+
+                if child.children:
+                    # Add the nodes and depth of the expanded child.
+                    node.nodes += child.nodes
+                    node.depth = max(node.depth, child.depth + 1)
+
+                if child.root in compiled.NT_ids:
+                    NT_children = True
+                    NT_counts = [a + b for a, b in zip(NT_counts,
+                                                       child.NT_counts)]
+
+            if not NT_children:
+                # The node has only terminal children, which count as a
+                # single extra node.
+                node.nodes += 1
+                node.depth = 2
+
+        if NT_id is not None:
+            # Count the current node.
+            NT_counts[NT_id] += 1
+
+        node.NT_counts = tuple(NT_counts)
+
+        cls.table[key] = node
+
+        return node
+
+    def __hash__(self):
+        return self._hash
+
+    def structural_hash(self):
+        """
+        Shared trees are interned, so their hash is computed once when the
+        node is created.
+
+        :return: The structural hash of the tree.
+        """
+
+        return self._hash
+
+    def __reduce__(self):
+        """
+        Nodes are pickled by their contents, and are shared again when
+        unpickled.
+
+        :return: The arguments needed to recreate the node.
+        """
+
+        return SharedTree, (self.root, self.codon, self.children)
+
+    def __copy__(self):
+        """
+        Nodes are immutable, so a copy of a tree is the tree itself.
+
+        :return: self.
+        """
+
+        return self
+
+    def __str__(self):
+        """
+        Builds a string of the current tree.
+
+        :return: A string of the current tree.
+        """
+
+        return "(" + " ".join([self.root] + [str(child) if child.children
+                                             else child.root for child in
+                                             self.children]) + ")"
+
+    @classmethod
+    def from_tree(cls, tree):
+        """
+        Create a shared tree from an instance of the
+        representation.tree.Tree class, or from any tree with the same
+        interface. Returns shared trees unchanged.
+
+        :param tree: A derivation tree.
+        :return: The equivalent shared tree.
+        """
+
+        if isinstance(tree, SharedTree):
+            return tree
+
+        # Build the tree bottom-up, using an explicit stack rather than
+        # recursion. Each item on the stack is a node and a flag for
+        # whether or not its children have been built.
+        built, stack = [], [(tree, False)]
+
+        while stack:
+            node, done = stack.pop()
+
+            if done:
+                # All children have been built, build the node.
+                n_children = len(node.children)
+                children = tuple(built[len(built) - n_children:])
+                del built[len(built) - n_children:]
+
+                built.append(cls(node.root, node.codon, children))
+
+            else:
+                stack.append((node, True))
+                stack.extend([(child, False) for child in
+                              reversed(node.children)])
+
+        return built[0]
+
+    def get_node(self, path):
+        """
+        Return the node at a given path.
+
+        :param path: A tuple of child indexes from the root.
+        :return: The node at the given path.
+        """
+
+        node = self
+
+        for i in path:
+            node = node.children[i]
+
+        return node
+
+    def count_nodes(self, NT=None):
+        """
+        Count the matching non-terminal nodes in the tree, i.e. the length
+        of the list returned by representation.tree.Tree.get_target_nodes.
+
+        :param NT: The non-terminal to match. Matches any non-terminal if
+        None.
+        :return: The number of matching nodes.
+        """
+
+        if NT is None:
+            return sum(self.NT_counts)
+
+        return self.NT_counts[params['BNF_GRAMMAR'].compiled.NT_ids[NT]]
+
+    def find_node(self, index, NT=None):
+        """
+        Find the path to the node which would be at a given index of the
+        list returned by representation.tree.Tree.get_target_nodes, i.e. the
+        index-th matching non-terminal in depth-first order. Only the path
+        to the node is traversed.
+
+        :param index: The index of the matching node.
+        :param NT: The non-terminal to match. Matches any non-terminal if
+        None.
+        :return: The path to the node, as a tuple of child indexes.
+        """
+
+        non_terminals = params['BNF_GRAMMAR'].non_terminals
+
+        node, path = self, []
+
+        while True:
+            if node.root == NT or (NT is None and node.root in non_terminals):
+                # The current node matches.
+                if index == 0:
+                    return tuple(path)
+
+                index -= 1
+
+            for i, child in enumerate(node.children):
+                # Find the child whose subtree holds the matching node.
+                n_matches = child.count_nodes(NT)
+
+                if index < n_matches:
+                    node = child
+                    path.append(i)
+                    break
+
+                index -= n_matches
+
+    def replace(self, path, subtree):
+        """
+        Replace the node at a given path with a new subtree. Only the nodes
+        on the path are copied, all other nodes are shared with the current
+        tree.
+
+        :param path: A tuple of child indexes from the root.
+        :param subtree: The new shared subtree.
+        :return: The new tree.
+        """
+
+        # Find all nodes on the path.
+        nodes = [self]
+
+        for i in path[:-1]:
+            nodes.append(nodes[-1].children[i])
+
+        for node, i in zip(reversed(nodes), reversed(path)):
+            # Copy each node on the path with its new child.
+            subtree = SharedTree(node.root, node.codon, node.children[:i] +
+                                 (subtree,) + node.children[i + 1:])
+
+        return subtree
+
+    def get_node_labels(self, labels):
+        """
+        Adds the non-terminal roots of all nodes in the tree to a set.
+
+        :param labels: The set of roots of all nodes in the tree.
+        :return: The set of roots of all nodes in the tree.
+        """
+
+        symbols = params['BNF_GRAMMAR'].compiled.symbols
+
+        labels.update([symbols[i] for i, count in enumerate(self.NT_counts)
+                       if count])
+
+        return labels
+
+    def get_tree_info(self, nt_keys, genome, output, invalid=False,
+                      max_depth=0, nodes=0):
+        """
+        Returns all necessary information on a tree required to generate an
+        individual. Gives the same results as
+        representation.tree.Tree.get_tree_info, mostly from the cached
+        information of the root node.
+
+        :param genome: The list of all codons in a subtree.
+        :param output: The list of all terminal nodes in a subtree. This is
+        joined to become the phenotype.
+        :param invalid: A boolean flag for whether a tree is fully expanded.
+        True if invalid (unexpanded).
+        :param nt_keys: The list of all non-terminals in the grammar.
+        :param nodes: the number of nodes in a tree.
+        :param max_depth: The maximum depth of any node in the tree.
+        :return: genome, output, invalid, max_depth, nodes.
+        """
+
+        # Traverse the tree to build the genome.
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            if node.codon:
+                # If the current node has a codon, append it to the genome.
+                genome.append(node.codon)
+
+            stack.extend([child for child in reversed(node.children) if
+                          child.children])
+
+        if self.children:
+            # Append the phenotype of the tree.
+            output.append(self.phenotype)
+
+        return genome, output, invalid or self.invalid, \
+            max(max_depth, self.depth), nodes + self.nodes
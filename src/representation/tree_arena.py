@@ -0,0 +1,474 @@
+from array import array
+
+from algorithm.parameters import params
+from representation.tree import Tree
+
+
+class TreeArena(object):
+    """
+    A derivation tree stored in a flat arena of parallel integer arrays,
+    rather than as one representation.tree.Tree object per node.
+
+    Nodes are numbered in order of creation, with the root at index 0. Each
+    node stores its symbol id (from the compiled grammar,
+    representation.compiled_grammar.CompiledGrammar), its codon (-1 if it
+    has none), its depth, the index of its parent (-1 for the root), and the
+    index and number of its children. All children of a node are created
+    together when the node is expanded, so they always occupy a contiguous
+    block of the arena.
+
+    Trees are always derived depth-first, so the descendants of a node
+    occupy a contiguous block of the arena, starting from its first child
+    (see subtree_end).
+
+    An arena is never changed once it has been built, so it can be shared
+    between any number of copies of a tree. Trees are accessed through
+    instances of the ArenaTree class, which behave like instances of the
+    representation.tree.Tree class.
+    """
+
+    def __init__(self, root):
+        """
+        Initialise an arena with a single unexpanded root node.
+
+        :param root: The symbol id of the root node.
+        """
+
+        self.symbol = array('i', [root])
+        self.codon = array('i', [-1])
+        self.depth = array('i', [1])
+        self.parent = array('i', [-1])
+        self.first_child = array('i', [-1])
+        self.n_children = array('i', [0])
+
+        # Structural hashes of all nodes, only computed when first needed.
+        self.hashes = None
+
+    def expand(self, node, codon, production, depth):
+        """
+        Expand a node of the arena using a production from the compiled
+        grammar. New nodes are created for all symbols of the production.
+
+        :param node: The index of the node to be expanded.
+        :param codon: The codon used to select the production.
+        :param production: The index of the chosen production in the
+        production tables of the compiled grammar.
+        :param depth: The depth of the expanded node.
+        :return: The index of the first child of the node.
+        """
+
+        compiled = params['BNF_GRAMMAR'].compiled
+
+        symbols = compiled.prod_symbols[compiled.prod_start[production]:
+                                        compiled.prod_start[production + 1]]
+        first, n_children = len(self.symbol), len(symbols)
+
+        self.codon[node] = codon
+        self.first_child[node], self.n_children[node] = first, n_children
+
+        self.symbol.extend(symbols)
+        self.codon.extend([-1] * n_children)
+        self.depth.extend([depth + 1] * n_children)
+        self.parent.extend([node] * n_children)
+        self.first_child.extend([-1] * n_children)
+        self.n_children.extend([0] * n_children)
+
+        return first
+
+    def get_hashes(self):
+        """
+        Return the structural hashes of all nodes in the arena, as given by
+        representation.tree.Tree.structural_hash. Since children are always
+        created after their parents, all hashes are computed in a single
+        pass backwards through the arena.
+
+        :return: An array of the structural hashes of all nodes.
+        """
+
+        if self.hashes is None:
+            symbols = params['BNF_GRAMMAR'].compiled.symbols
+            first_child, n_children = self.first_child, self.n_children
+
+            hashes = [0] * len(self.symbol)
+
+            for node in range(len(self.symbol) - 1, -1, -1):
+                first = first_child[node]
+
+                hashes[node] = hash((symbols[self.symbol[node]],
+                                     self.codon[node] if
+                                     self.codon[node] >= 0 else None,
+                                     tuple(hashes[first:first +
+                                                  n_children[node]])))
+
+            self.hashes = array('q', hashes)
+
+        return self.hashes
+
+    def subtree_end(self, node):
+        """
+        Find the end of the block of the arena which holds all descendants
+        of a node. This is the end of the children of the last expanded
+        node in the subtree.
+
+        :param node: The index of a node.
+        :return: The index after the last descendant of the node.
+        """
+
+        first_child, n_children = self.first_child, self.n_children
+
+        end = first_child[node] + n_children[node]
+
+        while n_children[node]:
+            # Find the last expanded child of the current node.
+            for child in range(first_child[node] + n_children[node] - 1,
+                               first_child[node] - 1, -1):
+                if n_children[child]:
+                    break
+
+            else:
+                # No children of the current node have been expanded.
+                break
+
+            node = child
+            end = first_child[node] + n_children[node]
+
+        return end
+
+    def preorder(self, node):
+        """
+        Iterate over all nodes in the subtree of a node, in depth-first
+        order.
+
+        :param node: The index of a node.
+        :return: A generator of node indexes.
+        """
+
+        first_child, n_children = self.first_child, self.n_children
+
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+
+            yield node
+
+            # Push children in reverse order so that the leftmost child is
+            # visited next.
+            stack.extend(range(first_child[node] + n_children[node] - 1,
+                               first_child[node] - 1, -1))
+
+
+class ArenaTree(Tree):
+    """
+    A view of a node of a TreeArena which behaves like an instance of the
+    representation.tree.Tree class.
+
+    The children of a view are only created when they are first accessed.
+    Until then, the whole subtree of the view is exactly the subtree stored
+    in the arena, and is traversed directly from the arena by
+    get_node_labels, get_target_nodes, get_tree_info and __copy__. Once
+    created, children can be changed in place like those of any other tree.
+    """
+
+    def __init__(self, arena, index, parent, depth=1):
+        """
+        Initialise a view of a node of an arena.
+
+        :param arena: An instance of the TreeArena class.
+        :param index: The index of the node in the arena.
+        :param parent: The parent of the node. None if node is tree root.
+        :param depth: The depth of the node.
+        """
+
+        self.arena, self.index = arena, index
+
+        self.parent = parent
+        self.codon = arena.codon[index] if arena.codon[index] >= 0 else None
+        self.depth = depth
+        self.root = params['BNF_GRAMMAR'].compiled.symbols[
+            arena.symbol[index]]
+        self.snippet = None
+
+        # The children of the node, only created when first accessed.
+        self._children = None
+
+        # Cached structural hash and node index.
+        self._hash = None
+        self._index = None
+
+    @property
+    def children(self):
+        """
+        The children of the node, as views of the arena. Expanded children
+        take their depth from the current node, as all other nodes keep the
+        default depth of representation.tree.Tree.
+
+        :return: The list of children of the node.
+        """
+
+        if self._children is None:
+            arena = self.arena
+            first = arena.first_child[self.index]
+
+            self._children = [ArenaTree(arena, child, self,
+                                        self.depth + 1 if
+                                        arena.n_children[child] else 1)
+                              for child in range(first, first +
+                                                 arena.n_children[self.index])]
+
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    def __copy__(self):
+        """
+        Creates a new unique copy of self. A copy of an unchanged subtree is
+        a new view of the same arena.
+
+        :return: A new unique copy of self.
+        """
+
+        if self._children is not None:
+            # The children may have been changed, copy node by node.
+            return super(ArenaTree, self).__copy__()
+
+        tree_copy = ArenaTree(self.arena, self.index, self.parent, self.depth)
+
+        # Set node parameters.
+        tree_copy.codon, tree_copy.snippet = self.codon, self.snippet
+        tree_copy._hash = self._hash
+
+        return tree_copy
+
+    def get_cached_hash(self):
+        """
+        Return the structural hash of the tree if it is known without
+        traversing the tree. The hashes of unchanged subtrees are read from
+        the arena.
+
+        :return: The structural hash of the tree, or None.
+        """
+
+        if self._hash is None and self._children is None:
+            self._hash = self.arena.get_hashes()[self.index]
+
+        return self._hash
+
+    def get_label_index(self):
+        """
+        Returns an index of all non-terminal nodes in the tree, by label.
+        For an unchanged subtree, the index is built from the arena, and
+        the views of indexed nodes are only created when they are accessed.
+
+        :return: A dict of sequences of nodes, keyed by non-terminal label.
+        """
+
+        if self._children is not None:
+            # The children may have been changed.
+            return super(ArenaTree, self).get_label_index()
+
+        if self._index is None:
+            arena, compiled = self.arena, params['BNF_GRAMMAR'].compiled
+            symbols, is_NT = compiled.symbols, compiled.is_NT
+
+            index = {}
+
+            for node in arena.preorder(self.index):
+                if is_NT[arena.symbol[node]]:
+                    index.setdefault(symbols[arena.symbol[node]],
+                                     []).append(node)
+
+            self._index = {label: ArenaNodes(self, nodes) for label, nodes
+                           in index.items()}
+
+        return self._index
+
+    def get_node_at(self, node):
+        """
+        Return the view of a node in the arena subtree of the current node,
+        creating the views of all nodes on the path to it.
+
+        :param node: The index of a node in the subtree of the current node.
+        :return: The view of the node.
+        """
+
+        arena = self.arena
+
+        # Find the path from the node back up to the current node.
+        path = []
+
+        while node != self.index:
+            path.append(node)
+            node = arena.parent[node]
+
+        tree = self
+
+        for node in reversed(path):
+            # Walk down the path.
+            tree = tree.children[node - arena.first_child[arena.parent[node]]]
+
+        return tree
+
+    def get_target_nodes(self, array, target=None):
+        """
+        Returns the all NT nodes which match the target NT list in a
+        given tree. Only the views of matching nodes and their ancestors
+        are created.
+
+        :param array: The array of all nodes that match the target.
+        :param target: The target nodes to match.
+        :return: The array of all nodes that match the target.
+        """
+
+        if self._children is not None:
+            # The children may have been changed.
+            return super(ArenaTree, self).get_target_nodes(array, target)
+
+        arena, compiled = self.arena, params['BNF_GRAMMAR'].compiled
+        symbols, is_NT = compiled.symbols, compiled.is_NT
+
+        matches = [node for node in arena.preorder(self.index) if
+                   is_NT[arena.symbol[node]] and
+                   symbols[arena.symbol[node]] in target]
+
+        array.extend([self.get_node_at(node) for node in matches])
+
+        return array
+
+    def get_node_labels(self, labels):
+        """
+        Adds the roots of all nodes in the tree to a set.
+
+        :param labels: The set of roots of all nodes in the tree.
+        :return: The set of roots of all nodes in the tree.
+        """
+
+        if self._children is not None:
+            # The children may have been changed.
+            return super(ArenaTree, self).get_node_labels(labels)
+
+        arena, symbols = self.arena, params['BNF_GRAMMAR'].compiled.symbols
+
+        labels.add(self.root)
+
+        if arena.n_children[self.index]:
+            # All descendants are in a single block of the arena.
+            labels.update(symbols[symbol] for symbol in set(
+                arena.symbol[arena.first_child[self.index]:
+                             arena.subtree_end(self.index)]))
+
+        return labels
+
+    def get_tree_info(self, nt_keys, genome, output, invalid=False,
+                      max_depth=0, nodes=0):
+        """
+        Traverses a tree and returns all necessary information on a tree
+        required to generate an individual. Gives the same results as
+        representation.tree.Tree.get_tree_info.
+
+        :param genome: The list of all codons in a subtree.
+        :param output: The list of all terminal nodes in a subtree. This is
+        joined to become the phenotype.
+        :param invalid: A boolean flag for whether a tree is fully expanded.
+        True if invalid (unexpanded).
+        :param nt_keys: The list of all non-terminals in the grammar.
+        :param nodes: the number of nodes in a tree.
+        :param max_depth: The maximum depth of any node in the tree.
+        :return: genome, output, invalid, max_depth, nodes.
+        """
+
+        if self._children is not None:
+            # The children may have been changed.
+            return super(ArenaTree, self).get_tree_info(
+                nt_keys, genome, output, invalid, max_depth, nodes)
+
+        arena, compiled = self.arena, params['BNF_GRAMMAR'].compiled
+        symbols, is_NT = compiled.symbols, compiled.is_NT
+        codons, depths = arena.codon, arena.depth
+        first_child, n_children = arena.first_child, arena.n_children
+
+        if self.parent:
+            # If current node has a parent, increment current depth from
+            # parent depth.
+            self.depth = self.parent.depth + 1
+
+        else:
+            # Current node is tree root, set depth to 1.
+            self.depth = 1
+
+        # Depths in the arena are relative to the current node, since the
+        # subtree may have been moved.
+        offset = self.depth - depths[self.index]
+
+        if is_NT[arena.symbol[self.index]] and not n_children[self.index]:
+            # Current NT has no children. Invalid tree.
+            invalid = True
+
+        for node in arena.preorder(self.index):
+
+            if node != self.index and not n_children[node]:
+                # The node has no children, it is a terminal. Append it to
+                # the phenotype output.
+                output.append(symbols[arena.symbol[node]])
+
+                if is_NT[arena.symbol[node]]:
+                    # Current non-terminal node has no children; invalid
+                    # tree.
+                    invalid = True
+
+                continue
+
+            # Increment number of nodes in tree.
+            nodes += 1
+
+            depth = depths[node] + offset
+
+            if depth > max_depth:
+                # Set new max tree depth.
+                max_depth = depth
+
+            codon = self.codon if node == self.index else codons[node]
+
+            if codon and codon > 0:
+                # If the current node has a codon, append it to the genome.
+                genome.append(codon)
+
+            first = first_child[node]
+
+            if not any(is_NT[arena.symbol[child]] for child in
+                       range(first, first + n_children[node])):
+                # The current node has only terminal children, increment
+                # number of tree nodes.
+                nodes += 1
+
+                # Terminal children increase the current node depth by one.
+                if depth + 1 > max_depth:
+                    # Set new max tree depth.
+                    max_depth = depth + 1
+
+        return genome, output, invalid, max_depth, nodes
+
+
+class ArenaNodes(object):
+    """
+    A sequence of nodes of an ArenaTree, given by their indexes in the
+    arena. The view of each node is only created when it is accessed.
+    """
+
+    def __init__(self, tree, indexes):
+        """
+        Initialise a sequence of nodes.
+
+        :param tree: The view of the root of the subtree holding the nodes.
+        :param indexes: The indexes of the nodes in the arena.
+        """
+
+        self.tree, self.indexes = tree, indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, i):
+        return self.tree.get_node_at(self.indexes[i])
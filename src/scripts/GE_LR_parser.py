@@ -91,6 +91,9 @@ def parse_terminals(target):
                     # Add child to parent.
                     parent.children.append(child)
 
+                    # Clear the cached hashes and indexes of the new tree.
+                    parent.invalidate()
+
                     # Add snippet to snippets repository.
                     trackers.snippets[key] = parent
 
@@ -353,4 +356,4 @@ if __name__ == '__main__':
     set_params(sys.argv[1:], create_files=False)
 
     # Print parsed GE genome.
-    print("\nGenome:\n", params['SEED_INDIVIDUALS'][0].genome)
+    print("\nGenome:\n", list(params['SEED_INDIVIDUALS'][0].genome))
@@ -0,0 +1,55 @@
+""" This program runs a remote fitness evaluation worker for a PonyGE2 run
+    started with the --coordinator parameter. Any number of workers may be
+    run on any number of machines, each of which must hold a copy of
+    PonyGE2 (including the grammars and datasets used by the run).
+
+    Run from the src directory:
+
+        python scripts/ponyge_worker.py --coordinator host:port --authkey key
+
+    The address and key are printed by the run at startup."""
+
+from sys import path
+
+path.append("../src")
+
+from utilities.algorithm.general import check_python_version
+
+check_python_version()
+
+from argparse import ArgumentParser
+
+from utilities.fitness.remote_evaluation import serve
+
+
+def main():
+    """
+    The main function for running a remote worker. Evaluates phenotypes
+    until the run of the coordinator is over.
+
+    :return: Nothing.
+    """
+
+    parser = ArgumentParser(description="Evaluates phenotypes for a PonyGE2 "
+                                        "run started with --coordinator.")
+    parser.add_argument('--coordinator',
+                        type=str,
+                        required=True,
+                        help='The "host:port" address of the coordinator.')
+    parser.add_argument('--authkey',
+                        type=str,
+                        required=True,
+                        help='The key printed by the coordinator.')
+    parser.add_argument('--retry_time',
+                        type=float,
+                        default=60,
+                        help='The number of seconds for which to keep trying '
+                             'to connect to the coordinator.')
+
+    args = parser.parse_args()
+
+    serve(args.coordinator, args.authkey, args.retry_time)
+
+
+if __name__ == "__main__":
+    main()
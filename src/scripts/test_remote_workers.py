@@ -0,0 +1,168 @@
+""" This program tests the evaluation of phenotypes by remote workers (see
+    utilities/fitness/remote_evaluation.py) on the local machine. It starts
+    a coordinator and several instances of scripts/ponyge_worker.py on
+    localhost, stops one of the workers (so that it stops sending
+    heartbeats) while it holds a phenotype, and checks that:
+
+        - the stopped worker is dropped, and its phenotype is evaluated by
+          the other workers,
+        - the phenotypes are shared between all remaining workers, and
+        - all fitnesses are the same as when evaluated locally.
+
+    Requires a POSIX system. Run from the src directory:
+
+        python scripts/test_remote_workers.py"""
+
+from sys import path
+
+path.append("../src")
+
+from utilities.algorithm.general import check_python_version
+
+check_python_version()
+
+import socket
+import sys
+from signal import SIGSTOP
+from subprocess import Popen
+from threading import Thread
+from time import perf_counter, sleep
+
+from algorithm.parameters import params, set_params
+from fitness.evaluation import evaluate_chunk
+from utilities.fitness.remote_evaluation import Coordinator
+
+# Number of workers which keep running, and number of phenotypes evaluated.
+WORKERS = 3
+PHENOTYPES = 200
+
+# Interval in seconds between heartbeats, and maximum numbers of seconds to
+# wait for workers to connect and for the phenotypes to be evaluated.
+HEARTBEAT = 0.2
+CONNECT_TIMEOUT = 60
+EVALUATION_TIMEOUT = 60
+
+
+def check(condition, message):
+    """
+    Raises an error if a test has failed.
+
+    :param condition: Whether the test has passed.
+    :param message: A description of the failure.
+    :return: Nothing.
+    """
+
+    if not condition:
+        s = "scripts.test_remote_workers\nError: %s" % message
+        raise Exception(s)
+
+
+def get_free_port():
+    """
+    :return: A free TCP port on localhost.
+    """
+
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+
+        return sock.getsockname()[1]
+
+
+def start_worker(coordinator):
+    """
+    Starts a remote worker in a new process.
+
+    :param coordinator: The coordinator to which the worker connects.
+    :return: The process of the worker.
+    """
+
+    return Popen([sys.executable, "scripts/ponyge_worker.py",
+                  "--coordinator", coordinator.address,
+                  "--authkey", coordinator.authkey])
+
+
+def wait_for_workers(coordinator, n):
+    """
+    Waits until a given number of workers are connected and ready.
+
+    :param coordinator: The coordinator.
+    :param n: The number of workers.
+    :return: Nothing.
+    """
+
+    start = perf_counter()
+
+    while len(coordinator.workers) < n:
+        check(perf_counter() - start < CONNECT_TIMEOUT,
+              "Only %d of %d remote workers connected."
+              % (len(coordinator.workers), n))
+        sleep(0.05)
+
+
+def main():
+    """
+    Runs the tests.
+
+    :return: Nothing.
+    """
+
+    args = ['--parameters', 'string_match.txt', '--debug', '--silent',
+            '--initialisation', 'uniform_tree',
+            '--worker_heartbeat', str(HEARTBEAT)]
+
+    set_params(args, create_files=False)
+
+    # Evaluate some phenotypes locally.
+    individuals = params['INITIALISATION'](PHENOTYPES)
+    phenotypes = [ind.phenotype for ind in individuals if not ind.invalid]
+    results, _ = evaluate_chunk(list(enumerate(phenotypes)))
+    expected = [result[1:3] for result in results]
+
+    coordinator = Coordinator("localhost:%d" % get_free_port(), None, args)
+
+    workers = [start_worker(coordinator)]
+
+    try:
+        # Find the address of the first worker, then start the others.
+        wait_for_workers(coordinator, 1)
+        [stopped] = list(coordinator.workers)
+
+        workers += [start_worker(coordinator) for _ in range(WORKERS)]
+        wait_for_workers(coordinator, WORKERS + 1)
+
+        # Stop the first worker, so that it stops sending heartbeats. Each
+        # worker is first sent a single phenotype, so the stopped worker
+        # holds one phenotype which must be evaluated by the others.
+        workers[0].send_signal(SIGSTOP)
+
+        # Evaluate all phenotypes, failing if the phenotype held by the
+        # stopped worker is never sent to another worker.
+        remote = []
+        evaluation = Thread(target=lambda: remote.extend(
+            coordinator.evaluate(phenotypes)), daemon=True)
+        evaluation.start()
+        evaluation.join(EVALUATION_TIMEOUT)
+
+        check(not evaluation.is_alive(),
+              "The phenotypes were not all evaluated.")
+        check(stopped not in coordinator.workers,
+              "The stopped remote worker was not dropped.")
+        check(len(coordinator.workers) == WORKERS,
+              "%d running remote workers were dropped." %
+              (WORKERS - len(coordinator.workers)))
+        check(all([throughput is not None for throughput in
+                   coordinator.workers.values()]),
+              "Not all remote workers evaluated phenotypes.")
+        check([result[:2] for result in remote] == expected,
+              "Remote fitnesses differ from local fitnesses.")
+
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+    print("Remote workers passed all tests.")
+
+
+if __name__ == "__main__":
+    main()
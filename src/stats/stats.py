@@ -1,3 +1,4 @@
+from array import array
 from copy import copy
 from sys import stdout
 from time import time
@@ -8,7 +9,8 @@ from utilities.algorithm.NSGA2 import compute_pareto_metrics
 from utilities.algorithm.state import create_state
 from utilities.stats import trackers
 from utilities.stats.file_io import save_best_ind_to_file, \
-    save_first_front_to_file, save_stats_headers, save_stats_to_file
+    save_evaluation_times_to_file, save_first_front_to_file, \
+    save_stats_headers, save_stats_to_file
 from utilities.stats.save_plots import save_pareto_fitness_plot, \
     save_plot_from_data
 
@@ -21,6 +23,13 @@ stats = {
     "runtime_error": 0,
     "unique_inds": len(trackers.cache),
     "unused_search": 0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "cache_evictions": 0,
+    "mapping_cache_hits": 0,
+    "mapping_cache_misses": 0,
+    "persistent_cache_hits": 0,
+    "persistent_cache_misses": 0,
     "ave_genome_length": 0,
     "max_genome_length": 0,
     "min_genome_length": 0,
@@ -37,6 +46,10 @@ stats = {
     "best_fitness": 0,
     "time_taken": 0,
     "total_time": 0,
+    "p50_eval_time": 0,
+    "p95_eval_time": 0,
+    "max_eval_time": 0,
+    "ave_eval_wait": 0,
     "time_adjust": 0
 }
 
@@ -53,6 +66,12 @@ def get_stats(individuals, end=False):
     :return: Nothing.
     """
 
+    if not end or trackers.evaluation_times:
+        # Update the timing stats of all evaluations since the last
+        # generation. At the end of a run, the stats of the last generation
+        # are kept unless individuals have been evaluated since.
+        get_evaluation_stats()
+
     if hasattr(params['FITNESS_FUNCTION'], 'multi_objective'):
         # Multiple objective optimisation is being used.
 
@@ -85,6 +104,13 @@ def get_soo_stats(individuals, end):
     :return: Nothing.
     """
 
+    if end and params['MINI_BATCH_SIZE']:
+        # Final statistics are generated on the full training data, rather
+        # than on the current mini-batch.
+        from fitness.evaluation import rescore
+        params['FITNESS_FUNCTION'].set_mini_batch(None)
+        rescore(individuals)
+
     # Get best individual.
     best = max(individuals)
 
@@ -295,11 +321,20 @@ def update_stats(individuals, end):
 
     # Population Stats
     stats['total_inds'] = params['POPULATION_SIZE'] * (stats['gen'] + 1)
-    stats['runtime_error'] = len(trackers.runtime_error_cache)
+    stats['runtime_error'] = trackers.runtime_errors
     if params['CACHE']:
-        stats['unique_inds'] = len(trackers.cache)
+        stats['unique_inds'] = trackers.cache.unique
         stats['unused_search'] = 100 - stats['unique_inds'] / \
                                  stats['total_inds'] * 100
+        stats['cache_hits'] = trackers.cache.hits
+        stats['cache_misses'] = trackers.cache.misses
+        stats['cache_evictions'] = trackers.cache.evictions
+    if trackers.mapping_cache:
+        stats['mapping_cache_hits'] = trackers.mapping_cache.hits
+        stats['mapping_cache_misses'] = trackers.mapping_cache.misses
+    if trackers.persistent_cache:
+        stats['persistent_cache_hits'] = trackers.persistent_cache.hits
+        stats['persistent_cache_misses'] = trackers.persistent_cache.misses
 
     # Genome Stats
     genome_lengths = [len(i.genome) for i in individuals]
@@ -332,6 +367,54 @@ def update_stats(individuals, end):
         stats['best_fitness'] = trackers.best_ever.fitness
 
 
+def get_evaluation_stats():
+    """
+    Generate the statistics for the time taken by all fitness evaluations
+    since statistics were last generated, and save the slowest evaluations
+    to utilities.trackers.slowest_evaluations. Saves the time taken by each
+    evaluation to a file if params['SAVE_EVALUATION_TIMES'] is specified.
+
+    Evaluations whose time taken is only the average time taken per
+    evaluation of a batch are left out of the percentiles and the slowest
+    evaluations. Statistics which cannot be computed (e.g. if no
+    individuals have been evaluated since statistics were last generated)
+    are set to NaN.
+
+    :return: Nothing.
+    """
+
+    # The evaluations whose time taken is known.
+    timed = [i for i in trackers.evaluation_times if not i[3]]
+
+    if timed:
+        times = [i[1] for i in timed]
+        stats['p50_eval_time'] = np.percentile(times, 50)
+        stats['p95_eval_time'] = np.percentile(times, 95)
+        stats['max_eval_time'] = np.max(times)
+
+    else:
+        stats['p50_eval_time'] = np.nan
+        stats['p95_eval_time'] = np.nan
+        stats['max_eval_time'] = np.nan
+
+    if 'ave_eval_wait' in stats and trackers.evaluation_times:
+        # Time spent waiting for the workers of a pool.
+        stats['ave_eval_wait'] = np.mean([i[2] for i in
+                                          trackers.evaluation_times])
+
+    elif 'ave_eval_wait' in stats:
+        stats['ave_eval_wait'] = np.nan
+
+    # Save the five slowest evaluations.
+    trackers.slowest_evaluations = sorted(timed, key=lambda x: x[1],
+                                          reverse=True)[:5]
+
+    if params['SAVE_EVALUATION_TIMES'] and not params['DEBUG']:
+        save_evaluation_times_to_file(trackers.evaluation_times, stats['gen'])
+
+    trackers.evaluation_times = []
+
+
 def print_generation_stats():
     """
     Print the statistics for the generation and individuals.
@@ -342,6 +425,11 @@ def print_generation_stats():
     print("______\n")
     for stat in sorted(stats.keys()):
         print(" ", stat, ": \t", stats[stat])
+
+    if trackers.slowest_evaluations:
+        print("  slowest evaluations :")
+        for phenotype, eval_time, _, _ in trackers.slowest_evaluations:
+            print("\t  ", eval_time, ": \t", repr(phenotype))
     print("\n")
 
 
@@ -372,7 +460,9 @@ def print_final_stats():
         print("\n\nBest:\n  Fitness:\t", trackers.best_ever.fitness)
 
     print("  Phenotype:", trackers.best_ever.phenotype)
-    print("  Genome:", trackers.best_ever.genome)
+    genome = trackers.best_ever.genome
+    print("  Genome:", genome.tolist() if isinstance(genome, array) else
+          genome)
     print_generation_stats()
 
 
@@ -250,6 +250,41 @@ def parse_cmd_args(arguments):
                         help='Boolean flag for selecting whether or not '
                              'mutation is confined to within the used portion '
                              'of the genome. Default set to True.')
+    parser.add_argument('--batch_mapping',
+                        dest='BATCH_MAPPING',
+                        default=None,
+                        action='store_true',
+                        help='Maps whole generations of genomes at once '
+                             'rather than one individual at a time. Only '
+                             'used with linear operators.')
+    parser.add_argument('--mapping_checkpoint_step',
+                        dest='MAPPING_CHECKPOINT_STEP',
+                        type=int,
+                        help='Records a checkpoint of the genome mapper '
+                             'every n-th used codon, so that children of '
+                             'linear operators only re-map their genomes '
+                             'from their first changed codon. Requires int '
+                             'value.')
+    parser.add_argument('--mapping_cache_size',
+                        dest='MAPPING_CACHE_SIZE',
+                        type=int,
+                        help='Caches up to n genome mappings, keyed on the '
+                             'production choices made by their used codons. '
+                             'Requires int value.')
+    parser.add_argument('--hash_cons_trees',
+                        dest='HASH_CONS_TREES',
+                        default=None,
+                        action='store_true',
+                        help='Stores derivation trees as immutable, '
+                             'hash-consed trees which share identical '
+                             'subtrees across the population. Only used '
+                             'with subtree operators.')
+    parser.add_argument('--grammar_cache_dir',
+                        dest='GRAMMAR_CACHE_DIR',
+                        type=str,
+                        help='Saves fully analysed grammars to the given '
+                             'directory, and loads them from there in later '
+                             'runs. Requires a directory path.')
 
     # CROSSOVER
     parser.add_argument('--crossover',
@@ -344,6 +379,76 @@ def parse_cmd_args(arguments):
                              'gradient descent in supervised learning '
                              'problems. Requires True or False, default '
                              'False.')
+    parser.add_argument('--racing',
+                        dest='RACING',
+                        action='store_true',
+                        default=None,
+                        help='Whether to race phenotypes on growing random '
+                             'subsets of the training data in supervised '
+                             'learning problems, stopping early when they '
+                             'cannot beat recent phenotypes.')
+    parser.add_argument('--racing_quantile',
+                        dest='RACING_QUANTILE',
+                        type=float,
+                        help='Quantile of recent fitnesses against which '
+                             'phenotypes are raced, e.g. 0.5 for the median. '
+                             'Requires float value, default 0.5.')
+    parser.add_argument('--racing_sample_size',
+                        dest='RACING_SAMPLE_SIZE',
+                        type=int,
+                        help='Number of rows in the first subset of the '
+                             'training data used for racing. Requires int '
+                             'value, default 100.')
+    parser.add_argument('--racing_confidence',
+                        dest='RACING_CONFIDENCE',
+                        type=float,
+                        help='Confidence level of the bound with which '
+                             'phenotypes are stopped when racing, over all '
+                             'stages of a race. Requires float value, '
+                             'default 0.99.')
+    parser.add_argument('--mini_batch_size',
+                        dest='MINI_BATCH_SIZE',
+                        type=int,
+                        help='Compute training fitness on a stratified '
+                             'random mini-batch of this many rows of the '
+                             'training data in supervised learning problems. '
+                             'Requires int value, default None.')
+    parser.add_argument('--mini_batch_rotation',
+                        dest='MINI_BATCH_ROTATION',
+                        type=int,
+                        help='Draw a new mini-batch every n generations. '
+                             'Requires int value, default 1.')
+    parser.add_argument('--code_cache_size',
+                        dest='CODE_CACHE_SIZE',
+                        type=int,
+                        help='Cache the compiled code of up to n phenotypes, '
+                             'so that phenotypes evaluated more than once '
+                             'are only compiled once. Requires int value, '
+                             'default 10000.')
+    parser.add_argument('--semantic_cache_size',
+                        dest='SEMANTIC_CACHE_SIZE',
+                        type=int,
+                        help='Cache the outputs of the subexpressions of '
+                             'phenotypes in supervised learning problems, '
+                             'using up to n bytes for each of the training '
+                             'and test data. Requires int value, default '
+                             'None.')
+    parser.add_argument('--stack_vm',
+                        dest='STACK_VM',
+                        action='store_true',
+                        default=None,
+                        help='Run phenotypes in supervised learning problems '
+                             'on a stack machine which reuses preallocated '
+                             'buffers, rather than evaluating them with '
+                             'eval.')
+    parser.add_argument('--evaluation_block_size',
+                        dest='EVALUATION_BLOCK_SIZE',
+                        type=int,
+                        help='Compute the error of phenotypes in supervised '
+                             'learning problems in blocks of n rows on the '
+                             'stack machine, so that the buffers of each '
+                             'block fit in cache. Requires int value, '
+                             'default None.')
     parser.add_argument('--multicore',
                         dest='MULTICORE',
                         action='store_true',
@@ -354,6 +459,52 @@ def parse_cmd_args(arguments):
                         type=int,
                         help='Specify the number of cores to be used for '
                              'multi-core evaluation. Requires int.')
+    parser.add_argument('--multicore_chunk_time',
+                        dest='MULTICORE_CHUNK_TIME',
+                        type=float,
+                        help='Sets the target time in seconds taken by a '
+                             'worker to evaluate one chunk of phenotypes in '
+                             'multi-core evaluation. Chunk sizes are adapted '
+                             'to the measured time per evaluation. Requires '
+                             'float.')
+    parser.add_argument('--coordinator',
+                        dest='COORDINATOR',
+                        type=str,
+                        help='Evaluates phenotypes using remote workers '
+                             '(scripts/ponyge_worker.py), which connect to '
+                             'the given address. Requires string such as '
+                             '"0.0.0.0:6000".')
+    parser.add_argument('--coordinator_authkey',
+                        dest='COORDINATOR_AUTHKEY',
+                        type=str,
+                        help='Sets the key with which remote workers must '
+                             'authenticate. Requires string. A random key '
+                             'is generated by default.')
+    parser.add_argument('--worker_heartbeat',
+                        dest='WORKER_HEARTBEAT',
+                        type=float,
+                        help='Sets the interval in seconds between heartbeats '
+                             'sent by remote workers. Workers which miss '
+                             'three heartbeats are considered dead. Requires '
+                             'float.')
+    parser.add_argument('--fitness_cache_file',
+                        dest='FITNESS_CACHE_FILE',
+                        type=str,
+                        help='Stores fitnesses in the given SQLite database '
+                             'file, so that they are shared between runs '
+                             'with the same fitness function, datasets and '
+                             'error metric. Cannot be used with racing. '
+                             'Requires a file path.')
+    parser.add_argument('--cache_size',
+                        dest='CACHE_SIZE',
+                        type=int,
+                        help='Sets the approximate maximum number of bytes '
+                             'used by the fitness cache. Requires int.')
+    parser.add_argument('--cache_eviction',
+                        dest='CACHE_EVICTION',
+                        type=str,
+                        help='Sets the eviction policy of the fitness cache, '
+                             'requires string: "lru", "lfu" or "least_fit".')
 
     # REPLACEMENT
     parser.add_argument('--replacement',
@@ -431,6 +582,12 @@ def parse_cmd_args(arguments):
                         action='store_true',
                         default=None,
                         help='Saves plots for best fitness.')
+    parser.add_argument('--save_evaluation_times',
+                        dest='SAVE_EVALUATION_TIMES',
+                        action='store_true',
+                        default=None,
+                        help='Saves the time taken by every fitness '
+                             'evaluation to evaluation_times.tsv.')
 
     # REVERSE-MAPPING
     parser.add_argument('--reverse_mapping_target',
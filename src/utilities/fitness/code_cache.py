@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+from algorithm.parameters import params
+
+# Compiled phenotypes in least- to most-recently-used order, keyed by the
+# source of the expression. Each process (e.g. each worker of the multicore
+# pool) holds its own cache. Forked workers start with a copy of the cache
+# of the main process.
+code_cache = OrderedDict()
+
+
+def compile_phenotype(source):
+    """
+    Returns the code object of a Python expression, e.g. a phenotype, so
+    that evaluating the expression with eval does not parse and compile the
+    source again. Evaluating the code object with eval behaves exactly as
+    evaluating the source would, i.e. names are looked up in the scope of
+    the caller.
+
+    Code objects are cached, so that phenotypes evaluated more than once
+    (e.g. on both training and test data, or again after their fitness has
+    been evicted from the fitness cache) are only compiled once. Up to
+    params['CODE_CACHE_SIZE'] code objects are cached, the least recently
+    used code object being evicted first.
+
+    :param source: The source of a Python expression.
+    :return: The compiled code object of the expression.
+    """
+
+    size = params['CODE_CACHE_SIZE']
+
+    code = code_cache.get(source) if size else None
+
+    if code is not None:
+        # Mark the code object as most recently used.
+        code_cache.move_to_end(source)
+        return code
+
+    code = compile(source, "<string>", "eval")
+
+    if size:
+        code_cache[source] = code
+
+        while len(code_cache) > size:
+            # Evict the least recently used code object.
+            code_cache.popitem(last=False)
+
+    return code
@@ -20,6 +20,68 @@ def mae(y, yhat):
 mae.maximise = False
 
 
+def mae_batch(y, yhats):
+    """
+    Calculate the mean absolute error between the expected input and each row
+    of a stacked array of given inputs.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhats: The given inputs (i.e. from phenotypes), one per row.
+    :return: An array of the mean absolute errors.
+    """
+
+    return np.mean(np.abs(y - yhats), axis=1)
+
+
+# Set batch version of mae error metric.
+mae.batch = mae_batch
+
+
+def absolute_errors(y, yhat, out=None):
+    """
+    Calculate the absolute error of each row.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhat: The given input (i.e. from phenotype).
+    :param out: An optional array into which the errors are written, rather
+    than allocating new arrays.
+    :return: An array of the absolute errors.
+    """
+
+    return np.abs(np.subtract(y, yhat, out=out), out=out)
+
+
+def square_errors(y, yhat, out=None):
+    """
+    Calculate the square error of each row.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhat: The given input (i.e. from phenotype).
+    :param out: An optional array into which the errors are written, rather
+    than allocating new arrays.
+    :return: An array of the square errors.
+    """
+
+    return np.square(np.subtract(y, yhat, out=out), out=out)
+
+
+def mean_error(mean, n):
+    """
+    Calculate an error metric which is the mean of the errors of all rows.
+
+    :param mean: The mean error of a row.
+    :param n: The number of rows.
+    :return: The value of the error metric.
+    """
+
+    return mean
+
+
+# Set row errors of mae error metric, used for racing evaluation (see
+# fitness.supervised_learning.supervised_learning.race).
+mae.errors, mae.from_errors = absolute_errors, mean_error
+
+
 def rmse(y, yhat):
     """
     Calculate root mean square error between inputs.
@@ -36,6 +98,26 @@ def rmse(y, yhat):
 rmse.maximise = False
 
 
+def rmse_batch(y, yhats):
+    """
+    Calculate the root mean square error between the expected input and
+    each row of a stacked array of given inputs.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhats: The given inputs (i.e. from phenotypes), one per row.
+    :return: An array of the root mean square errors.
+    """
+
+    return np.sqrt(np.mean(np.square(y - yhats), axis=1))
+
+
+# Set batch version of rmse error metric.
+rmse.batch = rmse_batch
+
+# Set row errors of rmse error metric.
+rmse.errors, rmse.from_errors = square_errors, lambda mean, n: np.sqrt(mean)
+
+
 def mse(y, yhat):
     """
     Calculate mean square error between inputs.
@@ -52,6 +134,26 @@ def mse(y, yhat):
 mse.maximise = False
 
 
+def mse_batch(y, yhats):
+    """
+    Calculate the mean square error between the expected input and each row
+    of a stacked array of given inputs.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhats: The given inputs (i.e. from phenotypes), one per row.
+    :return: An array of the mean square errors.
+    """
+
+    return np.mean(np.square(y - yhats), axis=1)
+
+
+# Set batch version of mse error metric.
+mse.batch = mse_batch
+
+# Set row errors of mse error metric.
+mse.errors, mse.from_errors = square_errors, mean_error
+
+
 def hinge(y, yhat):
     """
     Hinge loss is a suitable loss function for classification.  Here y is
@@ -137,3 +239,43 @@ def Hamming_error(y, yhat):
 
 
 Hamming_error.maximise = False
+
+
+def Hamming_error_batch(y, yhats):
+    """
+    The number of mismatches between y and each row of a stacked array of
+    given inputs.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhats: The given inputs (i.e. from phenotypes), one per row.
+    :return: An array of the numbers of mismatches.
+    """
+
+    return np.sum(y != yhats, axis=1)
+
+
+# Set batch version of Hamming error metric.
+Hamming_error.batch = Hamming_error_batch
+
+
+def mismatches(y, yhat, out=None):
+    """
+    Calculate whether each row is mismatched, i.e. 1.0 for mismatched rows
+    and 0.0 for matched rows.
+
+    :param y: The expected input (i.e. from dataset).
+    :param yhat: The given input (i.e. from phenotype).
+    :param out: An optional array into which the mismatches are written,
+    rather than allocating new arrays.
+    :return: An array of the mismatches.
+    """
+
+    if out is None:
+        return (y != yhat).astype(float)
+
+    return np.not_equal(y, yhat, out=out)
+
+
+# Set row errors of Hamming error metric.
+Hamming_error.errors = mismatches
+Hamming_error.from_errors = lambda mean, n: mean * n
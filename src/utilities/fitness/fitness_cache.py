@@ -0,0 +1,452 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from heapq import heapify, heappop, heappush
+from math import isnan
+from sys import getsizeof
+
+from algorithm.parameters import params
+
+# Approximate number of bytes used by the cache for each entry, in addition
+# to the key and the fitness themselves (i.e. slots in the dict of entries
+# and in the data structures of the eviction policy).
+ENTRY_OVERHEAD = 120
+
+# Approximate number of bytes used by the digest of a phenotype whose
+# fitness is no longer cached (see FitnessCache).
+DIGEST_SIZE = 100
+
+
+def get_digest(phenotype):
+    """
+    Returns the key of a phenotype in the fitness cache, a 128-bit digest of
+    the phenotype string. Long phenotypes are therefore never stored.
+
+    :param phenotype: The phenotype of an individual.
+    :return: The 128-bit digest of the phenotype.
+    """
+
+    return blake2b(phenotype.encode(), digest_size=16).digest()
+
+
+def get_entry_size(key, fitness):
+    """
+    Returns the approximate number of bytes used by an entry of the fitness
+    cache.
+
+    :param key: The key of the entry.
+    :param fitness: The cached fitness.
+    :return: The approximate size of the entry in bytes.
+    """
+
+    size = ENTRY_OVERHEAD + getsizeof(key) + getsizeof(fitness)
+
+    if isinstance(fitness, list):
+        # Multi-objective fitnesses are lists of fitnesses.
+        size += sum([getsizeof(f) for f in fitness])
+
+    return size
+
+
+class LRUEviction(object):
+    """
+    Evicts the least recently used entry of the fitness cache.
+
+    All eviction policies are told when an entry is inserted into the cache
+    and when it is used, and choose which entry to evict.
+    """
+
+    def __init__(self):
+        # Dict of keys in least- to most-recently-used order.
+        self.order = OrderedDict()
+
+    def insert(self, key, fitness):
+        """
+        Record the insertion of an entry into the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The cached fitness.
+        :return: Nothing.
+        """
+
+        self.order[key] = None
+
+    def hit(self, key):
+        """
+        Record the use of an entry of the cache.
+
+        :param key: The key of the entry.
+        :return: Nothing.
+        """
+
+        self.order.move_to_end(key)
+
+    def update(self, key, fitness):
+        """
+        Record a new fitness for an entry of the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The new cached fitness.
+        :return: Nothing.
+        """
+
+        self.hit(key)
+
+    def evict(self):
+        """
+        Choose an entry to be evicted from the cache, and stop tracking it.
+
+        :return: The key of the entry to be evicted.
+        """
+
+        return self.order.popitem(last=False)[0]
+
+
+class LFUEviction(object):
+    """
+    Evicts the least frequently used entry of the fitness cache. Ties are
+    broken by evicting the least recently used of these entries.
+    """
+
+    def __init__(self):
+        # Dict of the number of uses of each key.
+        self.counts = {}
+
+        # Dict of keys grouped by number of uses, each group in least- to
+        # most-recently-used order.
+        self.groups = {}
+
+        # The smallest number of uses of any key.
+        self.min_count = 0
+
+    def insert(self, key, fitness):
+        """
+        Record the insertion of an entry into the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The cached fitness.
+        :return: Nothing.
+        """
+
+        self.counts[key] = 1
+        self.groups.setdefault(1, OrderedDict())[key] = None
+        self.min_count = 1
+
+    def hit(self, key):
+        """
+        Record the use of an entry of the cache.
+
+        :param key: The key of the entry.
+        :return: Nothing.
+        """
+
+        count = self.counts[key]
+
+        # Move the key to the next group.
+        group = self.groups[count]
+        del group[key]
+
+        if not group:
+            del self.groups[count]
+
+            if self.min_count == count:
+                self.min_count += 1
+
+        self.counts[key] = count + 1
+        self.groups.setdefault(count + 1, OrderedDict())[key] = None
+
+    def update(self, key, fitness):
+        """
+        Record a new fitness for an entry of the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The new cached fitness.
+        :return: Nothing.
+        """
+
+        self.hit(key)
+
+    def evict(self):
+        """
+        Choose an entry to be evicted from the cache, and stop tracking it.
+
+        :return: The key of the entry to be evicted.
+        """
+
+        group = self.groups[self.min_count]
+        key = group.popitem(last=False)[0]
+        del self.counts[key]
+
+        if not group:
+            del self.groups[self.min_count]
+
+            # Find the new smallest number of uses.
+            self.min_count = min(self.groups) if self.groups else 0
+
+        return key
+
+
+class LeastFitEviction(object):
+    """
+    Evicts the entry of the fitness cache with the worst fitness, as poor
+    individuals are the least likely to be selected and encountered again.
+    Only used with single-objective fitness functions.
+    """
+
+    def __init__(self):
+        # Heap of (badness, insertion number, key) tuples. Tuples of entries
+        # whose fitness has been updated are left in the heap, and skipped
+        # when evicting.
+        self.heap = []
+        self.inserted = 0
+
+        # Dict of the insertion number of the current tuple of each cached
+        # key.
+        self.current = {}
+
+    def insert(self, key, fitness):
+        """
+        Record the insertion of an entry into the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The cached fitness.
+        :return: Nothing.
+        """
+
+        if isnan(fitness):
+            # Invalid fitnesses are evicted first.
+            badness = float("inf")
+
+        elif params['FITNESS_FUNCTION'].maximise:
+            badness = -fitness
+
+        else:
+            badness = fitness
+
+        heappush(self.heap, (badness, self.inserted, key))
+        self.current[key] = self.inserted
+        self.inserted += 1
+
+        if len(self.heap) > 2 * len(self.current):
+            # Drop the tuples of updated and evicted entries.
+            self.heap = [t for t in self.heap if
+                         self.current.get(t[2]) == t[1]]
+            heapify(self.heap)
+
+    def hit(self, key):
+        """
+        Record the use of an entry of the cache. The use of an entry does
+        not change its fitness.
+
+        :param key: The key of the entry.
+        :return: Nothing.
+        """
+
+        pass
+
+    def update(self, key, fitness):
+        """
+        Record a new fitness for an entry of the cache.
+
+        :param key: The key of the entry.
+        :param fitness: The new cached fitness.
+        :return: Nothing.
+        """
+
+        # The previous tuple of the key is skipped when evicting.
+        self.insert(key, fitness)
+
+    def evict(self):
+        """
+        Choose an entry to be evicted from the cache, and stop tracking it.
+
+        :return: The key of the entry to be evicted.
+        """
+
+        while True:
+            _, number, key = heappop(self.heap)
+
+            if self.current.get(key) == number:
+                del self.current[key]
+                return key
+
+
+# Eviction policies which can be used by the fitness cache, keyed by the
+# name used to specify them in params['CACHE_EVICTION'].
+EVICTION_POLICIES = {"lru": LRUEviction,
+                     "lfu": LFUEviction,
+                     "least_fit": LeastFitEviction}
+
+
+class FitnessCache(object):
+    """
+    A cache of the fitnesses of phenotypes, with an optional budget for the
+    memory used by cached fitnesses. Once the budget is exceeded, entries
+    are evicted according to an eviction policy (see EVICTION_POLICIES).
+
+    Phenotypes are stored as 128-bit digests (see get_digest). The digests
+    of phenotypes whose fitnesses have been evicted (or cleared) are kept,
+    so that the cache can tell whether a phenotype has been encountered
+    before (i.e. "phenotype in cache"). These digests are counted towards
+    the budget. Once the budget is exceeded, the oldest digests are
+    forgotten before any fitness is evicted, as a cached fitness is more
+    useful than a digest. A bounded cache may therefore treat a phenotype
+    encountered long ago as new, and the number of unique phenotypes is
+    then approximate (it is exact for an unbounded cache).
+    """
+
+    def __init__(self, size=None, eviction="lru"):
+        """
+        Initialise an empty fitness cache.
+
+        :param size: The approximate maximum number of bytes used by cached
+        fitnesses, or None for an unbounded cache.
+        :param eviction: The name of the eviction policy.
+        """
+
+        if eviction not in EVICTION_POLICIES:
+            s = "utilities.fitness.fitness_cache.FitnessCache\n" \
+                "Error: Unknown cache eviction policy '%s'. Valid " \
+                "policies are: %s." % (eviction,
+                                       ", ".join(EVICTION_POLICIES))
+            raise Exception(s)
+
+        self.size = size
+        self.policy = EVICTION_POLICIES[eviction]()
+
+        # Dict of cached fitnesses, keyed by digest.
+        self.entries = {}
+
+        # Dict of the digests of phenotypes whose fitnesses are no longer
+        # cached, in oldest to newest order.
+        self.seen = OrderedDict()
+
+        # The number of unique phenotypes ever cached.
+        self.unique = 0
+
+        # The approximate number of bytes used by cached fitnesses and
+        # digests.
+        self.bytes = 0
+
+        # Counters for cache hits, misses and evictions.
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __contains__(self, phenotype):
+        """
+        Checks whether a phenotype has been cached before, even if its
+        fitness has since been evicted.
+
+        :param phenotype: The phenotype of an individual.
+        :return: True if the phenotype has been encountered before.
+        """
+
+        key = get_digest(phenotype)
+
+        return key in self.entries or key in self.seen
+
+    def __len__(self):
+        """
+        :return: The number of cached fitnesses.
+        """
+
+        return len(self.entries)
+
+    def clear(self):
+        """
+        Discard all cached fitnesses, e.g. once the fitnesses of phenotypes
+        have changed. The digests of phenotypes encountered before are kept.
+
+        :return: Nothing.
+        """
+
+        for key in self.entries:
+            self.forget(key)
+
+        self.entries = {}
+        self.policy = type(self.policy)()
+        self.shrink()
+
+    def lookup(self, phenotype):
+        """
+        Look up the fitness of a phenotype.
+
+        :param phenotype: The phenotype of an individual.
+        :return: The cached fitness of the phenotype, or None if the
+        fitness is not in the cache.
+        """
+
+        key = get_digest(phenotype)
+
+        if key in self.entries:
+            self.hits += 1
+            self.policy.hit(key)
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def __setitem__(self, phenotype, fitness):
+        """
+        Add the fitness of a phenotype to the cache, evicting entries if the
+        cache exceeds its budget.
+
+        :param phenotype: The phenotype of an evaluated individual.
+        :param fitness: The fitness of the phenotype.
+        :return: Nothing.
+        """
+
+        key = get_digest(phenotype)
+
+        if key in self.entries:
+            # The fitness is already cached. Replace it.
+            self.bytes += get_entry_size(key, fitness) - \
+                get_entry_size(key, self.entries[key])
+            self.entries[key] = fitness
+            self.policy.update(key, fitness)
+
+        else:
+            if key in self.seen:
+                # The phenotype has been encountered before.
+                del self.seen[key]
+                self.bytes -= DIGEST_SIZE
+
+            else:
+                self.unique += 1
+
+            self.entries[key] = fitness
+            self.bytes += get_entry_size(key, fitness)
+            self.policy.insert(key, fitness)
+
+        self.shrink()
+
+    def forget(self, key):
+        """
+        Keep the digest of a phenotype whose fitness is no longer cached.
+
+        :param key: The digest of the phenotype.
+        :return: Nothing.
+        """
+
+        self.bytes += DIGEST_SIZE - get_entry_size(key, self.entries[key])
+        self.seen[key] = None
+
+    def shrink(self):
+        """
+        Forget digests and evict entries until the cache is within its
+        budget.
+
+        :return: Nothing.
+        """
+
+        while self.size is not None and self.bytes > self.size and \
+                (self.entries or self.seen):
+            if self.seen:
+                # Forget the oldest digest.
+                self.seen.popitem(last=False)
+                self.bytes -= DIGEST_SIZE
+
+            else:
+                # Evict an entry, keeping its digest.
+                key = self.policy.evict()
+                self.forget(key)
+                del self.entries[key]
+                self.evictions += 1
@@ -162,6 +162,101 @@ def plog(x):
     return np.log(1.0 + np.abs(x))
 
 
+def pdiv_out(x, y, out, mask):
+    """
+    Koza's protected division (see pdiv), writing its output into a buffer
+    rather than allocating temporary arrays. Used to evaluate phenotypes in
+    preallocated buffers (see utilities.fitness.stack_vm).
+
+    :param x: numerator np.array
+    :param y: denominator np.array
+    :param out: np.array buffer into which the output is written. May be x,
+    but not y.
+    :param mask: Boolean np.array buffer of the same length as out.
+    :return: out, holding x / y, or 1 where y is 0.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.true_divide(x, y, out=out)
+
+    if np.ndim(y):
+        np.copyto(out, 1.0, where=np.equal(y, 0, out=mask))
+
+    elif y == 0:
+        out.fill(1.0)
+
+    return out
+
+
+def rlog_out(x, out, mask):
+    """
+    Koza's protected log (see rlog), writing its output into a buffer rather
+    than allocating temporary arrays.
+
+    :param x: argument to log, np.array
+    :param out: np.array buffer into which the output is written. May be x.
+    :param mask: Boolean np.array buffer of the same length as out.
+    :return: out, holding log(abs(x)), or 1 where x is 0.
+    """
+    np.equal(x, 0, out=mask)
+    np.abs(x, out=out)
+
+    with np.errstate(divide='ignore'):
+        np.log(out, out=out)
+
+    np.copyto(out, 1.0, where=mask)
+
+    return out
+
+
+def psqrt_out(x, out):
+    """
+    Protected square root operator (see psqrt), writing its output into a
+    buffer rather than allocating temporary arrays.
+
+    :param x: np.array, argument to sqrt
+    :param out: np.array buffer into which the output is written. May be x.
+    :return: out, holding sqrt(x) but protected.
+    """
+    np.abs(x, out=out)
+
+    return np.sqrt(out, out=out)
+
+
+def plog_out(x, out):
+    """
+    Protected log operator (see plog), writing its output into a buffer
+    rather than allocating temporary arrays.
+
+    :param x: np.array, argument to log
+    :param out: np.array buffer into which the output is written. May be x.
+    :return: out, holding log(x) but protected.
+    """
+    np.abs(x, out=out)
+    np.add(1.0, out, out=out)
+
+    return np.log(out, out=out)
+
+
+def aq_out(a, b, out, tmp):
+    """
+    Analytic quotient (see aq), writing its output into a buffer rather than
+    allocating temporary arrays.
+
+    :param a: np.array numerator
+    :param b: np.array denominator
+    :param out: np.array buffer into which the output is written. May be a
+    or b.
+    :param tmp: np.array buffer used for the denominator. May be b, but not
+    a.
+    :return: out, holding the analytic quotient of a and b.
+    """
+    np.square(b, out=tmp)
+    np.add(1.0, tmp, out=tmp)
+    np.sqrt(tmp, out=tmp)
+
+    return np.true_divide(a, tmp, out=out)
+
+
 def ave(x):
     """
     Returns the average value of a list.
@@ -0,0 +1,156 @@
+import pickle
+import sqlite3
+from hashlib import sha256
+from os import path
+
+from algorithm.parameters import params
+
+
+def get_fingerprint():
+    """
+    Returns a fingerprint of the current fitness evaluation setup. Fitnesses
+    can only be shared between runs which have the same fingerprint. The
+    fingerprint is a hash of the fitness function, the contents of the
+    datasets, the error metric, and any other parameters which affect the
+    fitness of a phenotype.
+
+    :return: The fingerprint of the fitness evaluation setup.
+    """
+
+    ff = params['FITNESS_FUNCTION']
+
+    # Multi-objective fitness functions hold a list of fitness functions.
+    ffs = getattr(ff, "fitness_functions", [ff])
+
+    settings = [[type(f).__module__ + "." + type(f).__name__ for f in ffs],
+                getattr(params['ERROR_METRIC'], "__name__",
+                        params['ERROR_METRIC']),
+                params['TARGET'], params.get('EXTRA_PARAMETERS'),
+                params['OPTIMIZE_CONSTANTS'], params['RACING']]
+
+    fingerprint = sha256(repr(settings).encode())
+
+    for dataset in [params['DATASET_TRAIN'], params['DATASET_TEST']]:
+        if dataset:
+            # Hash the contents of the dataset, not its name.
+            with open(path.join("..", "datasets", dataset), "rb") as data:
+                fingerprint.update(sha256(data.read()).digest())
+
+    return fingerprint.hexdigest()
+
+
+class PersistentCache(object):
+    """
+    A fitness cache stored in an SQLite database on disk, so that fitnesses
+    are shared between runs (e.g. the many runs of an experiment launched by
+    scripts.experiment_manager) rather than lost at the end of each run.
+
+    Fitnesses are keyed by the fingerprint of the fitness evaluation setup
+    (see get_fingerprint) and the phenotype. Any number of concurrent runs
+    may read and write the same database. New fitnesses are written in a
+    single transaction by commit, rather than one at a time.
+    """
+
+    def __init__(self, file_name, fingerprint):
+        """
+        Open a persistent fitness cache, creating the database if necessary.
+
+        :param file_name: The location of the database file.
+        :param fingerprint: The fingerprint of the fitness evaluation setup.
+        """
+
+        self.file_name, self.fingerprint = file_name, fingerprint
+
+        # Counters for cache hits and misses.
+        self.hits, self.misses = 0, 0
+
+        # List of (phenotype, fitness) pairs not yet written to the database.
+        self.pending = []
+
+        # Wait for up to a minute for other runs to finish writing.
+        self.connection = sqlite3.connect(file_name, timeout=60)
+
+        # Write-ahead logging lets runs read the database while another run
+        # is writing to it.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS fitness (fingerprint TEXT, "
+                "phenotype TEXT, fitness BLOB, "
+                "PRIMARY KEY (fingerprint, phenotype)) WITHOUT ROWID")
+
+    def __getstate__(self):
+        """
+        The database connection is not saved with the state of a run, only
+        the location of the database, the fingerprint, and the counters.
+
+        :return: A picklable state for the cache.
+        """
+
+        self.commit()
+
+        return {"file_name": self.file_name, "fingerprint": self.fingerprint,
+                "hits": self.hits, "misses": self.misses}
+
+    def __setstate__(self, state):
+        """
+        Reopen the cache from a saved state.
+
+        :param state: A saved state for the cache.
+        :return: Nothing.
+        """
+
+        self.__init__(state['file_name'], state['fingerprint'])
+        self.hits, self.misses = state['hits'], state['misses']
+
+    def lookup(self, phenotype):
+        """
+        Look up the fitness of a phenotype.
+
+        :param phenotype: The phenotype of an individual.
+        :return: The cached fitness of the phenotype, or None if the
+        phenotype is not in the cache.
+        """
+
+        row = self.connection.execute(
+            "SELECT fitness FROM fitness WHERE fingerprint = ? AND "
+            "phenotype = ?", (self.fingerprint, phenotype)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def insert(self, phenotype, fitness):
+        """
+        Add the fitness of a phenotype to the cache. The fitness is only
+        written to the database by commit.
+
+        :param phenotype: The phenotype of an evaluated individual.
+        :param fitness: The fitness of the phenotype.
+        :return: Nothing.
+        """
+
+        self.pending.append((phenotype, fitness))
+
+    def commit(self):
+        """
+        Write all new fitnesses to the database. Fitnesses written by other
+        runs in the meantime are kept.
+
+        :return: Nothing.
+        """
+
+        if not self.pending:
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO fitness VALUES (?, ?, ?)",
+                [(self.fingerprint, phenotype, pickle.dumps(fitness))
+                 for phenotype, fitness in self.pending])
+
+        self.pending = []
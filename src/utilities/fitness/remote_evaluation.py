@@ -0,0 +1,491 @@
+from collections import deque
+from math import ceil
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from secrets import token_hex
+from threading import Condition, Lock, Thread
+from time import perf_counter, sleep
+from traceback import format_exc
+
+from algorithm.parameters import params
+
+# A worker is considered dead if the coordinator hears nothing from it for
+# this many heartbeat intervals.
+HEARTBEAT_TIMEOUT = 3
+
+
+def parse_address(address):
+    """
+    Splits an address of the form "host:port".
+
+    :param address: An address of the form "host:port".
+    :return: A (host, port) tuple.
+    """
+
+    host, _, port = address.rpartition(":")
+
+    return host or "localhost", int(port)
+
+
+class Coordinator(object):
+    """
+    Evaluates phenotypes using remote workers, i.e. instances of
+    scripts/ponyge_worker.py running on any number of machines, which
+    connect to the coordinator over TCP. Workers may connect (and die) at
+    any time during a run.
+
+    When a worker connects, it is sent the command line arguments of the
+    run, from which it loads the same grammar, fitness function and datasets
+    (which must therefore be available on the machine of the worker). It is
+    then sent chunks of (index, phenotype) tuples to evaluate, exactly as
+    the workers of the multicore pool are (see
+    fitness.evaluation.evaluate_chunk).
+
+    Each worker is served by its own thread, which takes the next chunk of
+    phenotypes as soon as the worker has returned its previous chunk. The
+    size of each chunk is chosen from the measured throughput of the worker,
+    so that each chunk takes roughly params['MULTICORE_CHUNK_TIME'] seconds.
+    Faster workers are therefore sent more phenotypes.
+
+    Workers send heartbeats every params['WORKER_HEARTBEAT'] seconds. A
+    worker which is not heard from for HEARTBEAT_TIMEOUT heartbeats, or
+    whose connection fails, is considered dead, and the phenotypes it was
+    evaluating are sent to other workers.
+
+    Phenotypes are either evaluated a list at a time (see evaluate), or
+    submitted one at a time without waiting for their evaluation to finish
+    (see submit).
+    """
+
+    def __init__(self, address, authkey, command_line_args):
+        """
+        Start listening for remote workers.
+
+        :param address: The address on which to listen for workers, of the
+        form "host:port".
+        :param authkey: The key with which workers must authenticate, or
+        None to generate a random key.
+        :param command_line_args: The command line arguments of the run.
+        """
+
+        if authkey is None:
+            # Generate a random key.
+            authkey = token_hex(16)
+
+        self.address, self.authkey = address, authkey
+        self.command_line_args = command_line_args
+
+        # Lock guarding the state shared with the threads serving workers.
+        # Threads are notified whenever the state changes.
+        self.lock = Condition()
+
+        # (job number, phenotype) tuples not yet sent to a worker,
+        # evaluation results received from workers, and the first error
+        # raised by a fitness function. Results are keyed by job number.
+        self.jobs, self.results, self.error = deque(), {}, None
+
+        # The next job number, and dicts of the times at which phenotypes
+        # were submitted and of the functions called once their evaluations
+        # finish, keyed by job number.
+        self.next_job, self.submitted, self.callbacks = 0, {}, {}
+
+        # The largest number of phenotypes sent to a worker at once.
+        self.max_size = 1
+
+        # Dict of the measured throughput of each connected worker in
+        # evaluations per second (None if not measured yet), keyed by
+        # worker address.
+        self.workers = {}
+
+        self.listener = Listener(parse_address(address),
+                                 authkey=authkey.encode())
+
+        if not params['SILENT']:
+            print("Remote workers can connect with:\n"
+                  "    python scripts/ponyge_worker.py --coordinator %s "
+                  "--authkey %s\n" % (address, authkey))
+
+        Thread(target=self.accept, daemon=True).start()
+
+    def __getstate__(self):
+        """
+        The connections of the coordinator are not saved with the state of a
+        run, only the address, key and command line arguments.
+
+        :return: A picklable state for the coordinator.
+        """
+
+        return {"address": self.address, "authkey": self.authkey,
+                "command_line_args": self.command_line_args}
+
+    def __setstate__(self, state):
+        """
+        Start listening for remote workers again from a saved state.
+
+        :param state: A saved state for the coordinator.
+        :return: Nothing.
+        """
+
+        self.__init__(state['address'], state['authkey'],
+                      state['command_line_args'])
+
+    def accept(self):
+        """
+        Accepts connections from remote workers, serving each worker in a new
+        thread. Run in a background thread.
+
+        :return: Nothing.
+        """
+
+        while True:
+            try:
+                conn = self.listener.accept()
+
+            except (AuthenticationError, EOFError, OSError) as err:
+                print("Warning: Remote worker failed to connect.\n", err)
+                continue
+
+            name = "%s:%d" % self.listener.last_accepted[:2]
+
+            Thread(target=self.serve, args=(conn, name), daemon=True).start()
+
+    def serve(self, conn, name):
+        """
+        Sends chunks of phenotypes to a remote worker until the worker dies.
+        Run in a background thread for each worker.
+
+        :param conn: The connection to the worker.
+        :param name: The address of the worker.
+        :return: Nothing.
+        """
+
+        try:
+            # Send the setup of the run to the worker, and wait for it to
+            # load the fitness function, however long that takes.
+            conn.send(("setup", self.command_line_args,
+                       params['WORKER_HEARTBEAT']))
+            self.receive(conn, None)
+
+        except (EOFError, OSError, TimeoutError):
+            print("Warning: Remote worker %s failed to start." % name)
+            conn.close()
+            return
+
+        with self.lock:
+            self.workers[name] = None
+            self.lock.notify_all()
+
+        while True:
+            with self.lock:
+                while not self.jobs:
+                    # Wait for phenotypes to evaluate.
+                    self.lock.wait()
+
+                chunk = [self.jobs.popleft() for _ in
+                         range(min(self.get_chunk_size(name),
+                                   len(self.jobs)))]
+
+            try:
+                start = perf_counter()
+                conn.send(("evaluate", chunk))
+                message = self.receive(conn)
+                elapsed = perf_counter() - start
+
+            except (EOFError, OSError, TimeoutError):
+                with self.lock:
+                    # Send the phenotypes to other workers.
+                    self.jobs.extendleft(reversed(chunk))
+                    del self.workers[name]
+                    self.lock.notify_all()
+
+                print("Warning: Lost remote worker %s. Its evaluations "
+                      "have been sent to other workers." % name)
+                conn.close()
+                return
+
+            with self.lock:
+                if message[0] == "error":
+                    # The fitness function raised an error.
+                    self.error = self.error or message[1]
+
+                else:
+                    # Each evaluation in a chunk spent the time since it was
+                    # submitted, less the time taken by the chunk, waiting
+                    # for a worker (or in transit).
+                    now = perf_counter()
+                    chunk_time = sum([result[3] for result in message[1]])
+
+                    for i, fitness, runtime_error, eval_time, averaged in \
+                            message[1]:
+                        wait_time = now - self.submitted[i] - chunk_time
+                        self.results[i] = (fitness, runtime_error, eval_time,
+                                           wait_time, averaged)
+
+                    # Update the throughput of the worker.
+                    throughput = len(chunk) / max(elapsed, 1e-9)
+
+                    if self.workers[name] is not None:
+                        throughput = (self.workers[name] + throughput) / 2
+
+                    self.workers[name] = throughput
+
+                for i, _ in chunk:
+                    # Finish the evaluations of submitted phenotypes.
+                    del self.submitted[i]
+
+                    if i in self.callbacks:
+                        self.callbacks.pop(i)()
+
+                self.lock.notify_all()
+
+    def receive(self, conn, timeout=HEARTBEAT_TIMEOUT):
+        """
+        Receives the next message from a worker, skipping heartbeats.
+
+        :param conn: The connection to the worker.
+        :param timeout: The number of heartbeats to wait for before the
+        worker is considered dead, or None to wait forever.
+        :return: The message.
+        """
+
+        if timeout is not None:
+            timeout *= params['WORKER_HEARTBEAT']
+
+        while True:
+            if not conn.poll(timeout):
+                # The worker has stopped sending heartbeats.
+                raise TimeoutError()
+
+            message = conn.recv()
+
+            if message[0] != "heartbeat":
+                return message
+
+    def get_chunk_size(self, name):
+        """
+        Returns the number of phenotypes to be sent to a worker at once,
+        such that the worker takes roughly params['MULTICORE_CHUNK_TIME']
+        seconds to evaluate them. Must be called with the lock held.
+
+        :param name: The address of the worker.
+        :return: The number of phenotypes in the next chunk.
+        """
+
+        if self.workers[name] is None:
+            # The throughput of the worker has not been measured yet.
+            return 1
+
+        size = int(params['MULTICORE_CHUNK_TIME'] * self.workers[name])
+
+        return min(max(size, 1), self.max_size)
+
+    def evaluate(self, phenotypes):
+        """
+        Evaluates a list of phenotypes using the remote workers. Waits for a
+        worker to connect if there are none.
+
+        :param phenotypes: A list of phenotypes.
+        :return: A list of (fitness, runtime error, time taken, time spent
+        waiting, averaged) tuples, one for each phenotype (see
+        fitness.evaluation.evaluate_chunk).
+        """
+
+        with self.lock:
+            jobs = self.add_jobs(phenotypes)
+
+            # Give each worker at least a few chunks, so that work is
+            # balanced between workers.
+            self.max_size = max(1, ceil(len(phenotypes) /
+                                        (max(len(self.workers), 1) * 4)))
+
+            while not all([i in self.results for i in jobs]) and \
+                    not self.error:
+                # Wait for all phenotypes to be evaluated.
+                self.lock.wait()
+
+            self.check_error()
+
+            return [self.results.pop(i) for i in jobs]
+
+    def submit(self, phenotype, callback):
+        """
+        Submits a phenotype to be evaluated by the remote workers, without
+        waiting for its evaluation to finish.
+
+        :param phenotype: A phenotype.
+        :param callback: A function of no arguments, called (from another
+        thread) once the evaluation has finished or failed.
+        :return: A RemoteResult, from which the result of the evaluation is
+        read once it has finished.
+        """
+
+        with self.lock:
+            [job] = self.add_jobs([phenotype])
+            self.callbacks[job] = callback
+
+        return RemoteResult(self, job)
+
+    @property
+    def capacity(self):
+        """
+        :return: The number of phenotypes which should be submitted at once
+        to keep every connected worker busy, i.e. two for each worker, so
+        that each worker has its next phenotype waiting while the result of
+        its current phenotype is sent back.
+        """
+
+        return 2 * max(len(self.workers), 1)
+
+    def add_jobs(self, phenotypes):
+        """
+        Adds phenotypes to the phenotypes to be sent to the workers. Must be
+        called with the lock held.
+
+        :param phenotypes: A list of phenotypes.
+        :return: A list of the job numbers of the phenotypes.
+        """
+
+        jobs = list(range(self.next_job, self.next_job + len(phenotypes)))
+        self.next_job += len(phenotypes)
+
+        start = perf_counter()
+
+        for i, phenotype in zip(jobs, phenotypes):
+            self.jobs.append((i, phenotype))
+            self.submitted[i] = start
+
+        self.lock.notify_all()
+
+        if not self.workers:
+            print("Warning: Waiting for remote workers to connect to %s."
+                  % self.address)
+
+        return jobs
+
+    def check_error(self):
+        """
+        Raises the error raised by a fitness function on a remote worker, if
+        any. Must be called with the lock held.
+
+        :return: Nothing.
+        """
+
+        if self.error:
+            s = "utilities.fitness.remote_evaluation.Coordinator." \
+                "evaluate\nError: Fitness evaluation failed on a remote " \
+                "worker:\n%s" % self.error
+            raise Exception(s)
+
+
+class RemoteResult(object):
+    """
+    The result of a phenotype submitted to the remote workers with
+    Coordinator.submit, like the results returned by the apply_async method
+    of a pool of workers.
+    """
+
+    def __init__(self, coordinator, job):
+        """
+        :param coordinator: The coordinator to which the phenotype was
+        submitted.
+        :param job: The job number of the phenotype.
+        """
+
+        self.coordinator, self.job = coordinator, job
+
+    def get(self):
+        """
+        Waits for the evaluation of the phenotype to finish. Errors raised by
+        the fitness function are raised again here.
+
+        :return: A (fitness, runtime error, time taken, time spent waiting,
+        averaged) tuple.
+        """
+
+        coordinator = self.coordinator
+
+        with coordinator.lock:
+            while self.job not in coordinator.results and \
+                    not coordinator.error:
+                coordinator.lock.wait()
+
+            coordinator.check_error()
+
+            return coordinator.results.pop(self.job)
+
+
+def serve(address, authkey, retry_time=60):
+    """
+    Runs a remote worker: connects to a coordinator, loads the fitness
+    function of its run, and evaluates chunks of phenotypes until the run
+    is over.
+
+    :param address: The address of the coordinator, of the form "host:port".
+    :param authkey: The key with which to authenticate.
+    :param retry_time: The number of seconds for which to keep trying to
+    connect if the coordinator is not listening yet.
+    :return: Nothing.
+    """
+
+    from algorithm.parameters import set_params
+    from fitness.evaluation import evaluate_chunk
+
+    start = perf_counter()
+
+    while True:
+        try:
+            conn = Client(parse_address(address), authkey=authkey.encode())
+            break
+
+        except ConnectionRefusedError:
+            if perf_counter() - start > retry_time:
+                raise
+
+            # The coordinator is not listening yet.
+            sleep(1)
+
+    # Lock so that heartbeats are not sent in the middle of other messages.
+    lock = Lock()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+
+    def heartbeat(interval):
+        while True:
+            sleep(interval)
+
+            try:
+                send(("heartbeat",))
+
+            except OSError:
+                # The connection has been closed.
+                return
+
+    try:
+        _, command_line_args, interval = conn.recv()
+
+        Thread(target=heartbeat, args=(interval,), daemon=True).start()
+
+        # Load the grammar, fitness function and datasets of the run.
+        set_params(command_line_args, create_files=False)
+        send(("ready",))
+
+        while True:
+            _, chunk = conn.recv()
+
+            try:
+                results, _ = evaluate_chunk(chunk)
+
+            except Exception:
+                send(("error", format_exc()))
+                continue
+
+            send(("results", results))
+
+    except (EOFError, OSError):
+        # The run is over.
+        pass
+
+    finally:
+        conn.close()
@@ -0,0 +1,202 @@
+import ast
+from collections import OrderedDict
+from hashlib import blake2b
+
+import numpy as np
+
+from algorithm.parameters import params
+from utilities.fitness.code_cache import compile_phenotype
+
+# Semantic caches keyed by the distribution of the data (i.e. "training" or
+# "test") on which subexpressions are evaluated. Each process (e.g. each
+# worker of the multicore pool) holds its own caches.
+semantic_caches = {}
+
+
+def get_children(node):
+    """
+    Returns the subexpressions of an expression whose outputs are evaluated
+    (and cached) separately: the operands of operators, and the positional
+    arguments of function calls. Other expressions (e.g. x[:, 0], constants,
+    or comparisons) are evaluated whole.
+
+    :param node: An expression of a Python abstract syntax tree.
+    :return: A list of the subexpressions of the expression.
+    """
+
+    if isinstance(node, ast.BinOp):
+        return [node.left, node.right]
+
+    elif isinstance(node, ast.UnaryOp):
+        return [node.operand]
+
+    elif isinstance(node, ast.Call) and not any(
+            [isinstance(arg, ast.Starred) for arg in node.args]):
+        return node.args
+
+    return []
+
+
+def get_template(node):
+    """
+    Returns the source of an expression whose subexpressions (see
+    get_children) are replaced by the placeholders _0, _1, etc. For example,
+    the template of "psqrt(x[:, 0] + 1.0)" is "psqrt(_0)".
+
+    :param node: An expression of a Python abstract syntax tree.
+    :return: The source of the template of the expression.
+    """
+
+    holders = [ast.Name(id="_%d" % i, ctx=ast.Load()) for i in
+               range(len(get_children(node)))]
+
+    if isinstance(node, ast.BinOp):
+        template = ast.BinOp(left=holders[0], op=node.op, right=holders[1])
+
+    elif isinstance(node, ast.UnaryOp):
+        template = ast.UnaryOp(op=node.op, operand=holders[0])
+
+    else:
+        template = ast.Call(func=node.func, args=holders,
+                            keywords=node.keywords)
+
+    return ast.unparse(template)
+
+
+class SemanticCache(object):
+    """
+    A cache of the outputs of the subexpressions of phenotypes on a dataset,
+    with a budget for the memory used by cached outputs. Once the budget is
+    exceeded, the least recently used outputs are evicted.
+
+    Phenotypes are evaluated bottom-up: the output of each subexpression is
+    looked up in the cache, and only subexpressions which are not cached
+    are computed. Subexpressions which are shared by many phenotypes (e.g.
+    psqrt(x[:, 3])) are therefore only computed once.
+
+    Subexpressions are keyed by a structural hash: a digest of the template
+    of the subexpression (see get_template) and of the keys of its
+    subexpressions. Subexpressions which are evaluated whole (e.g. x[:, 0])
+    are keyed by their source. Only array outputs are cached. Cached arrays
+    are read-only, so that they cannot be changed by later evaluations.
+    """
+
+    def __init__(self, size):
+        """
+        Initialise an empty semantic cache.
+
+        :param size: The approximate maximum number of bytes used by cached
+        outputs.
+        """
+
+        self.size = size
+
+        # Dict of cached outputs in least- to most-recently-used order,
+        # keyed by structural hash.
+        self.entries = OrderedDict()
+
+        # The number of bytes used by cached outputs.
+        self.bytes = 0
+
+        # Counters for cache hits and misses.
+        self.hits, self.misses = 0, 0
+
+    def evaluate(self, phenotype, namespace, x):
+        """
+        Evaluates a phenotype, reusing the cached outputs of its
+        subexpressions.
+
+        :param phenotype: The phenotype of an individual.
+        :param namespace: The global names used by the phenotype, e.g. the
+        globals of the fitness function module.
+        :param x: The inputs of the dataset.
+        :return: The output of the phenotype.
+        """
+
+        tree = ast.parse(phenotype, mode="eval")
+
+        return self.evaluate_node(tree.body, namespace, x)[0]
+
+    def evaluate_node(self, node, namespace, x):
+        """
+        Evaluates a subexpression of a phenotype, reusing cached outputs.
+
+        :param node: An expression of a Python abstract syntax tree.
+        :param namespace: The global names used by the phenotype.
+        :param x: The inputs of the dataset.
+        :return: The output of the subexpression, and its key.
+        """
+
+        children = get_children(node)
+
+        if not children:
+            # Evaluate the subexpression whole.
+            source = ast.unparse(node)
+
+            return eval(compile_phenotype(source), namespace, {"x": x}), \
+                source
+
+        # Evaluate the subexpressions of the subexpression.
+        local, keys = {"x": x}, []
+
+        for i, child in enumerate(children):
+            local["_%d" % i], key = self.evaluate_node(child, namespace, x)
+            keys.append(key)
+
+        template = get_template(node)
+
+        key = blake2b("\0".join([template] + keys).encode(),
+                      digest_size=16).hexdigest()
+
+        if key in self.entries:
+            # The output has been computed before.
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key], key
+
+        self.misses += 1
+
+        output = eval(compile_phenotype(template), namespace, local)
+
+        if isinstance(output, np.ndarray):
+            # Cache the output.
+            output.flags.writeable = False
+            self.entries[key] = output
+            self.bytes += output.nbytes
+
+            while self.bytes > self.size:
+                # Evict the least recently used outputs.
+                self.bytes -= self.entries.popitem(last=False)[1].nbytes
+
+        return output, key
+
+
+def semantic_eval(phenotype, namespace, x, dist):
+    """
+    Evaluates a phenotype using the semantic cache of a distribution of the
+    data, creating the cache if needed. Each cache may use up to
+    params['SEMANTIC_CACHE_SIZE'] bytes.
+
+    :param phenotype: The phenotype of an individual.
+    :param namespace: The global names used by the phenotype.
+    :param x: The inputs of the dataset.
+    :param dist: The distribution of the data, i.e. "training" or "test".
+    :return: The output of the phenotype.
+    """
+
+    if dist not in semantic_caches:
+        semantic_caches[dist] = SemanticCache(params['SEMANTIC_CACHE_SIZE'])
+
+    return semantic_caches[dist].evaluate(phenotype, namespace, x)
+
+
+def clear_semantic_cache(dist):
+    """
+    Discards the cached outputs of a distribution of the data, e.g. once the
+    data have changed.
+
+    :param dist: The distribution of the data, i.e. "training" or "test".
+    :return: Nothing.
+    """
+
+    semantic_caches.pop(dist, None)
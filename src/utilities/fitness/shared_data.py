@@ -0,0 +1,119 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared memory blocks created by this process, which must be unlinked once
+# they are no longer needed by the workers of the multicore pool.
+created_blocks = []
+
+# Shared memory blocks attached to by this process, or created by it and
+# since unlinked. References are kept so that blocks stay mapped for as long
+# as arrays may be viewing them.
+mapped_blocks = []
+
+
+def share_array(array):
+    """
+    Copies a numpy array into a new shared memory block, so that the workers
+    of the multicore pool can view the array without holding their own copy
+    of it.
+
+    :param array: A numpy array.
+    :return: A numpy array viewing the shared memory block, and a descriptor
+    of the shared array with which other processes can attach to it.
+    """
+
+    # Shared memory blocks cannot be empty.
+    block = shared_memory.SharedMemory(create=True,
+                                       size=max(array.nbytes, 1))
+    created_blocks.append(block)
+
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    view[...] = array
+
+    return view, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """
+    Attaches to a shared array created by another process with share_array.
+    No data is copied.
+
+    :param descriptor: A descriptor of a shared array, from share_array.
+    :return: A numpy array viewing the shared memory block.
+    """
+
+    name, shape, dtype = descriptor
+
+    try:
+        # Blocks created by another process must not be unlinked when this
+        # process exits.
+        block = shared_memory.SharedMemory(name=name, track=False)
+
+    except TypeError:
+        # Python < 3.13 does not support the track argument.
+        block = shared_memory.SharedMemory(name=name)
+
+    mapped_blocks.append(block)
+
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def share_arrays(obj, attrs):
+    """
+    Moves numpy array attributes of an object into shared memory. Attributes
+    which are not numpy arrays (e.g. missing test data) or which do not exist
+    are left unchanged.
+
+    If shared memory cannot be allocated, the arrays are left in private
+    memory and a warning is printed.
+
+    :param obj: An object, e.g. a fitness function.
+    :param attrs: A list of the names of attributes to be shared.
+    :return: A dict of descriptors of the shared arrays, keyed by attribute
+    name, with which other processes can attach to the arrays.
+    """
+
+    descriptors = {}
+
+    for attr in attrs:
+        array = getattr(obj, attr, None)
+
+        if not isinstance(array, np.ndarray) or array.dtype.hasobject:
+            # Only arrays of plain data can be placed in shared memory.
+            continue
+
+        try:
+            view, descriptors[attr] = share_array(array)
+
+        except OSError as err:
+            print("Warning: Could not place dataset in shared memory, "
+                  "each worker will hold its own copy.\n", err)
+            break
+
+        setattr(obj, attr, view)
+
+    return descriptors
+
+
+def release_shared_data():
+    """
+    Unlinks all shared memory blocks created by this process. This should be
+    done once the multicore pool is closed. Arrays already viewing the
+    blocks in this process remain valid, and the memory is freed once they
+    are no longer used.
+
+    :return: Nothing.
+    """
+
+    while created_blocks:
+        block = created_blocks.pop()
+
+        try:
+            block.unlink()
+
+        except FileNotFoundError:
+            # The block has already been unlinked.
+            pass
+
+        mapped_blocks.append(block)
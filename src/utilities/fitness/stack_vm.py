@@ -0,0 +1,299 @@
+import ast
+from collections import OrderedDict
+
+import numpy as np
+
+from algorithm.parameters import params
+from utilities.fitness import math_functions
+from utilities.fitness.math_functions import aq_out, pdiv_out, plog_out, \
+    psqrt_out, rlog_out
+
+# Opcodes of the instructions of programs. Each instruction is an (opcode,
+# argument) tuple. Only LOAD (the index of a variable) and CONST (the value
+# of a constant) use their argument.
+LOAD, CONST, ADD, SUB, MUL, DIV, NEG, PDIV, PSQRT, PLOG, RLOG, AQ, SIN, \
+    COS, TANH, EXP = range(16)
+
+# Opcodes of binary operators, keyed by Python operator.
+OPERATORS = {ast.Add: ADD, ast.Sub: SUB, ast.Mult: MUL, ast.Div: DIV}
+
+# Opcodes and numbers of arguments of functions, keyed by the source of the
+# function in phenotypes, with the function which the source must refer to.
+FUNCTIONS = {"pdiv": (PDIV, 2, math_functions.pdiv),
+             "psqrt": (PSQRT, 1, math_functions.psqrt),
+             "plog": (PLOG, 1, math_functions.plog),
+             "rlog": (RLOG, 1, math_functions.rlog),
+             "aq": (AQ, 2, math_functions.aq),
+             "np.sin": (SIN, 1, np.sin),
+             "np.cos": (COS, 1, np.cos),
+             "np.tanh": (TANH, 1, np.tanh),
+             "np.exp": (EXP, 1, np.exp)}
+
+# Ufuncs which compute the instructions of binary operators and functions
+# of one argument.
+BINARY_UFUNCS = {ADD: np.add, SUB: np.subtract, MUL: np.multiply,
+                 DIV: np.true_divide}
+UNARY_UFUNCS = {NEG: np.negative, SIN: np.sin, COS: np.cos, TANH: np.tanh,
+                EXP: np.exp}
+
+# Compiled programs in least- to most-recently-used order, keyed by
+# phenotype. Phenotypes which cannot be compiled are cached as None.
+programs = OrderedDict()
+
+# Register buffers of the stack, keyed by the number of rows of the data.
+# Buffers are reused by every program run on data with the same number of
+# rows. Each process (e.g. each worker of the multicore pool) holds its own
+# buffers.
+registers = {}
+
+
+class UnsupportedExpression(Exception):
+    """
+    Raised when a phenotype cannot be compiled to a program.
+    """
+
+    pass
+
+
+def compile_program(phenotype, namespace):
+    """
+    Compiles a phenotype to a program for the stack machine: a postfix
+    sequence of instructions. Variables (i.e. x[:, i]) are loaded from the
+    data, and subexpressions which do not refer to the data are evaluated
+    once when compiling, exactly as eval would evaluate them. Phenotypes
+    which use anything other than the operators in OPERATORS, unary minus,
+    and the functions in FUNCTIONS cannot be compiled.
+
+    Up to params['CODE_CACHE_SIZE'] programs are cached.
+
+    :param phenotype: The phenotype of an individual.
+    :param namespace: The global names used by the phenotype, e.g. the
+    globals of the fitness function module.
+    :return: A (program, stack depth) tuple, or None if the phenotype
+    cannot be compiled.
+    """
+
+    if phenotype in programs:
+        programs.move_to_end(phenotype)
+        return programs[phenotype]
+
+    try:
+        program = []
+        depth = lower(ast.parse(phenotype, mode="eval").body, namespace,
+                      program, 0)
+        compiled = (tuple(program), depth)
+
+    except (SyntaxError, UnsupportedExpression):
+        # Phenotypes which cannot be compiled are evaluated with eval.
+        compiled = None
+
+    if params['CODE_CACHE_SIZE']:
+        programs[phenotype] = compiled
+
+        while len(programs) > params['CODE_CACHE_SIZE']:
+            # Evict the least recently used program.
+            programs.popitem(last=False)
+
+    return compiled
+
+
+def lower(node, namespace, program, slot):
+    """
+    Appends the instructions which compute an expression to a program. The
+    output of the expression is left in the given slot of the stack.
+
+    :param node: An expression of a Python abstract syntax tree.
+    :param namespace: The global names used by the phenotype.
+    :param program: The list of instructions of the program.
+    :param slot: The slot of the stack in which the output is left.
+    :return: The number of slots of the stack used by the instructions.
+    """
+
+    if not any([isinstance(n, ast.Name) and n.id == "x" for n in
+                ast.walk(node)]):
+        # Evaluate subexpressions which do not refer to the data now.
+        try:
+            value = eval(compile(ast.Expression(node), "<string>", "eval"),
+                         namespace)
+
+        except Exception:
+            # Errors are raised again when the phenotype is evaluated.
+            raise UnsupportedExpression()
+
+        if not isinstance(value, (int, float, np.floating)):
+            raise UnsupportedExpression()
+
+        program.append((CONST, value))
+        return slot + 1
+
+    if isinstance(node, ast.Subscript):
+        # Only x[:, i] loads are supported.
+        index = node.slice
+
+        if isinstance(node.value, ast.Name) and node.value.id == "x" and \
+                isinstance(index, ast.Tuple) and len(index.elts) == 2 and \
+                isinstance(index.elts[0], ast.Slice) and \
+                index.elts[0].lower is index.elts[0].upper is \
+                index.elts[0].step is None and \
+                isinstance(index.elts[1], ast.Constant) and \
+                type(index.elts[1].value) is int:
+            program.append((LOAD, index.elts[1].value))
+            return slot + 1
+
+    elif isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        depth = max(lower(node.left, namespace, program, slot),
+                    lower(node.right, namespace, program, slot + 1))
+        program.append((OPERATORS[type(node.op)], None))
+        return depth
+
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        depth = lower(node.operand, namespace, program, slot)
+        program.append((NEG, None))
+        return depth
+
+    elif isinstance(node, ast.Call) and not node.keywords:
+        name = ast.unparse(node.func)
+
+        if name in FUNCTIONS:
+            opcode, arity, function = FUNCTIONS[name]
+
+            try:
+                # The source must refer to the expected function.
+                found = eval(name, namespace) is function
+
+            except Exception:
+                found = False
+
+            if len(node.args) == arity and found:
+                depth = max([lower(arg, namespace, program, slot + i) for
+                             i, arg in enumerate(node.args)])
+                program.append((opcode, None))
+
+                # Functions of two arguments use both slots as buffers.
+                return max(depth, slot + arity)
+
+    raise UnsupportedExpression()
+
+
+def get_registers(rows, depth):
+    """
+    Returns the register buffers of the stack for data with a given number
+    of rows, allocating more buffers if needed.
+
+    :param rows: The number of rows of the data.
+    :param depth: The number of slots of the stack.
+    :return: A list of float buffers, one for each slot of the stack, and a
+    boolean buffer.
+    """
+
+    if rows not in registers:
+        registers[rows] = ([], np.empty(rows, dtype=bool))
+
+    buffers, mask = registers[rows]
+
+    while len(buffers) < depth:
+        buffers.append(np.empty(rows))
+
+    return buffers, mask
+
+
+def run_program(compiled, x, copy=True):
+    """
+    Runs a program on the stack machine. Every instruction writes its output
+    into the register buffer of its slot of the stack, so that no temporary
+    arrays are allocated. Protected operators are computed by the variants
+    of utilities.fitness.math_functions which write into buffers (e.g.
+    pdiv_out). The output is exactly the output of evaluating the phenotype
+    with eval, including the runtime errors raised.
+
+    :param compiled: A (program, stack depth) tuple from compile_program.
+    :param x: The inputs of the dataset, a 2D float array.
+    :param copy: Whether outputs left in a register buffer are copied. If
+    False, the output is only valid until the next program is run.
+    :return: The output of the program.
+    """
+
+    program, depth = compiled
+    buffers, mask = get_registers(len(x), depth)
+    stack = []
+
+    for opcode, argument in program:
+        if opcode == LOAD:
+            stack.append(x[:, argument])
+
+        elif opcode == CONST:
+            stack.append(argument)
+
+        elif opcode in UNARY_UFUNCS:
+            out = buffers[len(stack) - 1]
+            stack[-1] = UNARY_UFUNCS[opcode](stack[-1], out=out)
+
+        elif opcode == PSQRT:
+            stack[-1] = psqrt_out(stack[-1], buffers[len(stack) - 1])
+
+        elif opcode == PLOG:
+            stack[-1] = plog_out(stack[-1], buffers[len(stack) - 1])
+
+        elif opcode == RLOG:
+            stack[-1] = rlog_out(stack[-1], buffers[len(stack) - 1], mask)
+
+        else:
+            b = stack.pop()
+            a, out = stack[-1], buffers[len(stack) - 1]
+
+            if opcode in BINARY_UFUNCS:
+                stack[-1] = BINARY_UFUNCS[opcode](a, b, out=out)
+
+            elif opcode == PDIV:
+                stack[-1] = pdiv_out(a, b, out, mask)
+
+            else:
+                # The slot of b is free to be used as a buffer.
+                stack[-1] = aq_out(a, b, out, buffers[len(stack)])
+
+    output = stack[0]
+
+    if copy and any([output is buffer for buffer in buffers]):
+        # Register buffers are reused by the next program.
+        output = output.copy()
+
+    return output
+
+
+def run_program_error(compiled, x, y, metric, block_size):
+    """
+    Runs a program on the stack machine in blocks of rows, and computes the
+    error of its output block by block, so that the buffers of each block
+    stay in cache rather than streaming full-length arrays through memory.
+    The errors of the rows of each block are written into a spare register
+    buffer and summed (see the errors and from_errors attributes of the
+    error metrics in utilities.fitness.error_metric).
+
+    As the errors are summed block by block, the error may differ from the
+    error of the full output in the last few bits. As when the error of the
+    full output is computed, a sum which overflows raises a
+    FloatingPointError.
+
+    :param compiled: A (program, stack depth) tuple from compile_program.
+    :param x: The inputs of the dataset, a 2D float array.
+    :param y: The expected outputs of the dataset.
+    :param metric: An error metric with errors and from_errors attributes.
+    :param block_size: The number of rows in each block.
+    :return: The error of the output of the program.
+    """
+
+    n, depth, total = len(y), compiled[1], np.float64(0)
+
+    for start in range(0, n, block_size):
+        xb, yb = x[start:start + block_size], y[start:start + block_size]
+
+        yhat = run_program(compiled, xb, copy=False)
+
+        # The spare buffer after the slots of the stack holds the errors.
+        errors = get_registers(len(yb), depth + 1)[0][depth]
+        errors = metric.errors(yb, yhat, out=errors)
+
+        with np.errstate(over="raise"):
+            total += np.sum(errors)
+
+    return metric.from_errors(total / n, n)
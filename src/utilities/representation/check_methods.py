@@ -11,7 +11,7 @@ def check_ind(ind, check):
     :return: False if everything is ok, True if there is an issue.
     """
 
-    if ind.genome == []:
+    if not len(ind.genome):
         # Ensure all individuals at least have a genome.
         return True
 
@@ -47,9 +47,12 @@ def check_genome_mapping(ind):
     # Re-map individual using fast genome mapper to check everything is ok
     new_ind = individual.Individual(ind.genome, None)
 
-    # Get attributes of both individuals.
-    attributes_0 = vars(ind)
-    attributes_1 = vars(new_ind)
+    # Get attributes of both individuals. Individuals have no __dict__, so
+    # collect all attributes which have been set.
+    attributes_0 = {a: getattr(ind, a) for a in ind.__slots__ if
+                    hasattr(ind, a)}
+    attributes_1 = {a: getattr(new_ind, a) for a in new_ind.__slots__ if
+                    hasattr(new_ind, a)}
 
     if params['GENOME_OPERATIONS']:
         # If this parameter is set then the new individual will have no tree.
@@ -0,0 +1,99 @@
+import pickle
+from hashlib import sha256
+from os import getpid, makedirs, path, remove, replace
+
+from algorithm.parameters import params
+from representation import grammar
+
+# Version of the cache file format. Must be increased whenever the analysis
+# performed by representation.grammar.Grammar or the structure of the
+# Grammar class changes, so that stale cache files are not loaded.
+CACHE_VERSION = 2
+
+
+def get_cache_key(file_name, content):
+    """
+    Returns the key of the cache file of a grammar. The key is a hash of
+    the contents of the grammar file and of all parameters which affect the
+    analysis of the grammar.
+
+    :param file_name: The location of a BNF grammar file.
+    :param content: The contents of the grammar file.
+    :return: The key of the cache file of the grammar.
+    """
+
+    settings = [CACHE_VERSION, file_name.endswith("pybnf"),
+                params['CODON_SIZE'], params['PERMUTATION_RAMPS'],
+                params['MIN_INIT_TREE_DEPTH']]
+
+    if not params['MIN_INIT_TREE_DEPTH'] and \
+            hasattr(params['INITIALISATION'], "ramping"):
+        # The minimum ramping depth is found from the grammar, and depends
+        # on the size of the population and the depth of ramping.
+        settings.extend([params['MAX_INIT_TREE_DEPTH'],
+                         params['POPULATION_SIZE']])
+
+    # Concatenation NTs are only found for reverse mapping.
+    settings.append(bool(params['REVERSE_MAPPING_TARGET'] or
+                         params['TARGET_SEED_FOLDER']))
+
+    if "GE_RANGE:dataset" in content:
+        # The grammar contains productions which depend on the dataset.
+        settings.extend([getattr(params['FITNESS_FUNCTION'], attr, None)
+                         for attr in ["n_vars", "n_is", "n_os"]])
+
+    key = sha256(content.encode())
+    key.update(repr(settings).encode())
+
+    return key.hexdigest()
+
+
+def load_grammar(file_name):
+    """
+    Returns the fully analysed grammar of a BNF grammar file. If the grammar
+    has been analysed before with the same settings, it is loaded from the
+    grammar cache directory. Otherwise the grammar is analysed and saved to
+    the cache directory for later runs.
+
+    :param file_name: The location of a BNF grammar file.
+    :return: An instance of the representation.grammar.Grammar class.
+    """
+
+    with open(file_name, 'r') as bnf:
+        # Read the whole grammar file.
+        content = bnf.read()
+
+    cache_file = path.join(params['GRAMMAR_CACHE_DIR'],
+                           get_cache_key(file_name, content) + ".grammar")
+
+    if path.isfile(cache_file):
+        try:
+            # Load the analysed grammar.
+            with open(cache_file, "rb") as cache:
+                return pickle.load(cache)
+
+        except Exception:
+            # The cache file is unreadable, analyse the grammar again.
+            pass
+
+    bnf_grammar = grammar.Grammar(file_name)
+
+    # Write to a temporary file first so that concurrent runs never load a
+    # partially written cache file.
+    temp_file = cache_file + "." + str(getpid())
+
+    try:
+        makedirs(params['GRAMMAR_CACHE_DIR'], exist_ok=True)
+
+        with open(temp_file, "wb") as cache:
+            pickle.dump(bnf_grammar, cache)
+
+        replace(temp_file, cache_file)
+
+    except OSError:
+        # The cache directory is not writable, the grammar is simply not
+        # cached.
+        if path.isfile(temp_file):
+            remove(temp_file)
+
+    return bnf_grammar
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+
+
+class MappingCache(object):
+    """
+    A bounded cache of genome mappings with least-recently-used eviction.
+
+    Two genomes which make the same production choices for every codon
+    they use always map to the same individual, regardless of the values of
+    the codons themselves or of any unused tail. The cache is therefore
+    keyed on the effective genome: the used codons, each reduced modulo the
+    number of production choices of the rule it was used for.
+
+    Since the rule used by each codon is only known by mapping, the keys are
+    stored in a trie. Each node of the trie holds the number of production
+    choices available to the next codon, so a genome can be looked up by
+    reducing and following one codon at a time without being mapped. Each
+    leaf node holds the key of a fully mapped genome.
+
+    Only valid individuals which did not need to wrap are cached.
+    """
+
+    def __init__(self, size):
+        """
+        Initialise an empty mapping cache.
+
+        :param size: The maximum number of mappings stored in the cache.
+        """
+
+        self.size = size
+
+        # Counters for cache hits and misses.
+        self.hits, self.misses = 0, 0
+
+        # The root node of the trie. Nodes are lists of [number of choices
+        # for the next codon, dict of child nodes]. Leaf nodes are lists of
+        # [None, key].
+        self.root = None
+
+        # Dict of cached mappings in least- to most-recently-used order.
+        self.entries = OrderedDict()
+
+    def __getstate__(self):
+        """
+        Cached mappings are not saved with the state of a run, only the
+        size of the cache and its counters.
+
+        :return: A picklable state for the cache.
+        """
+
+        return {"size": self.size, "hits": self.hits, "misses": self.misses}
+
+    def __setstate__(self, state):
+        """
+        Restore an empty cache from a saved state.
+
+        :param state: A saved state for the cache.
+        :return: Nothing.
+        """
+
+        self.__init__(state['size'])
+        self.hits, self.misses = state['hits'], state['misses']
+
+    def lookup(self, genome):
+        """
+        Look up the mapping of a genome.
+
+        :param genome: A genome to be mapped.
+        :return: The cached mapping of the genome, or None if the genome
+        is not in the cache.
+        """
+
+        node, used_codons = self.root, 0
+
+        while node is not None:
+            no_choices, children = node
+
+            if no_choices is None:
+                # A leaf node, the genome has been fully mapped. The
+                # children of a leaf node are its key.
+                self.hits += 1
+                self.entries.move_to_end(children)
+                return self.entries[children]
+
+            if used_codons == len(genome):
+                # The genome would need to wrap.
+                break
+
+            # Follow the production choice made by the next codon.
+            node = children.get(genome[used_codons] % no_choices)
+            used_codons += 1
+
+        self.misses += 1
+        return None
+
+    def insert(self, genome, trace, mapping):
+        """
+        Add the mapping of a genome to the cache, evicting the least
+        recently used mapping if the cache is full.
+
+        :param genome: A mapped genome.
+        :param trace: The number of production choices available to each
+        used codon of the genome, from
+        algorithm.mapper.map_ind_from_genome.
+        :param mapping: The mapping to be cached.
+        :return: Nothing.
+        """
+
+        # The effective genome is the used codons reduced modulo their
+        # number of choices.
+        key = tuple([codon % no_choices for codon, no_choices in
+                     zip(genome, trace)])
+
+        if key in self.entries:
+            # The mapping is already cached.
+            self.entries.move_to_end(key)
+            return
+
+        if self.root is None:
+            self.root = [trace[0], {}]
+
+        node = self.root
+
+        for i, choice in enumerate(key):
+            # Walk down the trie, adding nodes as necessary.
+            children = node[1]
+
+            if choice not in children:
+                if i + 1 < len(key):
+                    children[choice] = [trace[i + 1], {}]
+
+                else:
+                    children[choice] = [None, key]
+
+            node = children[choice]
+
+        self.entries[key] = mapping
+
+        if len(self.entries) > self.size:
+            # Evict the least recently used mapping.
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key):
+        """
+        Remove a mapping from the cache, along with any nodes of the trie
+        which no longer lead to a cached mapping.
+
+        :param key: The key of the mapping to be removed.
+        :return: Nothing.
+        """
+
+        del self.entries[key]
+
+        # Find the path from the root of the trie to the leaf node.
+        path, node = [], self.root
+
+        for choice in key:
+            path.append((node, choice))
+            node = node[1][choice]
+
+        for node, choice in reversed(path):
+            # Prune the trie from the leaf node upwards.
+            del node[1][choice]
+
+            if node[1]:
+                # This node still leads to other cached mappings.
+                break
+
+        if not self.root[1]:
+            # The cache is empty.
+            self.root = None
@@ -13,6 +13,21 @@ def clean_stats():
     if not params['CACHE']:
         stats.pop('unique_inds')
         stats.pop('unused_search')
+        stats.pop('cache_hits')
+        stats.pop('cache_misses')
+        stats.pop('cache_evictions')
+
+    if not params['MAPPING_CACHE_SIZE']:
+        stats.pop('mapping_cache_hits')
+        stats.pop('mapping_cache_misses')
+
+    if not params['FITNESS_CACHE_FILE']:
+        stats.pop('persistent_cache_hits')
+        stats.pop('persistent_cache_misses')
+
+    if not (params['MULTICORE'] or params['COORDINATOR']):
+        # Individuals are only queued for evaluation by pools of workers.
+        stats.pop('ave_eval_wait')
 
     if not params['MUTATE_DUPLICATES']:
         stats.pop('regens')
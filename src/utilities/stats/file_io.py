@@ -1,3 +1,4 @@
+from array import array
 from copy import copy
 from os import getcwd, makedirs, path
 from shutil import rmtree
@@ -50,6 +51,30 @@ def save_stats_headers(stats):
     savefile.close()
 
 
+def save_evaluation_times_to_file(times, gen):
+    """
+    Appends the time taken by each fitness evaluation in a generation to the
+    evaluation_times.tsv file. Phenotypes are saved as Python string
+    literals, as they may contain tabs and newlines.
+
+    :param times: A list of (phenotype, time taken, time spent waiting,
+    averaged) tuples.
+    :param gen: The current generation.
+    :return: Nothing.
+    """
+
+    filename = path.join(params['FILE_PATH'], "evaluation_times.tsv")
+    new_file = not path.isfile(filename)
+
+    savefile = open(filename, 'a')
+    if new_file:
+        savefile.write("gen\teval_time\twait_time\taveraged\tphenotype\n")
+    for phenotype, eval_time, wait_time, averaged in times:
+        savefile.write("%d\t%.9f\t%.9f\t%d\t%r\n" %
+                       (gen, eval_time, wait_time, averaged, phenotype))
+    savefile.close()
+
+
 def save_best_ind_to_file(stats, ind, end=False, name="best"):
     """
     Saves the best individual to a file.
@@ -66,7 +91,9 @@ def save_best_ind_to_file(stats, ind, end=False, name="best"):
     savefile = open(filename, 'w')
     savefile.write("Generation:\n" + str(stats['gen']) + "\n\n")
     savefile.write("Phenotype:\n" + str(ind.phenotype) + "\n\n")
-    savefile.write("Genotype:\n" + str(ind.genome) + "\n")
+    genome = ind.genome.tolist() if isinstance(ind.genome, array) else \
+        ind.genome
+    savefile.write("Genotype:\n" + str(genome) + "\n")
     savefile.write("Tree:\n" + str(ind.tree) + "\n")
     if hasattr(params['FITNESS_FUNCTION'], "training_test"):
         if end:
@@ -2,11 +2,44 @@
 generation, fitness plots, fitness caches, etc."""
 
 cache = {}
-# This dict stores the cache for an evolutionary run. The key for each entry
-# is the phenotype of the individual, the value is its fitness.
+# This stores the fitness cache for an evolutionary run
+# (utilities.fitness.fitness_cache.FitnessCache), set up by
+# algorithm.parameters.set_params. The cache maps the phenotype of each
+# individual to its fitness.
 
-runtime_error_cache = []
-# This list stores a list of phenotypes which produce runtime errors over an
+mapping_cache = None
+# This stores the mapping cache for an evolutionary run
+# (utilities.representation.mapping_cache.MappingCache), if
+# params['MAPPING_CACHE_SIZE'] is set.
+
+evaluation_time = None
+# This stores the average time taken per fitness evaluation by the workers of
+# the multicore pool, used to choose the number of evaluations sent to a
+# worker at once (see fitness.evaluation.evaluate_chunks).
+
+evaluation_times = []
+# evaluation_times stores a (phenotype, time taken, time spent waiting for a
+# worker, averaged) tuple for each fitness evaluation since statistics were
+# last generated, where averaged is whether the time taken is the average
+# time taken per evaluation of a batch (see fitness.evaluation.record_time).
+
+slowest_evaluations = []
+# slowest_evaluations stores the (phenotype, time taken, time spent waiting,
+# averaged) tuples of the slowest evaluations in the last generation whose
+# time taken is known.
+
+persistent_cache = None
+# This stores the persistent fitness cache shared between runs
+# (utilities.fitness.persistent_cache.PersistentCache), if
+# params['FITNESS_CACHE_FILE'] is set.
+
+coordinator = None
+# This stores the coordinator of remote fitness evaluation workers
+# (utilities.fitness.remote_evaluation.Coordinator), if params['COORDINATOR']
+# is set.
+
+runtime_errors = 0
+# This counts the number of evaluations which produce runtime errors over an
 # evolutionary run.
 
 best_fitness_list = []